@@ -0,0 +1,107 @@
+import threading
+
+from labels import write_labels_atomic
+from profiling import span
+
+
+class AnnotationWriter:
+    """Write-behind persistence of label files.
+
+    save() only records the latest contents of a file, so many edits of the same
+    image between two flushes end up as a single write. A background thread
+    writes the queued files every `delay` seconds or when flush_async() is called,
+    each one through a temporary file that is atomically renamed over the label.
+    """
+
+    def __init__(self, delay=1.0):
+        self.delay = delay
+        self._pending = {}  # path -> contents waiting to be written
+        self._in_flight = {}  # path -> contents being written right now
+        self._errors = []
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="annotation-writer", daemon=True)
+        self._thread.start()
+
+    def save(self, path, contents):
+        with self._lock:
+            self._pending[path] = contents
+
+    def pending(self, path):
+        """Contents of a file that are not on disk yet, or None"""
+        with self._lock:
+            if path in self._pending:
+                return self._pending[path]
+            return self._in_flight.get(path)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending.keys() | self._in_flight.keys())
+
+    def discard(self, path):
+        """Drop queued contents of a file, e.g. before it is deleted"""
+        with self._lock:
+            self._pending.pop(path, None)
+            self._in_flight.pop(path, None)
+        # Wait for a write of this file that may already be running
+        with self._io_lock:
+            pass
+
+    def flush_async(self):
+        """Ask the background thread to write everything now"""
+        self._wake.set()
+
+    def flush(self, path=None):
+        """Write the queued contents of path (or all files) on the calling thread"""
+        # Taking and writing under one lock, so a file is never written by both threads
+        with self._io_lock:
+            self._write(self._take(path))
+
+    def take_errors(self):
+        """Return and forget the (path, exception) pairs of failed writes"""
+        with self._lock:
+            errors, self._errors = self._errors, []
+        return errors
+
+    def close(self):
+        """Stop the background thread and write everything that is still queued"""
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.delay)
+            self._wake.clear()
+            self.flush()
+
+    def _take(self, path=None):
+        with self._lock:
+            if path is None:
+                batch, self._pending = self._pending, {}
+            elif path in self._pending:
+                batch = {path: self._pending.pop(path)}
+            else:
+                batch = {}
+            self._in_flight.update(batch)
+        return batch
+
+    def _write(self, batch):
+        for path, contents in batch.items():
+            with self._lock:
+                # Skip files discarded since they were taken
+                if self._in_flight.get(path) is not contents:
+                    continue
+            try:
+                with span("save.write"):
+                    write_labels_atomic(path, contents)
+            except OSError as e:
+                with self._lock:
+                    self._errors.append((path, e))
+            finally:
+                with self._lock:
+                    if self._in_flight.get(path) is contents:
+                        del self._in_flight[path]
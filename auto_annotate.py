@@ -0,0 +1,77 @@
+import numpy as np
+
+from geometry import simplify_polyline
+
+
+def result_to_arrays(result, conf_threshold=None, num_classes=None):
+    """Extract the picklable parts of an ultralytics segmentation result.
+
+    When conf_threshold/num_classes are given, the boxes are filtered first so
+    that mask contours are only computed for the masks that are kept.
+    Returns (contours, class_ids, confidences, orig_shape), or None when the
+    model doesn't output segmentation masks.
+    """
+    if not result.masks:
+        return None
+
+    class_ids = result.boxes.cls.cpu().numpy().astype(np.int64)
+    confidences = result.boxes.conf.cpu().numpy().astype(np.float32)
+
+    keep = np.ones(len(class_ids), dtype=bool)
+    if conf_threshold is not None:
+        keep &= confidences >= conf_threshold
+    if num_classes is not None:
+        keep &= class_ids < num_classes
+
+    if not keep.all():
+        result = result[np.flatnonzero(keep)]
+        class_ids = class_ids[keep]
+        confidences = confidences[keep]
+
+    contours = [np.asarray(xy, dtype=np.float32) for xy in result.masks.xy] if len(class_ids) else []
+    return contours, class_ids, confidences, tuple(result.orig_shape)
+
+
+def clamp_contours(contours, img_width, img_height):
+    """Clamp contours to the image, all masks in one array operation"""
+    if not contours:
+        return []
+
+    lengths = [len(contour) for contour in contours]
+    points = np.concatenate(contours).astype(np.float32, copy=False).reshape(-1, 2)
+    points = np.clip(points, 0, np.array([img_width - 1, img_height - 1], dtype=np.float32))
+    return np.split(points, np.cumsum(lengths)[:-1])
+
+
+def masks_to_polygons(contours, class_ids, confidences, orig_shape, conf_threshold, num_classes,
+                      tolerance=1.0, max_vertices=None):
+    """Turn mask contours into closed, simplified polygons in normalized coordinates.
+
+    Contours are simplified in pixels with the given tolerance and optional vertex budget.
+    Returns a list of (class_id, points) for masks above conf_threshold with a known class.
+    """
+    img_height, img_width = orig_shape[:2]
+    class_ids = np.asarray(class_ids)
+    confidences = np.asarray(confidences)
+
+    # Filter on the arrays before any per-mask work
+    keep = np.flatnonzero((confidences >= conf_threshold) & (class_ids < num_classes))
+    kept_contours = clamp_contours([contours[i] for i in keep], img_width, img_height)
+
+    simplified = [simplify_polyline(contour, tolerance, max_vertices, closed=True) for contour in kept_contours]
+    kept_ids = [class_id for class_id, points in zip(class_ids[keep].tolist(), simplified) if len(points) >= 3]
+    simplified = [points for points in simplified if len(points) >= 3]
+    if not simplified:
+        return []
+
+    # Normalize all polygons at once and close each ring by repeating its first point
+    lengths = np.array([len(points) for points in simplified])
+    normalized = np.concatenate(simplified) / np.array([img_width, img_height], dtype=np.float64)
+    np.clip(normalized, 0.0, 1.0, out=normalized)
+
+    polygons = []
+    for class_id, points in zip(kept_ids, np.split(normalized, np.cumsum(lengths)[:-1])):
+        polygon = points.tolist()
+        polygon.append(polygon[0])
+        polygons.append((class_id, [tuple(point) for point in polygon]))
+    return polygons
@@ -0,0 +1,195 @@
+import io
+import math
+import struct
+import zlib
+
+from PIL import Image
+
+# Rows of one band are chosen so a band holds about this many pixels
+BAND_PIXELS = 1_000_000
+# Compressed PNG data is read in blocks of this many bytes
+READ_BLOCK = 1 << 20
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+# Raw modes PIL packs back to exactly the bytes it unpacked, needed to seed the PNG filter of the next band
+PNG_LOSSLESS_RAWMODES = {'1', 'L', 'LA', 'RGB', 'RGBA', 'P', 'P;1', 'P;2', 'P;4', 'I;16B'}
+
+
+def reduce_factor(size, target):
+    """Largest integer factor that reduces size to no less than target in both dimensions"""
+    factor = None
+    for side, wanted in zip(size, target):
+        limit = side if wanted <= 1 else math.ceil(side / (wanted - 1)) - 1
+        factor = limit if factor is None else min(factor, limit)
+    return max(1, factor)
+
+
+def decode_reduced(img, factor, band_pixels=BAND_PIXELS):
+    """Decode an opened image reduced by an integer factor without holding it at full resolution.
+
+    The image is decoded in horizontal bands of whole multiples of factor rows
+    and each band is reduced before the next one is read, so memory stays at
+    one band plus the result. Uncompressed formats (BMP, PPM, raw TIFF strips
+    and tiles) are read band by band by limiting img.tile to the rows in range,
+    non-interlaced PNGs by re-encoding each band's rows as a small PNG of their
+    own. Returns None for formats that can only be decoded whole.
+    """
+    width, height = img.size
+    rows = max(factor, band_pixels // max(1, width) // factor * factor)
+    if img.format == 'PNG':
+        bands = _png_bands(img, rows)
+    else:
+        bands = _tile_bands(img, rows)
+    if bands is None:
+        return None
+
+    result = None
+    for top, band in bands:
+        if band.mode not in ('RGB', 'RGBA', 'L'):
+            band = band.convert('RGBA' if 'transparency' in band.info or 'A' in band.mode else 'RGB')
+        reduced = band.reduce(factor) if factor > 1 else band
+        if result is None:
+            result = Image.new(reduced.mode, (math.ceil(width / factor), math.ceil(height / factor)))
+        result.paste(reduced, (0, top // factor))
+    return result
+
+
+def _tile_bands(img, rows):
+    """(top row, band image) pairs read through img.tile, or None if the tiles can't be split by rows"""
+    path = getattr(img, 'filename', None)
+    if not path or not img.tile or any(tile[0] != 'raw' for tile in img.tile):
+        return None
+    width, height = img.size
+
+    tiles = list(img.tile)
+    if len(tiles) == 1:
+        tiles = _split_raw_tile(img, tiles[0], rows)
+        if tiles is None:
+            return None
+
+    def generate():
+        for top in range(0, height, rows):
+            bottom = min(height, top + rows)
+            selected = [tile for tile in tiles if tile[1][1] < bottom and tile[1][3] > top]
+            first = min(tile[1][1] for tile in selected)
+            last = max(tile[1][3] for tile in selected)
+            with Image.open(path) as band:
+                # Only the strips or tiles in range are read, into an image just as tall as they are
+                band._size = (width, last - first)
+                band.tile = [(name, (x0, y0 - first, x1, y1 - first), offset, args)
+                             for name, (x0, y0, x1, y1), offset, args in selected]
+                band.load()
+                yield top, band.crop((0, top - first, width, bottom - first))
+    return generate()
+
+
+def _split_raw_tile(img, tile, rows):
+    """One raw tile covering the image as one raw tile per band of rows"""
+    name, extents, offset, args = tile
+    width, height = img.size
+    if extents != (0, 0, width, height):
+        return None
+    if isinstance(args, str):
+        args = (args,)
+    rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+    if not stride:
+        try:
+            stride = len(Image.new(img.mode, (width, 1)).tobytes('raw', rawmode))
+        except (ValueError, OSError):
+            return None
+
+    tiles = []
+    for top in range(0, height, rows):
+        bottom = min(height, top + rows)
+        # Bottom-up files (BMP) store the last row first
+        first_row = top if orientation > 0 else height - bottom
+        tiles.append((name, (0, top, width, bottom), offset + first_row * stride, (rawmode, stride, orientation)))
+    return tiles
+
+
+def _png_bands(img, rows):
+    """(top row, band image) pairs of a non-interlaced PNG, or None if it can't be decoded in bands.
+
+    IDAT data is inflated as a stream and every band of filtered rows is
+    wrapped in a PNG of its own, together with the previous band's last row
+    unfiltered, which the first row's filter refers to.
+    """
+    path = getattr(img, 'filename', None)
+    rawmode = img.tile[0][3] if img.tile else None
+    if isinstance(rawmode, tuple):
+        rawmode = rawmode[0]
+    if not path or len(img.tile) != 1 or rawmode not in PNG_LOSSLESS_RAWMODES:
+        return None
+
+    with open(path, 'rb') as f:
+        if f.read(8) != PNG_SIGNATURE:
+            return None
+        length, kind = struct.unpack(">I4s", f.read(8))
+        header = f.read(length)
+    if kind != b"IHDR":
+        return None
+    width, height, bit_depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", header)
+    if interlace or color_type not in PNG_CHANNELS:
+        return None
+    row_bytes = 1 + (width * bit_depth * PNG_CHANNELS[color_type] + 7) // 8
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    def band_png(filtered, count, seed):
+        data = filtered if seed is None else b"\x00" + seed + filtered
+        band_header = struct.pack(">IIBBBBB", width, count + (seed is not None), bit_depth, color_type, 0, 0, 0)
+        return b"".join([PNG_SIGNATURE, chunk(b"IHDR", band_header), *extras,
+                         chunk(b"IDAT", zlib.compress(data, 0)), chunk(b"IEND", b"")])
+
+    extras = []
+
+    def generate():
+        inflater = zlib.decompressobj()
+        pending = bytearray()
+        band_bytes = rows * row_bytes
+        top = 0
+        seed = None
+        with open(path, 'rb') as f:
+            f.seek(8)
+            while top < height:
+                header = f.read(8)
+                if len(header) < 8:
+                    raise OSError(f"Truncated PNG {path}")
+                length, kind = struct.unpack(">I4s", header)
+                if kind != b"IDAT":
+                    if kind in (b"PLTE", b"tRNS"):
+                        extras.append(chunk(kind, f.read(length)))
+                    elif kind == b"IEND":
+                        raise OSError(f"Truncated PNG {path}")
+                    else:
+                        f.seek(length, io.SEEK_CUR)
+                    # CRCs are not checked
+                    f.seek(4, io.SEEK_CUR)
+                    continue
+
+                # IDAT chunks may hold the whole image, they are read and inflated a band at a time
+                remaining = length
+                while remaining and top < height:
+                    data = f.read(min(remaining, READ_BLOCK))
+                    if not data:
+                        raise OSError(f"Truncated PNG {path}")
+                    remaining -= len(data)
+                    while data and top < height:
+                        pending += inflater.decompress(data, band_bytes)
+                        data = inflater.unconsumed_tail
+                        while top < height:
+                            count = min(rows, height - top)
+                            if len(pending) < count * row_bytes:
+                                break
+                            skip = int(seed is not None)
+                            filtered = bytes(pending[:count * row_bytes])
+                            with Image.open(io.BytesIO(band_png(filtered, count, seed))) as png:
+                                band = png.crop((0, skip, width, count + skip))
+                            seed = band.crop((0, count - 1, width, count)).tobytes('raw', rawmode)
+                            del pending[:count * row_bytes]
+                            yield top, band
+                            top += count
+                f.seek(remaining + 4, io.SEEK_CUR)
+    return generate()
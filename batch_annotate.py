@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from auto_annotate import result_to_arrays, masks_to_polygons
+from dataset_index import DatasetIndex
+from inference_backends import BACKENDS, ModelBackend
+from labels import label_path_for, write_labels_atomic
+from polygon_store import PolygonStore
+
+
+def mark_empty(label_path):
+    """Write an empty label file for an image without detections, so a resumed run doesn't infer it again.
+
+    Existing labels are kept, an overwrite run with no detections doesn't erase them.
+    """
+    if not os.path.exists(label_path):
+        write_labels_atomic(label_path, "")
+
+
+def write_polygons(label_path, arrays, conf_threshold, num_classes):
+    """Post-process one image in a worker process and write its label file, returns the polygon count"""
+    polygons = masks_to_polygons(*arrays, conf_threshold, num_classes)
+    if not polygons:
+        mark_empty(label_path)
+        return 0
+
+    store = PolygonStore.from_labels(polygons)
+    write_labels_atomic(label_path, store.format())
+    return len(polygons)
+
+
+def batch_annotate(folder, model_path="best.pt", conf=0.6, num_classes=None, batch=8, workers=None,
+                   overwrite=False, device=None, report_every=5.0, backend='pytorch'):
+    """Auto-annotate every image of a folder, skipping images that already have a label file"""
+    index = DatasetIndex(folder)
+    index.refresh()
+    names = index.names() if overwrite else index.names_without_labels()
+    total_images = index.counts()[0]
+    index.close()
+
+    print(f"{len(names)} of {total_images} images to annotate")
+    if not names:
+        return
+
+    model = ModelBackend(model_path, backend, device=device)
+    if num_classes is None:
+        num_classes = len(model.names)
+
+    workers = workers or os.cpu_count() or 1
+    start_time = time.perf_counter()
+    last_report = start_time
+    done = 0
+    polygons = 0
+    pending = deque()
+
+    def collect(future):
+        nonlocal done, polygons
+        polygons += future.result()
+        done += 1
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(names), batch):
+            chunk = names[start:start + batch]
+            paths = [os.path.join(folder, name) for name in chunk]
+            results = model.predict(paths, batch=batch, conf=conf, verbose=False)
+
+            for name, result in zip(chunk, results):
+                arrays = result_to_arrays(result, conf, num_classes)
+                if arrays is None:
+                    # Nothing detected on this image
+                    mark_empty(label_path_for(folder, name))
+                    done += 1
+                    continue
+                pending.append(pool.submit(write_polygons, label_path_for(folder, name), arrays, conf, num_classes))
+
+            # Post-processing runs while the next batch is inferred, but don't let it fall too far behind
+            while len(pending) > workers * 4:
+                collect(pending.popleft())
+            while pending and pending[0].done():
+                collect(pending.popleft())
+
+            now = time.perf_counter()
+            if now - last_report >= report_every:
+                last_report = now
+                print(f"{done}/{len(names)} images, {polygons} polygons, {done / (now - start_time):.1f} images/s")
+
+        while pending:
+            collect(pending.popleft())
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Annotated {done} images with {polygons} polygons in {elapsed:.1f}s "
+          f"({done / elapsed:.1f} images/s)")
+    latency = model.latency()
+    if latency is not None:
+        print(f"Inference ({backend}): mean {latency[0]:.1f} ms | p50 {latency[1]:.1f} ms | "
+              f"p95 {latency[2]:.1f} ms per image")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Auto-annotate all images of a folder with a YOLO segmentation model")
+    parser.add_argument("folder", help="Folder with images, labels are written next to them")
+    parser.add_argument("--model", default="best.pt", help="Model weights")
+    parser.add_argument("--conf", type=float, default=0.6, help="Confidence threshold")
+    parser.add_argument("--classes", help="Classes JSON exported from the app, limits the accepted class ids")
+    parser.add_argument("--batch", type=int, default=8, help="Images per inference batch")
+    parser.add_argument("--workers", type=int, default=None, help="Post-processing processes")
+    parser.add_argument("--device", default=None, help="Inference device, e.g. cpu or 0")
+    parser.add_argument("--backend", choices=BACKENDS, default='pytorch',
+                        help="Inference backend, exported models come from inference_backends.py export")
+    parser.add_argument("--overwrite", action="store_true", help="Also re-annotate images that already have labels")
+    args = parser.parse_args()
+
+    num_classes = None
+    if args.classes:
+        with open(args.classes, 'r') as f:
+            num_classes = len(json.load(f))
+
+    batch_annotate(args.folder, args.model, args.conf, num_classes, args.batch, args.workers,
+                   args.overwrite, args.device, backend=args.backend)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from auto_annotate import masks_to_polygons
+from dataset_index import INDEX_FILENAME, DatasetIndex
+from dataset_stats import distribution
+from geometry import simplify_points
+from inference_worker import infer_arrays
+from label_cache import CACHE_FILENAME, LabelCache
+from labels import read_labels, write_labels_atomic
+from polygon_store import PolygonStore
+from spatial_index import AnnotationIndex
+from synthetic_data import (generate_folder, generate_video, random_labels, random_predictions,
+                            random_stroke)
+
+BASELINE_FILENAME = "benchmark_baseline.json"
+# Sizes of the generated data, quick is meant for a check before every commit
+SCALES = {
+    'quick': dict(images=300, polygons=10, vertices=40, video_frames=120, samples=50),
+    'full': dict(images=5000, polygons=20, vertices=60, video_frames=600, samples=200),
+}
+# Mirrors the app's settings so the numbers match what annotators see
+SIMPLIFY_TOLERANCE = 1.5
+SIMPLIFY_MAX_VERTICES = 200
+NUM_CLASSES = 5
+CONF_THRESHOLD = 0.25
+
+CASES = {}
+
+
+def case(name):
+    """Register a benchmark. The function gets the Workspace and returns (run, reset, items per run).
+
+    run is timed once per sample, reset (or None) runs untimed before each sample.
+    """
+    def register(function):
+        CASES[name] = function
+        return function
+    return register
+
+
+class Workspace:
+    """Generated data shared by the cases, created on first use with a fixed seed"""
+
+    def __init__(self, root, scale, seed=0):
+        self.root = root
+        self.params = SCALES[scale]
+        self.seed = seed
+        self._folder = None
+        self._video = None
+
+    def rng(self):
+        return np.random.default_rng(self.seed)
+
+    @property
+    def folder(self):
+        if self._folder is None:
+            self._folder = os.path.join(self.root, "images")
+            generate_folder(self._folder, self.params['images'], (320, 240), self.params['polygons'],
+                            self.params['vertices'], NUM_CLASSES, seed=self.seed)
+        return self._folder
+
+    @property
+    def video(self):
+        if self._video is None:
+            self._video = os.path.join(self.root, "video.mp4")
+            generate_video(self._video, self.params['video_frames'], seed=self.seed)
+        return self._video
+
+    def label_paths(self):
+        return sorted(os.path.join(self.folder, name) for name in os.listdir(self.folder) if name.endswith(".txt"))
+
+
+class StubArray:
+    """Stands in for a torch tensor, only what result_to_arrays calls"""
+
+    def __init__(self, array):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class StubResult:
+    """Segmentation result shaped like an ultralytics Results object, built from synthetic predictions"""
+
+    def __init__(self, contours, class_ids, confidences, orig_shape):
+        self.contours = contours
+        self.orig_shape = orig_shape
+        self.boxes = type('Boxes', (), {'cls': StubArray(class_ids.astype(np.float32)),
+                                        'conf': StubArray(confidences)})()
+        self.masks = type('Masks', (), {'xy': contours, '__len__': lambda masks: len(contours)})()
+
+    def __getitem__(self, indices):
+        return StubResult([self.contours[i] for i in indices], self.boxes.cls.array[indices],
+                          self.boxes.conf.array[indices], self.orig_shape)
+
+
+class StubModel:
+    """Returns the same predictions for every input, so post-processing is measured without a network"""
+
+    weights_hash = "stub"
+
+    def __init__(self, predictions):
+        self.result = StubResult(*predictions)
+
+    def __call__(self, source, **kwargs):
+        return [self.result]
+
+
+@case("load_annotations.read")
+def bench_read_labels(workspace):
+    """Parse a label file and build the polygon store, as when an image is opened without a label cache"""
+    paths = itertools.cycle(workspace.label_paths())
+    return lambda: PolygonStore.from_labels(read_labels(next(paths))), None, 1
+
+
+@case("load_annotations.cache")
+def bench_cached_labels(workspace):
+    """Polygons of an image from a synced label cache"""
+    cache = LabelCache(workspace.folder)
+    cache.sync(workers=1)
+    entries = itertools.cycle([(name, tuple(stamp)) for name, stamp in zip(cache.names, cache.stamps.tolist())])
+
+    def run():
+        name, stamp = next(entries)
+        return PolygonStore.from_labels(cache.fresh_labels(name, stamp))
+    return run, None, 1
+
+
+@case("save_annotations")
+def bench_save(workspace):
+    """Format an image's polygons and write the label file atomically, what the background writer does"""
+    rng = workspace.rng()
+    store = PolygonStore.from_labels(random_labels(rng, workspace.params['polygons'], workspace.params['vertices'],
+                                                   NUM_CLASSES))
+    path = os.path.join(workspace.root, "save_target.txt")
+    return lambda: write_labels_atomic(path, store.format()), None, 1
+
+
+@case("simplify_points")
+def bench_simplify(workspace):
+    """Simplify a freehand stroke of 1000 mouse positions like the solid line tool does"""
+    image_size = (1920, 1080)
+    stroke = random_stroke(workspace.rng(), 1000, image_size)
+    return lambda: simplify_points(stroke, SIMPLIFY_TOLERANCE, image_size, SIMPLIFY_MAX_VERTICES), None, 1
+
+
+@case("edge_insertion")
+def bench_edge_insertion(workspace):
+    """Find the nearest edge of a polygon and insert a vertex on it, as on a double click"""
+    rng = workspace.rng()
+    store = PolygonStore.from_labels(random_labels(rng, 50, workspace.params['vertices'], NUM_CLASSES))
+    index = AnnotationIndex()
+    index.rebuild(store)
+    scale = (1280.0, 720.0)
+    ann_ids = store.keys()
+    # Clicks close to a random vertex of a random polygon
+    clicks = []
+    for _ in range(256):
+        ann_id = ann_ids[int(rng.integers(len(ann_ids)))]
+        points = index.points[ann_id]
+        x, y = points[int(rng.integers(len(points)))] + rng.normal(0, 0.002, size=2)
+        clicks.append((ann_id, float(x), float(y)))
+    clicks = itertools.cycle(clicks)
+
+    def run():
+        ann_id, x, y = next(clicks)
+        edge = index.nearest_edge(x, y, 10, scale, ann_ids={ann_id})
+        if edge is not None:
+            _, closest_edge, _, new_point = edge
+            store.insert_point(ann_id, closest_edge + 1, new_point)
+            index.update(ann_id, store.points(ann_id))
+    return run, None, 1
+
+
+@case("auto_annotate.postprocess")
+def bench_postprocess(workspace):
+    """Turn the masks of a stubbed model into simplified polygons, everything auto-annotation does after the model"""
+    model = StubModel(random_predictions(workspace.rng(), masks=20, contour_points=400, num_classes=NUM_CLASSES))
+
+    def run():
+        arrays = infer_arrays(model, None)
+        return PolygonStore.from_labels(masks_to_polygons(*arrays, CONF_THRESHOLD, NUM_CLASSES))
+    return run, None, 1
+
+
+def remove_folder_caches(folder):
+    for name in (INDEX_FILENAME, CACHE_FILENAME):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(folder, name))
+
+
+def open_folder(folder):
+    """The file work of load_images for a folder: index refresh, image list and label cache"""
+    index = DatasetIndex(folder)
+    index.refresh()
+    names = index.names()
+    cache = LabelCache(folder)
+    index.close()
+    cache.close()
+    return names
+
+
+@case("load_images.cold")
+def bench_load_images_cold(workspace):
+    """Open a folder for the first time, every label file is counted"""
+    folder = workspace.folder
+    return lambda: open_folder(folder), lambda: remove_folder_caches(folder), workspace.params['images']
+
+
+@case("load_images.warm")
+def bench_load_images_warm(workspace):
+    """Open a folder again, the index is up to date"""
+    folder = workspace.folder
+    open_folder(folder)
+    return lambda: open_folder(folder), None, workspace.params['images']
+
+
+@case("video2images.process_video")
+def bench_process_video(workspace):
+    """Extract every 5th frame of a video, items are decoded frames"""
+    import video2images
+
+    video = workspace.video
+    output = os.path.join(workspace.root, "frames")
+
+    def run():
+        # process_video prints a line per video
+        with contextlib.redirect_stdout(io.StringIO()):
+            video2images.process_video(video, output, frame_interval=5)
+
+    return run, lambda: shutil.rmtree(output, ignore_errors=True), workspace.params['video_frames']
+
+
+def measure(run, reset=None, samples=50, warmup=3):
+    """Milliseconds of every timed call of run"""
+    timings = []
+    for i in range(warmup + samples):
+        if reset is not None:
+            reset()
+        start = time.perf_counter()
+        run()
+        elapsed = (time.perf_counter() - start) * 1000.0
+        if i >= warmup:
+            timings.append(elapsed)
+    return np.array(timings)
+
+
+def run_suite(names, scale='quick', samples=None, root=None, seed=0, progress=print):
+    """Run the named cases and return {name: summary in ms}, cases whose dependencies are missing are skipped"""
+    samples = samples or SCALES[scale]['samples']
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="markup_bench_", dir=root) as tmp:
+        workspace = Workspace(tmp, scale, seed)
+        for name in names:
+            try:
+                run, reset, items = CASES[name](workspace)
+            except ImportError as e:
+                progress(f"{name}: skipped ({e})")
+                continue
+
+            # Slow cases get fewer samples so the suite stays within minutes
+            case_samples = samples if items == 1 else max(5, samples // 10)
+            summary = distribution(measure(run, reset, case_samples))
+            summary['items'] = items
+            if items > 1:
+                summary['items_per_s'] = items / (summary['p50'] / 1000.0)
+            results[name] = summary
+            progress(format_summary(name, summary))
+    return results
+
+
+def format_summary(name, summary, baseline=None):
+    line = (f"{name:<30} p50 {summary['p50']:9.3f} ms | p95 {summary['p95']:9.3f} ms | "
+            f"max {summary['max']:9.3f} ms")
+    if 'items_per_s' in summary:
+        line += f" | {summary['items_per_s']:.0f} items/s"
+    if baseline is not None:
+        line += f" | {summary['p50'] / baseline['p50']:.2f}x baseline"
+    return line
+
+
+def machine_info():
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'processor': platform.processor(), 'cpus': os.cpu_count()}
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Names of the cases whose median got slower than the baseline by more than tolerance"""
+    regressions = []
+    for name, summary in results.items():
+        reference = baseline.get('results', {}).get(name)
+        if reference is None:
+            continue
+        print(format_summary(name, summary, reference))
+        if summary['p50'] > reference['p50'] * (1 + tolerance):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the annotation tool's hot paths on synthetic data")
+    parser.add_argument("cases", nargs="*", help="Cases to run (default: all), a prefix selects a group")
+    parser.add_argument("--scale", choices=SCALES, default='quick', help="Size of the generated data")
+    parser.add_argument("--samples", type=int, default=None, help="Timed calls per case")
+    parser.add_argument("--baseline", default=BASELINE_FILENAME, help="Baseline to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed slowdown of the median before a case counts as a regression")
+    parser.add_argument("--json", help="Write the results as JSON")
+    parser.add_argument("--list", action="store_true", help="List the cases and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, function in CASES.items():
+            print(f"{name:<30} {function.__doc__}")
+        return
+
+    names = [name for name in CASES if not args.cases or any(name.startswith(prefix) for prefix in args.cases)]
+    if not names:
+        parser.error(f"No case matches {args.cases}, see --list")
+
+    results = run_suite(names, args.scale, args.samples)
+    report = {'scale': args.scale, 'machine': machine_info(), 'results': results}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, store one with --save-baseline")
+        return
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    if baseline.get('scale') != args.scale:
+        print(f"Warning: the baseline was measured at scale {baseline.get('scale')!r}")
+    if baseline.get('machine') != report['machine']:
+        print("Warning: the baseline was measured on another machine or Python, compare with care")
+
+    print("\nCompared with the baseline:")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"Slower than the baseline by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
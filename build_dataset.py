@@ -0,0 +1,251 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from dataset_index import scan_folder
+
+MANIFEST_FILENAME = ".markup_build.json"
+SPLITS = ('train', 'val')
+CHUNK_SIZE = 512
+PLAIN_YAML = re.compile(r"^[\w./+\-]+$")
+
+
+def label_classes(paths):
+    """Sorted class ids of every label file, only the first token of each line is looked at"""
+    result = []
+    for path in paths:
+        classes = set()
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    parts = line.split(None, 1)
+                    if parts and parts[0].isdigit():
+                        classes.add(int(parts[0]))
+        except (OSError, UnicodeDecodeError):
+            pass
+        result.append(sorted(classes))
+    return result
+
+
+def classes_in_parallel(paths, workers=None):
+    chunks = [paths[start:start + CHUNK_SIZE] for start in range(0, len(paths), CHUNK_SIZE)]
+    workers = workers or os.cpu_count() or 1
+    if len(chunks) <= 1 or workers == 1:
+        parsed = map(label_classes, chunks)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = list(pool.map(label_classes, chunks))
+    return [classes for chunk in parsed for classes in chunk]
+
+
+def stable_rank(name):
+    """Position of a name in a pseudo-random order that doesn't change between runs"""
+    return hashlib.blake2b(name.encode(), digest_size=8).digest()
+
+
+def assign_splits(image_classes, val_ratio, previous=None):
+    """Split images into train/val stratified by class.
+
+    Each image is put in the stratum of its rarest class, and val_ratio of
+    every stratum goes to val. Images without polygons form their own stratum.
+    Images found in previous keep their split there; new images are taken in a
+    stable hash order and fill val until their stratum reaches its share, so
+    adding images never moves existing ones between splits.
+    """
+    previous = previous or {}
+    counts = Counter(class_id for classes in image_classes.values() for class_id in classes)
+    strata = {}
+    for name, classes in image_classes.items():
+        stratum = min(classes, key=lambda class_id: (counts[class_id], class_id)) if classes else -1
+        strata.setdefault(stratum, []).append(name)
+
+    splits = {}
+    for names in strata.values():
+        num_val = round(len(names) * val_ratio)
+        # A class with several images always gets at least one of them in val
+        if num_val == 0 and len(names) > 1 and val_ratio > 0:
+            num_val = 1
+
+        new_names = []
+        for name in names:
+            if name in previous:
+                splits[name] = previous[name]
+                num_val -= previous[name] == 'val'
+            else:
+                new_names.append(name)
+        new_names.sort(key=stable_rank)
+        for position, name in enumerate(new_names):
+            splits[name] = 'val' if position < num_val else 'train'
+    return splits, counts
+
+
+def link_file(source, target, mode):
+    """Put a hardlink, symlink or copy of source at target, replacing what is there"""
+    if os.path.lexists(target):
+        os.remove(target)
+    if mode == 'hard':
+        try:
+            os.link(source, target)
+            return
+        except OSError:
+            # Other filesystem or no hardlink support, fall back to a symlink
+            mode = 'sym'
+    if mode == 'sym':
+        try:
+            os.symlink(os.path.abspath(source), target)
+            return
+        except OSError:
+            mode = 'copy'
+    shutil.copy2(source, target)
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def write_dataset_yaml(yaml_path, root, classes):
+    """dataset.yaml for ultralytics in the layout of the hand-written one"""
+    lines = [f"path: {os.path.abspath(root)}", "train: ./train/", "val: ./val/", "", "names:"]
+    for class_id, name in enumerate(classes):
+        lines.append(f"  {class_id}: {name if PLAIN_YAML.match(name) else json.dumps(name)}")
+    tmp_path = f"{yaml_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, yaml_path)
+
+
+def build_dataset(folder, output, classes, val_ratio=0.2, link='hard', yaml_path=None, workers=None):
+    """Link the labeled images of folder into output/train and output/val and write dataset.yaml.
+
+    A manifest in output remembers the stamps, classes and split of every image,
+    so a rebuild only parses changed label files, keeps every known image in its
+    split and only links new images and ones whose source changed. A different
+    val_ratio than the manifest's splits everything anew.
+    Returns a dict with counts of what was done.
+    """
+    start_time = time.perf_counter()
+    manifest_path = os.path.join(output, MANIFEST_FILENAME)
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('source') != os.path.abspath(folder):
+            manifest = {}
+    except (OSError, ValueError):
+        manifest = {}
+    known = manifest.get('images', {})
+    previous = {name: entry['split'] for name, entry in known.items()}
+    if manifest.get('val_ratio') != val_ratio:
+        previous = {}
+
+    images, labels = scan_folder(folder)
+    stamps = {}
+    for name, image_stamp in images.items():
+        label_stamp = labels.get(os.path.splitext(name)[0])
+        if label_stamp is not None:
+            stamps[name] = [list(image_stamp), list(label_stamp)]
+
+    # Only label files that changed since the last build are read
+    image_classes = {}
+    to_parse = []
+    for name, stamp in stamps.items():
+        entry = known.get(name)
+        if entry is not None and entry['stamp'] == stamp:
+            image_classes[name] = entry['classes']
+        else:
+            to_parse.append(name)
+    parsed = classes_in_parallel(
+        [os.path.join(folder, os.path.splitext(name)[0] + ".txt") for name in to_parse], workers)
+    image_classes.update(zip(to_parse, parsed))
+
+    splits, counts = assign_splits(image_classes, val_ratio, previous)
+
+    for split in SPLITS:
+        os.makedirs(os.path.join(output, split), exist_ok=True)
+
+    jobs = []
+    removals = []
+    for name, split in splits.items():
+        entry = known.get(name)
+        label_name = os.path.splitext(name)[0] + ".txt"
+        if entry is not None and entry['split'] != split:
+            removals.append(os.path.join(output, entry['split'], name))
+            removals.append(os.path.join(output, entry['split'], label_name))
+        elif (entry is not None and entry['stamp'] == stamps[name] and
+              os.path.lexists(os.path.join(output, split, name))):
+            continue
+        jobs.append((os.path.join(folder, name), os.path.join(output, split, name)))
+        jobs.append((os.path.join(folder, label_name), os.path.join(output, split, label_name)))
+
+    for name in known.keys() - splits.keys():
+        entry = known[name]
+        removals.append(os.path.join(output, entry['split'], name))
+        removals.append(os.path.join(output, entry['split'], os.path.splitext(name)[0] + ".txt"))
+
+    # Link and unlink calls are pure filesystem work that threads overlap well
+    with ThreadPoolExecutor(max_workers=min(32, (workers or os.cpu_count() or 1) * 4)) as pool:
+        list(pool.map(remove_file, removals))
+        list(pool.map(lambda job: link_file(*job, link), jobs))
+
+    manifest = {
+        'source': os.path.abspath(folder),
+        'val_ratio': val_ratio,
+        'images': {name: {'stamp': stamps[name], 'classes': image_classes[name], 'split': split}
+                   for name, split in splits.items()},
+    }
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+    write_dataset_yaml(yaml_path or os.path.join(output, "dataset.yaml"), output, classes)
+
+    split_counts = Counter(splits.values())
+    unknown = sorted(class_id for class_id in counts if class_id >= len(classes))
+    return {
+        'train': split_counts['train'],
+        'val': split_counts['val'],
+        'parsed': len(to_parse),
+        'linked': len(jobs) // 2,
+        'removed': len(removals) // 2,
+        'class_counts': {classes[class_id] if class_id < len(classes) else str(class_id): counts[class_id]
+                         for class_id in sorted(counts)},
+        'unknown_classes': unknown,
+        'elapsed': time.perf_counter() - start_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update a train/val dataset from an annotated folder")
+    parser.add_argument("folder", help="Folder with images and YOLO label files")
+    parser.add_argument("output", help="Dataset root, train/ and val/ are created inside")
+    parser.add_argument("--classes", required=True, help="Classes JSON exported from the app")
+    parser.add_argument("--val", type=float, default=0.2, help="Share of images in the validation split")
+    parser.add_argument("--link", choices=['hard', 'sym', 'copy'], default='hard',
+                        help="How files are placed in the dataset (hardlinks fall back to symlinks)")
+    parser.add_argument("--yaml", default=None, help="Where to write dataset.yaml (default: inside output)")
+    parser.add_argument("--workers", type=int, default=None, help="Parsing processes")
+    args = parser.parse_args()
+
+    with open(args.classes, 'r') as f:
+        classes = json.load(f)
+
+    stats = build_dataset(args.folder, args.output, classes, args.val, args.link, args.yaml, args.workers)
+    print(f"train: {stats['train']} | val: {stats['val']} | parsed {stats['parsed']} label files | "
+          f"linked {stats['linked']} | removed {stats['removed']} | {stats['elapsed']:.1f}s")
+    for name, count in stats['class_counts'].items():
+        print(f"  {name}: {count} images")
+    if stats['unknown_classes']:
+        print(f"Warning: class ids {stats['unknown_classes']} are not in {args.classes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import tkinter as tk
+
+
+class CanvasScene:
+    """Canvas items of the displayed image and annotations, kept alive between redraws.
+
+    Every annotation owns an outline polygon, a stippled fill, an optional class
+    label and one oval per vertex, all looked up by annotation id. Edits move or
+    restyle these items with ``coords``/``itemconfig`` instead of clearing the
+    canvas and creating everything again.
+    """
+
+    VERTEX_RADIUS = 3
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.items = {}  # ann_id -> dict of canvas item ids
+        self.selected_id = None
+        self.background_id = None
+        self.background_key = None
+
+    def set_background(self, photo, position, key):
+        """Show photo at position, key identifies the image and viewport it was rendered for"""
+        if self.background_id is None:
+            self.background_id = self.canvas.create_image(*position, anchor=tk.NW, image=photo)
+        else:
+            self.canvas.coords(self.background_id, *position)
+            self.canvas.itemconfig(self.background_id, image=photo, state=tk.NORMAL)
+        self.canvas.tag_lower(self.background_id)
+        self.background_key = key
+
+    def keep_background(self, key):
+        """Leave the shown background in place as a stand-in for the render identified by key"""
+        self.background_key = key
+
+    def hide_background(self, key):
+        if self.background_id is not None:
+            self.canvas.itemconfig(self.background_id, state=tk.HIDDEN)
+        self.background_key = key
+
+    def add(self, ann_id, points, color, label_text=None):
+        """Create the items of an annotation from its canvas points"""
+        self.remove(ann_id)
+
+        selected = ann_id == self.selected_id
+        flat_points = self._flatten(points)
+
+        polygon_id = self.canvas.create_polygon(
+            flat_points,
+            outline="#ffffff" if selected else color,
+            fill="",
+            width=3 if selected else 2,
+            tags=("polygon", f"polygon_{ann_id}")
+        )
+
+        # Transparent fill
+        fill_id = self.canvas.create_polygon(
+            flat_points,
+            outline="",
+            fill=color,
+            stipple="gray25",
+            tags=("fill", f"fill_{ann_id}")
+        )
+
+        label_id = None
+        if label_text is not None:
+            label_id = self._create_label(ann_id, points[0], label_text, color)
+
+        self.items[ann_id] = {
+            'polygon': polygon_id,
+            'fill': fill_id,
+            'label': label_id,
+            'vertices': self._create_vertices(ann_id, points, color),
+            'color': color,
+        }
+
+    def update_points(self, ann_id, points, vertex_idx=None):
+        """Move the items of an annotation, if vertex_idx is given only that vertex oval moved"""
+        items = self.items[ann_id]
+        flat_points = self._flatten(points)
+        self.canvas.coords(items['polygon'], *flat_points)
+        self.canvas.coords(items['fill'], *flat_points)
+
+        if items['label'] is not None:
+            label_x, label_y = points[0]
+            self.canvas.coords(items['label'], label_x, label_y - 10)
+
+        if len(points) != len(items['vertices']):
+            # Vertex added or removed, indices in the tags changed
+            for vertex_id in items['vertices']:
+                self.canvas.delete(vertex_id)
+            items['vertices'] = self._create_vertices(ann_id, points, items['color'])
+        elif vertex_idx is not None:
+            self._move_vertex(items['vertices'][vertex_idx], points[vertex_idx])
+        else:
+            for vertex_id, point in zip(items['vertices'], points):
+                self._move_vertex(vertex_id, point)
+
+    def update_style(self, ann_id, points, color, label_text=None):
+        """Recolor an annotation and update its class label"""
+        items = self.items[ann_id]
+        items['color'] = color
+
+        if ann_id != self.selected_id:
+            self.canvas.itemconfig(items['polygon'], outline=color)
+        self.canvas.itemconfig(items['fill'], fill=color)
+        for vertex_id in items['vertices']:
+            self.canvas.itemconfig(vertex_id, fill=color)
+
+        if label_text is None:
+            if items['label'] is not None:
+                self.canvas.delete(items['label'])
+                items['label'] = None
+        elif items['label'] is None:
+            items['label'] = self._create_label(ann_id, points[0], label_text, color)
+        else:
+            self.canvas.itemconfig(items['label'], text=label_text, fill=color)
+
+    def set_selected(self, ann_id):
+        """Move the white selection outline to another annotation"""
+        previous = self.items.get(self.selected_id)
+        if previous is not None:
+            self.canvas.itemconfig(previous['polygon'], outline=previous['color'], width=2)
+
+        self.selected_id = ann_id
+        current = self.items.get(ann_id)
+        if current is not None:
+            self.canvas.itemconfig(current['polygon'], outline="#ffffff", width=3)
+
+    def remove(self, ann_id):
+        items = self.items.pop(ann_id, None)
+        if items is None:
+            return
+
+        for key in ('polygon', 'fill', 'label'):
+            if items[key] is not None:
+                self.canvas.delete(items[key])
+        for vertex_id in items['vertices']:
+            self.canvas.delete(vertex_id)
+
+    def clear(self):
+        """Remove all annotation items, keeping the background"""
+        for ann_id in list(self.items):
+            self.remove(ann_id)
+
+    def reset(self):
+        """Forget everything after the canvas was cleared"""
+        self.canvas.delete("all")
+        self.items = {}
+        self.background_id = None
+        self.background_key = None
+
+    def _create_label(self, ann_id, point, label_text, color):
+        label_x, label_y = point
+        return self.canvas.create_text(
+            label_x, label_y - 10,
+            text=label_text,
+            fill=color,
+            font=("Arial", 10, "bold"),
+            tags=("label", f"label_{ann_id}")
+        )
+
+    def _create_vertices(self, ann_id, points, color):
+        r = self.VERTEX_RADIUS
+        return [
+            self.canvas.create_oval(
+                x - r, y - r, x + r, y + r,
+                fill=color,
+                outline="white",  # Always white outline for vertices
+                tags=("vertex", f"vertex_{ann_id}_{i}")
+            )
+            for i, (x, y) in enumerate(points)
+        ]
+
+    def _move_vertex(self, vertex_id, point):
+        r = self.VERTEX_RADIUS
+        x, y = point
+        self.canvas.coords(vertex_id, x - r, y - r, x + r, y + r)
+
+    @staticmethod
+    def _flatten(points):
+        return [coord for point in points for coord in point]
@@ -0,0 +1,283 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from dataset_index import scan_folder
+from frame_source import is_video_label_folder
+
+JOURNAL_FILENAME = ".markup_remap.json"
+NEW_SUFFIX = ".remap-new"
+OLD_SUFFIX = ".remap-old"
+CHUNK_SIZE = 512
+
+
+def removal_mapping(num_classes, removed):
+    """Mapping that deletes class `removed` and shifts the following ids down"""
+    return {class_id: (None if class_id == removed else class_id - (class_id > removed))
+            for class_id in range(num_classes)}
+
+
+def swap_mapping(num_classes, first, second):
+    mapping = {class_id: class_id for class_id in range(num_classes)}
+    mapping[first], mapping[second] = second, first
+    return mapping
+
+
+def name_mapping(old_classes, new_classes):
+    """Mapping from the ids of old_classes to the position of the same name in new_classes (None if missing)"""
+    positions = {name: class_id for class_id, name in enumerate(new_classes)}
+    return {class_id: positions.get(name) for class_id, name in enumerate(old_classes)}
+
+
+def is_identity(mapping):
+    return all(old == new for old, new in mapping.items())
+
+
+def remap_lines(lines, mapping):
+    """Remap the class ids of label lines, returns (new lines, whether anything changed).
+
+    Only the class token is touched, coordinates are copied as they are. Lines
+    with an unknown or unparseable class are kept unchanged.
+    """
+    remapped = []
+    changed = False
+    for line in lines:
+        parts = line.split(None, 1)
+        try:
+            class_id = int(parts[0])
+        except (ValueError, IndexError):
+            remapped.append(line)
+            continue
+
+        if class_id not in mapping:
+            remapped.append(line)
+            continue
+
+        new_id = mapping[class_id]
+        if new_id is None:
+            changed = True
+        elif new_id != class_id:
+            remapped.append(f"{new_id} {parts[1]}" if len(parts) > 1 else f"{new_id}\n")
+            changed = True
+        else:
+            remapped.append(line)
+    return remapped, changed
+
+
+def stage_files(paths, mapping):
+    """Write the remapped contents of each changed label next to it as *.remap-new, returns the changed paths"""
+    changed_paths = []
+    for path in paths:
+        try:
+            with open(path, 'r') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            continue
+
+        remapped, changed = remap_lines(lines, mapping)
+        if not changed:
+            continue
+
+        with open(path + NEW_SUFFIX, 'w') as f:
+            f.writelines(remapped)
+        changed_paths.append(path)
+    return changed_paths
+
+
+def label_files(folder):
+    """Paths of the label files that belong to an image of the folder"""
+    images, labels = scan_folder(folder)
+    if is_video_label_folder(folder):
+        # Labels of video frames have no image files next to them
+        return sorted(os.path.join(folder, stem + ".txt") for stem in labels)
+    stems = {os.path.splitext(name)[0] for name in images}
+    return sorted(os.path.join(folder, stem + ".txt") for stem in labels if stem in stems)
+
+
+class ClassRemapJob:
+    """Rewrite the class ids of every label file in a folder.
+
+    The job runs in two phases recorded in a journal file next to the labels.
+    Staging writes the new contents of every changed file as *.remap-new with a
+    process pool, nothing is modified yet. Committing moves each original aside
+    as *.remap-old and renames the staged file over it, then the journal moves
+    to a cleanup phase and the backups are deleted. An interrupted job can be
+    resumed or rolled back from the journal while staging or committing; once
+    in cleanup the remap is complete and both only finish deleting backups.
+    """
+
+    def __init__(self, folder, mapping, classes=None, workers=None, progress=None):
+        self.folder = folder
+        self.mapping = {int(old): new for old, new in mapping.items()}
+        self.classes = classes
+        self.workers = workers or os.cpu_count() or 1
+        self.progress = progress  # callback(phase, done, total)
+        self.journal_path = os.path.join(folder, JOURNAL_FILENAME)
+        self.phase = 'staging'
+        self.changed = []
+
+    @classmethod
+    def from_journal(cls, folder, workers=None, progress=None):
+        """Job of an interrupted remap in folder, or None if there is none"""
+        journal = read_journal(folder)
+        if journal is None:
+            return None
+
+        job = cls(folder, {int(old): new for old, new in journal['mapping'].items()},
+                  journal.get('classes'), workers, progress)
+        job.changed = [os.path.join(folder, name) for name in journal.get('changed', [])]
+        job.phase = journal['phase']
+        return job
+
+    def run(self):
+        """Stage and commit the remap, returns the number of rewritten files"""
+        self._write_journal('staging')
+        self.stage()
+        self._write_journal('committing')
+        self.commit()
+        return len(self.changed)
+
+    def resume(self):
+        """Finish an interrupted job, staging is simply redone since it never touches the labels"""
+        if self.phase == 'staging':
+            self._remove_staged(label_files(self.folder))
+            return self.run()
+        if self.phase == 'cleanup':
+            self._cleanup()
+        else:
+            self.commit()
+        return len(self.changed)
+
+    def rollback(self):
+        """Undo an interrupted job, restoring every label that was already replaced.
+
+        Returns False if the job was already in cleanup, some backups may be gone
+        by then, so the remap is kept and only the cleanup is finished.
+        """
+        if self.phase == 'cleanup':
+            self._cleanup()
+            return False
+        if self.phase == 'staging':
+            self._remove_staged(label_files(self.folder))
+        else:
+            total = len(self.changed)
+            for done, path in enumerate(self.changed, 1):
+                if os.path.exists(path + OLD_SUFFIX):
+                    os.replace(path + OLD_SUFFIX, path)
+                if os.path.exists(path + NEW_SUFFIX):
+                    os.remove(path + NEW_SUFFIX)
+                self._report('rollback', done, total)
+        os.remove(self.journal_path)
+        return True
+
+    def stage(self):
+        paths = label_files(self.folder)
+        chunks = [paths[start:start + CHUNK_SIZE] for start in range(0, len(paths), CHUNK_SIZE)]
+        self.changed = []
+        done = 0
+        self._report('staging', 0, len(paths))
+
+        # Small jobs aren't worth starting processes for
+        if len(chunks) <= 1 or self.workers == 1:
+            for chunk in chunks:
+                self.changed.extend(stage_files(chunk, self.mapping))
+                done += len(chunk)
+                self._report('staging', done, len(paths))
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for chunk, changed in zip(chunks, pool.map(stage_files, chunks, [self.mapping] * len(chunks))):
+                self.changed.extend(changed)
+                done += len(chunk)
+                self._report('staging', done, len(paths))
+
+    def commit(self):
+        total = len(self.changed)
+        for done, path in enumerate(self.changed, 1):
+            staged = path + NEW_SUFFIX
+            backup = path + OLD_SUFFIX
+            # Each step is a rename, so after a crash the file is in a state resume() can continue from
+            if os.path.exists(staged):
+                if os.path.exists(path) and not os.path.exists(backup):
+                    os.replace(path, backup)
+                os.replace(staged, path)
+            self._report('committing', done, total)
+
+        # Every label holds its new contents now, deleting backups must not be rolled back
+        self._write_journal('cleanup')
+        self._cleanup()
+
+    def _cleanup(self):
+        for path in self.changed:
+            if os.path.exists(path + OLD_SUFFIX):
+                os.remove(path + OLD_SUFFIX)
+        os.remove(self.journal_path)
+
+    def _remove_staged(self, paths):
+        for path in paths:
+            if os.path.exists(path + NEW_SUFFIX):
+                os.remove(path + NEW_SUFFIX)
+
+    def _write_journal(self, phase):
+        self.phase = phase
+        journal = {
+            'phase': phase,
+            'mapping': {str(old): new for old, new in self.mapping.items()},
+            'classes': self.classes,
+            'changed': [os.path.basename(path) for path in self.changed],
+        }
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(journal, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+    def _report(self, phase, done, total):
+        if self.progress is not None:
+            self.progress(phase, done, total)
+
+
+def read_journal(folder):
+    path = os.path.join(folder, JOURNAL_FILENAME)
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resume or roll back an interrupted class remap of a folder")
+    parser.add_argument("folder", help="Folder with images and labels")
+    parser.add_argument("action", choices=["resume", "rollback"])
+    parser.add_argument("--workers", type=int, default=None, help="Staging processes")
+    args = parser.parse_args()
+
+    def progress(phase, done, total):
+        if done == total or done % 10000 == 0:
+            print(f"{phase}: {done}/{total}")
+
+    job = ClassRemapJob.from_journal(args.folder, args.workers, progress)
+    if job is None:
+        print("No interrupted remap in this folder")
+        return
+
+    start_time = time.perf_counter()
+    if args.action == "resume":
+        count = job.resume()
+        print(f"Rewrote {count} label files in {time.perf_counter() - start_time:.1f}s")
+        if job.classes is not None:
+            print(f"Classes after the remap: {json.dumps(job.classes)}")
+    elif job.rollback():
+        print(f"Rolled back in {time.perf_counter() - start_time:.1f}s")
+    else:
+        print("The remap was already committed, removed the leftover backups")
+        if job.classes is not None:
+            print(f"Classes after the remap: {json.dumps(job.classes)}")
+
+
+if __name__ == "__main__":
+    main()
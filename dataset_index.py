@@ -0,0 +1,213 @@
+import os
+import sqlite3
+
+INDEX_FILENAME = ".markup_index.sqlite"
+SUPPORTED_FORMATS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    mtime_ns INTEGER,
+    size INTEGER,
+    label_mtime_ns INTEGER,
+    label_size INTEGER,
+    polygons INTEGER NOT NULL DEFAULT 0,
+    labeled INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS images_position ON images (position);
+CREATE INDEX IF NOT EXISTS images_labeled ON images (labeled, position);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def count_polygons(label_path):
+    """Number of polygon lines in a label file (class + at least 3 points)"""
+    try:
+        with open(label_path, 'r') as f:
+            return sum(1 for line in f if len(line.split()) >= 7)
+    except OSError:
+        return 0
+
+
+def scan_folder(folder):
+    """Return ({image_name: (mtime_ns, size)}, {label_stem: (mtime_ns, size)}) in one directory pass"""
+    images = {}
+    labels = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            name = entry.name
+            lower = name.lower()
+            if lower.endswith(SUPPORTED_FORMATS):
+                st = entry.stat()
+                images[name] = (st.st_mtime_ns, st.st_size)
+            elif lower.endswith('.txt'):
+                st = entry.stat()
+                labels[os.path.splitext(name)[0]] = (st.st_mtime_ns, st.st_size)
+    return images, labels
+
+
+class DatasetIndex:
+    """Persistent SQLite index of the images in a folder and the state of their label files.
+
+    The index is stored next to the images. refresh() only re-reads label files
+    whose mtime or size changed. While the folder itself is unchanged the
+    directory scan is skipped and only the known label files are stat'ed, since
+    a file rewritten in place doesn't touch the folder mtime. A folder that
+    cannot be written to gets an in-memory index instead.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        path = os.path.join(folder, INDEX_FILENAME)
+        try:
+            self.conn = self._open(path)
+        except sqlite3.DatabaseError:
+            # The index only caches what is on disk, a broken or unwritable one is rebuilt
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+                self.conn = self._open(path)
+            except (OSError, sqlite3.Error):
+                self.conn = self._open(":memory:")
+
+    @staticmethod
+    def _open(path):
+        conn = sqlite3.connect(path)
+        # No journal file next to the index, creating one would change the folder mtime on every commit
+        conn.execute("PRAGMA journal_mode = MEMORY")
+        # It is only a cache of the folder, don't wait for fsync on every update
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def close(self):
+        self.conn.close()
+
+    def refresh(self, force=False):
+        """Bring the index up to date with the folder, returns True if anything changed"""
+        folder_mtime = str(os.stat(self.folder).st_mtime_ns)
+        if not force and self._get_meta('folder_mtime_ns') == folder_mtime:
+            return self._refresh_labels()
+
+        images, labels = scan_folder(self.folder)
+        known = {
+            name: (mtime, size, label_mtime, label_size)
+            for name, mtime, size, label_mtime, label_size in self.conn.execute(
+                "SELECT name, mtime_ns, size, label_mtime_ns, label_size FROM images")
+        }
+
+        removed = known.keys() - images.keys()
+        changed = []
+        for name, stamp in images.items():
+            label_stamp = labels.get(os.path.splitext(name)[0], (None, None))
+            if known.get(name) == stamp + label_stamp:
+                continue
+
+            polygons = 0
+            if label_stamp[0] is not None:
+                polygons = count_polygons(os.path.join(self.folder, os.path.splitext(name)[0] + ".txt"))
+            changed.append((name, -1, stamp[0], stamp[1], label_stamp[0], label_stamp[1],
+                            polygons, int(polygons > 0)))
+
+        with self.conn:
+            self.conn.executemany("DELETE FROM images WHERE name = ?", ((name,) for name in removed))
+            self.conn.executemany(
+                "INSERT INTO images (name, position, mtime_ns, size, label_mtime_ns, label_size, polygons, labeled) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET mtime_ns = excluded.mtime_ns, size = excluded.size, "
+                "label_mtime_ns = excluded.label_mtime_ns, label_size = excluded.label_size, "
+                "polygons = excluded.polygons, labeled = excluded.labeled",
+                changed)
+
+            # Positions only have to be renumbered when the set of images changed
+            if removed or images.keys() - known.keys():
+                self.conn.executemany("UPDATE images SET position = ? WHERE name = ?",
+                                      ((position, name) for position, name in enumerate(sorted(images))))
+            self._set_meta('folder_mtime_ns', folder_mtime)
+
+        return bool(removed or changed)
+
+    def _refresh_labels(self):
+        """Re-read the known label files whose stamp changed, the image list is left as it is"""
+        changed = []
+        for name, label_mtime, label_size in self.conn.execute(
+                "SELECT name, label_mtime_ns, label_size FROM images WHERE label_mtime_ns IS NOT NULL").fetchall():
+            label_path = os.path.join(self.folder, os.path.splitext(name)[0] + ".txt")
+            try:
+                st = os.stat(label_path)
+            except OSError:
+                # Removing a file changes the folder mtime, the next full scan picks it up
+                continue
+            if (st.st_mtime_ns, st.st_size) == (label_mtime, label_size):
+                continue
+            polygons = count_polygons(label_path)
+            changed.append((st.st_mtime_ns, st.st_size, polygons, int(polygons > 0), name))
+
+        if changed:
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE images SET label_mtime_ns = ?, label_size = ?, polygons = ?, labeled = ? WHERE name = ?",
+                    changed)
+        return bool(changed)
+
+    def names(self):
+        """All image names in display order"""
+        return [name for name, in self.conn.execute("SELECT name FROM images ORDER BY position")]
+
+    def unlabeled_names(self):
+        """Names of the images without polygons in display order"""
+        return [name for name, in self.conn.execute(
+            "SELECT name FROM images WHERE labeled = 0 ORDER BY position")]
+
+    def names_without_labels(self):
+        """Names of the images without a label file in display order, an empty label file counts as labeled"""
+        return [name for name, in self.conn.execute(
+            "SELECT name FROM images WHERE label_mtime_ns IS NULL ORDER BY position")]
+
+    def counts(self):
+        """Return (total images, labeled images)"""
+        total, labeled = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(labeled), 0) FROM images").fetchone()
+        return total, labeled
+
+    def next_unlabeled(self, position=-1):
+        """Position of the first unlabeled image after position, wrapping around, or None"""
+        row = self.conn.execute(
+            "SELECT position FROM images WHERE labeled = 0 AND position > ? ORDER BY position LIMIT 1",
+            (position,)).fetchone()
+        if row is None and position >= 0:
+            row = self.conn.execute(
+                "SELECT position FROM images WHERE labeled = 0 ORDER BY position LIMIT 1").fetchone()
+        return row[0] if row is not None else None
+
+    def set_polygon_count(self, name, polygons):
+        """Record the polygon count of an image whose labels were just saved by the app"""
+        with self.conn:
+            # The label stamp is invalidated so the next refresh re-reads the file once it is written
+            self.conn.execute(
+                "UPDATE images SET polygons = ?, labeled = ?, label_mtime_ns = -1, label_size = -1 "
+                "WHERE name = ?",
+                (polygons, int(polygons > 0), name))
+
+    def remove(self, name):
+        """Forget a deleted image, later positions move up so they keep matching names()"""
+        with self.conn:
+            row = self.conn.execute("SELECT position FROM images WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return
+            self.conn.execute("DELETE FROM images WHERE name = ?", (name,))
+            self.conn.execute("UPDATE images SET position = position - 1 WHERE position > ?", row)
+
+    def rename(self, old_name, new_name):
+        with self.conn:
+            self.conn.execute("UPDATE images SET name = ?, mtime_ns = -1 WHERE name = ?", (new_name, old_name))
+
+    def _get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
@@ -0,0 +1,139 @@
+import argparse
+import csv
+import json
+import time
+
+import numpy as np
+
+from geometry import polygon_areas
+from label_cache import LabelCache
+
+PERCENTILES = (5, 25, 50, 75, 95)
+# Object area bins as a share of the image, log spaced
+AREA_BINS = (0.0, 1e-4, 1e-3, 1e-2, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def distribution(values):
+    """Summary of a 1-d array: count, mean, min, max and percentiles"""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return {'count': 0}
+    summary = {'count': int(len(values)), 'mean': float(values.mean()),
+               'min': float(values.min()), 'max': float(values.max())}
+    for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f'p{percentile}'] = float(value)
+    return summary
+
+
+def compute_stats(cache, classes=None):
+    """Dataset statistics from the arrays of a synced LabelCache, no label file is read here.
+
+    Areas are shares of the image area, so they don't depend on image sizes.
+    """
+    classes = classes or []
+    num_images = len(cache)
+    polygon_class = np.asarray(cache.polygon_class)
+    vertex_counts = np.asarray(cache.polygon_count)
+    image_count = np.asarray(cache.image_count)
+    areas = polygon_areas(cache.vertices, cache.polygon_offset, vertex_counts)
+
+    # Image of every polygon, to count the images a class appears in
+    polygon_image = np.repeat(np.arange(num_images), image_count)
+
+    # Negative class ids parse but can't be counted per class
+    valid = polygon_class >= 0
+    if not valid.all():
+        polygon_class, polygon_image = polygon_class[valid], polygon_image[valid]
+        vertex_counts, areas = vertex_counts[valid], areas[valid]
+
+    num_classes = max(len(classes), int(polygon_class.max()) + 1 if len(polygon_class) else 0)
+    polygons_per_class = np.bincount(polygon_class, minlength=num_classes)
+    area_per_class = np.bincount(polygon_class, weights=areas, minlength=num_classes)
+    vertices_per_class = np.bincount(polygon_class, weights=vertex_counts, minlength=num_classes)
+    pairs = np.unique(polygon_image * num_classes + polygon_class) if len(polygon_class) else np.zeros(0, np.int64)
+    images_per_class = np.bincount(pairs % max(num_classes, 1), minlength=num_classes)
+
+    per_class = []
+    for class_id in range(num_classes):
+        polygons = int(polygons_per_class[class_id])
+        per_class.append({
+            'class_id': class_id,
+            'name': classes[class_id] if class_id < len(classes) else f"unknown_{class_id}",
+            'polygons': polygons,
+            'images': int(images_per_class[class_id]),
+            'share': polygons / len(polygon_class) if len(polygon_class) else 0.0,
+            'mean_area': float(area_per_class[class_id] / polygons) if polygons else 0.0,
+            'mean_vertices': float(vertices_per_class[class_id] / polygons) if polygons else 0.0,
+        })
+
+    histogram, _ = np.histogram(np.clip(areas, 0.0, 1.0), bins=AREA_BINS)
+    return {
+        'images': num_images,
+        'labeled_images': int((image_count > 0).sum()),
+        'polygons': int(len(polygon_class)),
+        'vertices': int(vertex_counts.sum()),
+        'polygons_per_image': distribution(image_count),
+        'vertices_per_polygon': distribution(vertex_counts),
+        'area': distribution(areas),
+        'area_histogram': [{'from': low, 'to': high, 'polygons': int(count)}
+                           for low, high, count in zip(AREA_BINS[:-1], AREA_BINS[1:], histogram)],
+        'classes': per_class,
+    }
+
+
+def folder_stats(folder, classes=None, workers=None, progress=None):
+    """Sync the folder's label cache, only changed label files are parsed, and compute its statistics"""
+    cache = LabelCache(folder)
+    parsed = cache.sync(workers, progress)
+    try:
+        stats = compute_stats(cache, classes)
+    finally:
+        cache.close()
+    stats['parsed_files'] = parsed
+    return stats
+
+
+def write_report(stats, json_path=None, csv_path=None):
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(stats, f, indent=2)
+    if csv_path:
+        fields = ['class_id', 'name', 'polygons', 'images', 'share', 'mean_area', 'mean_vertices']
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(stats['classes'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Class balance, polygon, vertex and area statistics of a folder")
+    parser.add_argument("folder", help="Folder with images and YOLO label files")
+    parser.add_argument("--classes", help="Classes JSON exported from the app, for class names")
+    parser.add_argument("--json", help="Write the full report as JSON")
+    parser.add_argument("--csv", help="Write the per-class counts as CSV")
+    parser.add_argument("--workers", type=int, default=None, help="Parsing processes")
+    args = parser.parse_args()
+
+    classes = None
+    if args.classes:
+        with open(args.classes, 'r') as f:
+            classes = json.load(f)
+
+    start_time = time.perf_counter()
+    stats = folder_stats(args.folder, classes, args.workers)
+    write_report(stats, args.json, args.csv)
+
+    print(f"{stats['images']} images ({stats['labeled_images']} labeled), {stats['polygons']} polygons, "
+          f"{stats['vertices']} vertices | parsed {stats['parsed_files']} label files in "
+          f"{time.perf_counter() - start_time:.1f}s")
+    ppi = stats['polygons_per_image']
+    if ppi['count']:
+        print(f"Polygons per image: mean {ppi['mean']:.1f}, p50 {ppi['p50']:.0f}, p95 {ppi['p95']:.0f}")
+    for entry in stats['classes']:
+        print(f"  {entry['class_id']:>3} {entry['name']}: {entry['polygons']} polygons in {entry['images']} images "
+              f"({entry['share']:.1%}), mean area {entry['mean_area']:.4f}, "
+              f"mean vertices {entry['mean_vertices']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
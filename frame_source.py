@@ -0,0 +1,374 @@
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from image_cache import ImageCache, decode_within_budget, file_stamp, fit_size
+from image_pyramid import ImagePyramid
+from inference_cache import array_hash, file_hash
+from labels import label_path_for
+from profiling import span
+
+VIDEO_FORMATS = ('.mp4', '.avi', '.mov', '.mkv', '.flv')
+FRAME_INDEX_FILENAME = ".markup_frames.npz"
+# Requested frames at most this far ahead of the decoder are reached by grabbing instead of seeking
+SEEK_THRESHOLD = 60
+# Seeks aim this many frames before the target, tried in order, 0 lands on the target itself
+SEEK_BACKOFFS = (0, 30, 300)
+# Longest side of the grayscale images polygons are tracked on
+TRACKING_MAX_SIDE = 1024
+
+FRAME_NAME = re.compile(r"_(\d+)\.jpg$")
+
+
+def is_video(path):
+    return os.path.isfile(path) and path.lower().endswith(VIDEO_FORMATS)
+
+
+def is_video_label_folder(folder):
+    """True for a folder that holds the labels of a video's frames rather than images"""
+    return os.path.exists(os.path.join(folder, FRAME_INDEX_FILENAME))
+
+
+def reduce_to_gray(img, max_side=TRACKING_MAX_SIDE):
+    """Grayscale uint8 array of a PIL image, reduced by an integer factor to at most max_side"""
+    gray = img.convert('L')
+    factor = -(-max(gray.size) // max_side)
+    if factor > 1:
+        gray = gray.reduce(factor)
+    return np.asarray(gray)
+
+
+def label_folder_for(video_path):
+    """Folder next to the video where the labels of its frames are stored"""
+    return os.path.splitext(video_path)[0] + "_labels"
+
+
+class FolderSource:
+    """Images of a folder, one file per image.
+
+    Decoding goes through the app's ImagePrefetcher, so neighbouring images are
+    resized in the background and labels are prefetched along with them.
+    """
+
+    is_video = False
+
+    def __init__(self, folder, prefetcher):
+        self.folder = folder
+        self.label_folder = folder
+        self.prefetcher = prefetcher
+        self._hashes = {}  # path -> (stamp, content hash)
+
+    def image_key(self, name):
+        return os.path.join(self.folder, name)
+
+    def get_image(self, name, canvas_size):
+        return self.prefetcher.get_image(self.image_key(name), canvas_size)
+
+    def peek_image(self, name, canvas_size):
+        return self.prefetcher.peek_image(self.image_key(name), canvas_size)
+
+    def preview_image(self, name, canvas_size):
+        return self.prefetcher.preview_image(self.image_key(name), canvas_size)
+
+    def request_image(self, name, canvas_size):
+        self.prefetcher.request_image(self.image_key(name), canvas_size)
+
+    def pyramid(self, name, cache):
+        return ImagePyramid(self.image_key(name), cache)
+
+    def model_input(self, name):
+        """What to pass to the model for this image"""
+        return self.image_key(name)
+
+    def content_hash(self, name):
+        """Hash of the image file, recomputed only when its stamp changes"""
+        path = self.image_key(name)
+        stamp = file_stamp(path)
+        cached = self._hashes.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, file_hash(path))
+            self._hashes[path] = cached
+        return cached[1]
+
+    def gray(self, name, max_side=TRACKING_MAX_SIDE):
+        with Image.open(self.image_key(name)) as img:
+            # JPEG decodes grayscale at a reduced scale directly
+            img.draft('L', (max_side, max_side))
+            return reduce_to_gray(decode_within_budget(img, (max_side, max_side), self.image_key(name)), max_side)
+
+    def prefetch(self, names, canvas_size):
+        items = [(self.image_key(name), label_path_for(self.label_folder, name)) for name in names]
+        self.prefetcher.prefetch(items, canvas_size)
+
+    def close(self):
+        pass
+
+
+class FrameIndex:
+    """Frame count and presentation timestamps of a video, built once by grabbing every frame.
+
+    The container's CAP_PROP_FRAME_COUNT is an estimate for many formats, so the
+    frames are counted exactly and saved next to the labels together with the
+    video's stamp. OpenCV does not expose keyframe flags, so where a seek through
+    CAP_PROP_POS_FRAMES landed is read back from these timestamps.
+    """
+
+    def __init__(self, fps, timestamps_ms):
+        self.fps = fps
+        self.timestamps_ms = timestamps_ms
+
+    def __len__(self):
+        return len(self.timestamps_ms)
+
+    def frame_at(self, timestamp_ms):
+        """Number of the frame whose timestamp is closest to timestamp_ms"""
+        position = int(np.searchsorted(self.timestamps_ms, timestamp_ms))
+        if position >= len(self.timestamps_ms):
+            return len(self.timestamps_ms) - 1
+        if position > 0 and (timestamp_ms - self.timestamps_ms[position - 1]
+                             < self.timestamps_ms[position] - timestamp_ms):
+            return position - 1
+        return position
+
+    @classmethod
+    def load_or_build(cls, video_path, index_path, progress=None):
+        stamp = file_stamp(video_path)
+        try:
+            with np.load(index_path) as data:
+                if tuple(data['stamp'].tolist()) == stamp:
+                    return cls(float(data['fps']), data['timestamps_ms'])
+        except (OSError, KeyError, ValueError):
+            pass
+
+        index = cls.build(video_path, progress)
+        try:
+            tmp_path = f"{index_path}.{os.getpid()}.tmp.npz"
+            np.savez(tmp_path, stamp=np.array(stamp, dtype=np.int64), fps=np.float64(index.fps),
+                     timestamps_ms=index.timestamps_ms)
+            os.replace(tmp_path, index_path)
+        except OSError:
+            # Only a cache, it is built again next time
+            pass
+        return index
+
+    @classmethod
+    def build(cls, video_path, progress=None):
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise OSError(f"Cannot open video {video_path}")
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+            estimate = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+            timestamps = []
+            # grab() demuxes and decodes but skips the conversion to BGR
+            while cap.grab():
+                timestamps.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+                if progress is not None and len(timestamps) % 500 == 0:
+                    progress(len(timestamps), max(estimate, len(timestamps)))
+        finally:
+            cap.release()
+        return cls(fps, np.array(timestamps, dtype=np.float64))
+
+
+class VideoSource:
+    """Frames of a video file, decoded on demand without extracting them to JPEG.
+
+    Frames are named like the files video2images would write, ``<video>_<frame>.jpg``,
+    and their labels are stored under that name in a folder next to the video, so
+    labels are keyed by frame number. Decoded frames live in an LRU cache; the
+    frames after the current one are decoded in the background, which for a video
+    is a cheap sequential read. export() materializes only the annotated frames.
+    """
+
+    is_video = True
+
+    def __init__(self, video_path, cache=None, prefetch_frames=4, progress=None):
+        self.video_path = video_path
+        self.stem = os.path.splitext(os.path.basename(video_path))[0]
+        self.label_folder = label_folder_for(video_path)
+        os.makedirs(self.label_folder, exist_ok=True)
+        self.index = FrameIndex.load_or_build(video_path, os.path.join(self.label_folder, FRAME_INDEX_FILENAME),
+                                              progress)
+        self.cache = cache if cache is not None else ImageCache(max_bytes=256 * 1024 * 1024)
+        self.prefetch_frames = prefetch_frames
+
+        self._cap = cv2.VideoCapture(video_path)
+        self._position = 0  # Number of the frame the next read() returns
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="frame-prefetch")
+        self._prefetching = None
+
+    def names(self):
+        return [self.frame_name(number) for number in range(len(self.index))]
+
+    def frame_name(self, number):
+        return f"{self.stem}_{number:06d}.jpg"
+
+    @staticmethod
+    def frame_number(name):
+        return int(FRAME_NAME.search(name).group(1))
+
+    def image_key(self, name):
+        return f"{self.video_path}#{self.frame_number(name)}"
+
+    def timestamp(self, name):
+        """Presentation time of a frame in seconds"""
+        return self.index.timestamps_ms[self.frame_number(name)] / 1000.0
+
+    def frame(self, number):
+        """Full resolution RGB frame as a PIL image"""
+        key = ('frame', self.video_path, number)
+        img = self.cache.get(key)
+        if img is None:
+            with self._lock, span("video.decode"):
+                bgr = self._read(number)
+            if bgr is None:
+                raise OSError(f"Cannot decode frame {number} of {self.video_path}")
+            img = Image.fromarray(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+            self.cache.put(key, img, img.width * img.height * 3)
+        return img
+
+    def get_image(self, name, canvas_size):
+        number = self.frame_number(name)
+        key = ('image', self.video_path, number, canvas_size)
+        value = self.cache.get(key)
+        if value is None:
+            img = self.frame(number)
+            with span("image.decode_resize"):
+                resized = img.resize(fit_size(img.size, canvas_size), Image.Resampling.LANCZOS)
+            value = (img.size, resized)
+            self.cache.put(key, value, resized.width * resized.height * 3)
+        return value
+
+    def peek_image(self, name, canvas_size):
+        return self.cache.get(('image', self.video_path, self.frame_number(name), canvas_size))
+
+    def preview_image(self, name, canvas_size):
+        number = self.frame_number(name)
+        key = ('preview', self.video_path, number, canvas_size)
+        value = self.cache.get(key)
+        if value is None:
+            img = self.frame(number)
+            with span("image.preview"):
+                preview = img.resize(fit_size(img.size, canvas_size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+            value = (img.size, preview)
+            self.cache.put(key, value, preview.width * preview.height * 3)
+        return value
+
+    def request_image(self, name, canvas_size):
+        """Resize a frame for get_image on the prefetch thread"""
+        if self.peek_image(name, canvas_size) is None:
+            self._executor.submit(self.get_image, name, canvas_size)
+
+    def pyramid(self, name, cache):
+        return ImagePyramid(self.image_key(name), cache, image=self.frame(self.frame_number(name)))
+
+    def model_input(self, name):
+        # Ultralytics takes BGR arrays like the ones cv2.imread returns
+        return cv2.cvtColor(np.asarray(self.frame(self.frame_number(name))), cv2.COLOR_RGB2BGR)
+
+    def content_hash(self, name):
+        """Hash of the decoded frame, a frame has no file of its own"""
+        return array_hash(np.asarray(self.frame(self.frame_number(name))))
+
+    def gray(self, name, max_side=TRACKING_MAX_SIDE):
+        return reduce_to_gray(self.frame(self.frame_number(name)), max_side)
+
+    def prefetch(self, names, canvas_size):
+        """Decode the next frames in the background, frames behind the current one stay cached"""
+        numbers = sorted(self.frame_number(name) for name in names)
+        ahead = [number for number in numbers if number >= self._position][:self.prefetch_frames]
+        if not ahead or (self._prefetching is not None and not self._prefetching.done()):
+            return
+        self._prefetching = self._executor.submit(self._prefetch, ahead, canvas_size)
+
+    def export(self, dest_folder, progress=None):
+        """Write every frame that has polygons as JPEG with its label file into dest_folder.
+
+        Returns the number of exported frames.
+        """
+        os.makedirs(dest_folder, exist_ok=True)
+        numbers = []
+        for number in range(len(self.index)):
+            label_path = label_path_for(self.label_folder, self.frame_name(number))
+            stamp = file_stamp(label_path)
+            if stamp is not None and stamp[1] > 0:
+                numbers.append(number)
+
+        for done, number in enumerate(numbers, 1):
+            name = self.frame_name(number)
+            # Ascending frame numbers keep the decoder reading forward
+            with self._lock:
+                bgr = self._read(number)
+            if bgr is None:
+                raise OSError(f"Cannot decode frame {number} of {self.video_path}")
+            if not cv2.imwrite(os.path.join(dest_folder, name), bgr):
+                raise OSError(f"Cannot write {name} to {dest_folder}")
+            shutil.copyfile(label_path_for(self.label_folder, name), label_path_for(dest_folder, name))
+            if progress is not None:
+                progress(done, len(numbers))
+        return len(numbers)
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            self._cap.release()
+
+    def _prefetch(self, numbers, canvas_size):
+        for number in numbers:
+            try:
+                self.get_image(self.frame_name(number), canvas_size)
+            except OSError:
+                return
+
+    def _read(self, number):
+        """Decode one frame as BGR array, the caller holds self._lock"""
+        if not 0 <= number < len(self.index):
+            return None
+        if number < self._position or number - self._position > SEEK_THRESHOLD:
+            if not self._seek(number):
+                return None
+
+        # Grab up to and including the target, only the target is converted to BGR
+        while self._position <= number:
+            if not self._cap.grab():
+                self._position = len(self.index)
+                return None
+            self._position += 1
+
+        ret, frame = self._cap.retrieve()
+        if not ret:
+            return None
+        return frame
+
+    def _seek(self, number):
+        """Leave the decoder on a grabbed frame at or before `number`, self._position is the next frame.
+
+        CAP_PROP_POS_FRAMES is not frame accurate in every container, so the
+        frame a seek landed on is identified by its timestamp in the index. A
+        seek that overshoots is retried further back, down to the first frame.
+        """
+        for backoff in SEEK_BACKOFFS + (number,):
+            target = max(0, number - backoff)
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            if not self._cap.grab():
+                continue
+            landed = self.index.frame_at(self._cap.get(cv2.CAP_PROP_POS_MSEC))
+            if landed <= number:
+                self._position = landed + 1
+                return True
+        self._position = len(self.index)
+        return False
+
+
+def open_source(path, prefetcher, progress=None):
+    """FolderSource for a folder of images, VideoSource for a video file"""
+    if is_video(path):
+        return VideoSource(path, progress=progress)
+    return FolderSource(path, prefetcher)
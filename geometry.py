@@ -0,0 +1,183 @@
+import heapq
+
+import numpy as np
+
+
+def segment_distances(points, start, end):
+    """Distances of an (N, 2) array of points to the segment start-end"""
+    segment = end - start
+    length_sq = float(segment @ segment)
+    offsets = points - start
+    if length_sq == 0.0:
+        return np.hypot(offsets[:, 0], offsets[:, 1])
+
+    t = np.clip(offsets @ segment / length_sq, 0.0, 1.0)
+    closest = start + t[:, None] * segment
+    diff = points - closest
+    return np.hypot(diff[:, 0], diff[:, 1])
+
+
+def douglas_peucker(points, tolerance):
+    """Boolean mask of the vertices kept by Douglas-Peucker simplification of an open polyline.
+
+    Each split step measures all points between the two anchors at once.
+    """
+    count = len(points)
+    keep = np.zeros(count, dtype=bool)
+    if count == 0:
+        return keep
+    keep[0] = keep[-1] = True
+
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        distances = segment_distances(points[start + 1:end], points[start], points[end])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def visvalingam(points, max_vertices, closed=False):
+    """Indices of the vertices left after removing the least significant ones down to max_vertices.
+
+    A vertex's significance is the area of the triangle it forms with its neighbours (Visvalingam-Whyatt).
+    The endpoints of an open polyline are always kept.
+    """
+    count = len(points)
+    if count <= max_vertices:
+        return np.arange(count)
+
+    prev = np.arange(count) - 1
+    nxt = np.arange(count) + 1
+    if closed:
+        prev[0] = count - 1
+        nxt[-1] = 0
+    removed = np.zeros(count, dtype=bool)
+
+    def area(i):
+        ax, ay = points[prev[i]]
+        bx, by = points[i]
+        cx, cy = points[nxt[i]]
+        return abs((bx - ax) * (cy - ay) - (cx - ax) * (by - ay)) / 2
+
+    candidates = range(count) if closed else range(1, count - 1)
+    heap = [(area(i), i) for i in candidates]
+    heapq.heapify(heap)
+
+    remaining = count
+    while remaining > max_vertices and heap:
+        value, i = heapq.heappop(heap)
+        if removed[i]:
+            continue
+        current = area(i)
+        if current > value:
+            # Neighbours changed since this entry was pushed
+            heapq.heappush(heap, (current, i))
+            continue
+
+        removed[i] = True
+        remaining -= 1
+        before, after = prev[i], nxt[i]
+        nxt[before] = after
+        prev[after] = before
+        for j in (before, after):
+            if closed or 0 < j < count - 1:
+                heapq.heappush(heap, (area(j), j))
+
+    return np.flatnonzero(~removed)
+
+
+def simplify_polyline(points, tolerance=1.0, max_vertices=None, closed=False):
+    """Simplify an (N, 2) polyline with a distance tolerance and an optional vertex budget.
+
+    Douglas-Peucker removes vertices closer than tolerance to the simplified
+    line, then Visvalingam-Whyatt drops the least significant remaining ones
+    until at most max_vertices are left. A closed ring is handled by repeating
+    its first point while simplifying.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) <= 3:
+        return points.copy()
+
+    if closed:
+        ring = np.vstack([points, points[:1]])
+        simplified = ring[douglas_peucker(ring, tolerance)][:-1]
+    else:
+        simplified = points[douglas_peucker(points, tolerance)]
+
+    if max_vertices is not None and len(simplified) > max_vertices:
+        simplified = simplified[visvalingam(simplified, max(3, max_vertices), closed)]
+    return simplified
+
+
+def simplify_points(points, tolerance=1.0, image_size=None, max_vertices=None, closed=False):
+    """Simplify a list of normalized (x, y) points with a tolerance given in image pixels"""
+    if len(points) <= 3:
+        return list(points)
+
+    scale = np.array(image_size if image_size is not None else (1, 1), dtype=np.float64)
+    simplified = simplify_polyline(np.asarray(points, dtype=np.float64) * scale, tolerance, max_vertices, closed)
+    return [tuple(point) for point in (simplified / scale).tolist()]
+
+
+def polygon_areas(vertices, offsets, counts):
+    """Shoelace areas of many polygons stored back to back in one (N, 2) vertex array.
+
+    Polygon i owns vertices[offsets[i]:offsets[i] + counts[i]], every count must
+    be positive. A ring closed by repeating its first point gives the same area.
+    """
+    if len(counts) == 0:
+        return np.zeros(0, dtype=np.float64)
+
+    offsets = np.asarray(offsets, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    index = np.repeat(offsets - (np.cumsum(counts) - counts), counts) + np.arange(int(counts.sum()))
+    # Every vertex's successor, wrapping from the last vertex of a polygon to its first
+    successor = index + 1
+    successor[np.cumsum(counts) - 1] = offsets
+
+    points = np.asarray(vertices, dtype=np.float64)
+    x, y = points[index, 0], points[index, 1]
+    cross = x * points[successor, 1] - points[successor, 0] * y
+    return 0.5 * np.abs(np.add.reduceat(cross, np.cumsum(counts) - counts))
+
+
+def self_intersects(points, chunk=256):
+    """Whether the edges of a closed polygon cross each other.
+
+    Every edge is tested against every non-adjacent edge at once with the
+    orientation test, in chunks of rows to bound memory. Edges that only touch
+    or overlap collinearly don't count as crossings.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    count = len(points)
+    if count < 4:
+        return False
+
+    start = points
+    end = np.roll(points, -1, axis=0)
+    direction = end - start
+    columns = np.arange(count)
+
+    def orientation(origin, vector, point):
+        return np.sign(vector[..., 0] * (point[..., 1] - origin[..., 1]) -
+                       vector[..., 1] * (point[..., 0] - origin[..., 0]))
+
+    for first in range(0, count, chunk):
+        rows = np.arange(first, min(first + chunk, count))
+        a, b, d = start[rows, None], end[rows, None], direction[rows, None]
+        crosses = ((orientation(a, d, start[None]) * orientation(a, d, end[None]) < 0) &
+                   (orientation(start[None], direction[None], a) * orientation(start[None], direction[None], b) < 0))
+        # Only pairs j > i + 1, the first and the last edge share a vertex as well
+        crosses &= columns[None] > rows[:, None] + 1
+        crosses[rows == 0, count - 1] = False
+        if crosses.any():
+            return True
+    return False
@@ -0,0 +1,281 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from band_decode import decode_reduced, reduce_factor
+from labels import read_labels
+from profiling import span
+
+# Pixel limit for opening an image, the app sets it as Image.MAX_IMAGE_PIXELS. PIL refuses twice this
+MAX_IMAGE_PIXELS = 500_000_000
+# Most pixels decoded at once, also the finest ImagePyramid level. draft() only downscales JPEGs,
+# other formats larger than this are decoded in reduced bands
+MAX_DECODE_PIXELS = 32_000_000
+# Band decodes run one at a time, so the prefetch workers never hold two large images at once
+_band_decode_lock = threading.Lock()
+
+
+def file_stamp(path):
+    """Return (mtime_ns, size) of a file, or None if it doesn't exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def fit_size(image_size, box_size):
+    """Largest size with the image aspect ratio that fits into box_size"""
+    img_width, img_height = image_size
+    box_width, box_height = box_size
+    img_ratio = img_width / img_height
+
+    if box_width / box_height > img_ratio:
+        # Box is wider than image
+        new_height = box_height
+        new_width = int(new_height * img_ratio)
+    else:
+        # Box is taller than image
+        new_width = box_width
+        new_height = int(new_width / img_ratio)
+
+    return max(1, new_width), max(1, new_height)
+
+
+def decode_within_budget(img, size, image_path):
+    """img itself if it decodes within MAX_DECODE_PIXELS, otherwise its pixels reduced to no less than size.
+
+    Call after draft(). Formats that can only be decoded whole are refused with OSError.
+    """
+    width, height = img.size
+    if width * height <= MAX_DECODE_PIXELS:
+        return img
+    with _band_decode_lock, span("image.decode_bands"):
+        reduced = decode_reduced(img, reduce_factor(img.size, size))
+    if reduced is None:
+        raise OSError(f"{os.path.basename(image_path)} is {width}x{height} pixels and its format can only be "
+                      f"decoded whole. Convert it to JPEG, PNG or uncompressed TIFF")
+    return reduced
+
+
+def decode_image(image_path, canvas_size):
+    """Open an image and resize it to fit canvas_size, returns (original_size, resized_image)"""
+    with span("image.open"):
+        img = Image.open(image_path)
+    with img:
+        original_size = img.size
+        new_size = fit_size(original_size, canvas_size)
+        # Let the JPEG decoder downscale by 1/2..1/8 while decoding instead of decoding full resolution
+        img.draft(img.mode, new_size)
+        # Pixels are decoded lazily, so this span holds both the decode and the LANCZOS resample
+        with span("image.decode_resize"):
+            resized = decode_within_budget(img, new_size, image_path).resize(new_size, Image.Resampling.LANCZOS)
+    return original_size, resized
+
+
+def decode_preview(image_path, canvas_size):
+    """Quick version of decode_image: integer reduce() steps, then a BILINEAR resize to the exact size"""
+    with Image.open(image_path) as img:
+        original_size = img.size
+        new_size = fit_size(original_size, canvas_size)
+        img.draft(img.mode, new_size)
+        with span("image.preview"):
+            preview = decode_within_budget(img, new_size, image_path).resize(
+                new_size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return original_size, preview
+
+
+class ImageCache:
+    """Thread-safe LRU cache bounded by the approximate memory use of its entries"""
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, nbytes, stamp)
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key, stamp=None):
+        """Return the cached value, or None if missing or its stamp doesn't match"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] != stamp:
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes, stamp=None):
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, nbytes, stamp)
+            self.current_bytes += nbytes
+
+            # Evict least recently used entries, but never the one just added
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, size, _) = self._entries.popitem(last=False)
+                self.current_bytes -= size
+
+    def discard(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+
+
+class ImagePrefetcher:
+    """Decodes and resizes neighbouring images and parses their labels in background threads"""
+
+    def __init__(self, cache=None, radius=2, workers=2):
+        self.cache = cache if cache is not None else ImageCache()
+        self.radius = radius
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._pending = {}  # cache key -> Future
+        self._lock = threading.Lock()
+
+    def get_image(self, image_path, canvas_size):
+        """Return (original_size, resized_image) for the image fitted into canvas_size"""
+        key = ('image', image_path, canvas_size)
+        stamp = file_stamp(image_path)
+        value = self.cache.get(key, stamp)
+        if value is None:
+            value = self._wait_pending(key)
+        if value is None:
+            value = self._load_image(image_path, canvas_size)
+        return value
+
+    def peek_image(self, image_path, canvas_size):
+        """get_image's result if it is already cached, otherwise None without waiting or decoding"""
+        return self.cache.get(('image', image_path, canvas_size), file_stamp(image_path))
+
+    def preview_image(self, image_path, canvas_size):
+        """Return (original_size, preview) fitted into canvas_size, resampled for speed rather than quality.
+
+        The preview is None unless draft() can decode the file at a reduced scale (JPEG) and no
+        decode of the full render is running yet, a second full decode would only compete with it.
+        """
+        key = ('preview', image_path, canvas_size)
+        stamp = file_stamp(image_path)
+        value = self.cache.get(key, stamp)
+        if value is None:
+            with self._lock:
+                in_flight = ('image', image_path, canvas_size) in self._pending
+            with Image.open(image_path) as img:
+                if in_flight or img.format != 'JPEG':
+                    return img.size, None
+            value = decode_preview(image_path, canvas_size)
+            preview = value[1]
+            self.cache.put(key, value, preview.width * preview.height * len(preview.getbands()), stamp)
+        return value
+
+    def request_image(self, image_path, canvas_size):
+        """Decode one image in the background for get_image, leaving the other prefetches alone"""
+        key = ('image', image_path, canvas_size)
+        with self._lock:
+            if key in self._pending or key in self.cache:
+                return
+            self._pending[key] = self._executor.submit(self._run, key, self._load_image, (image_path, canvas_size))
+
+    def get_labels(self, label_path):
+        """Return the parsed (class_id, points) list of a label file"""
+        key = ('labels', label_path)
+        stamp = file_stamp(label_path)
+        value = self.cache.get(key, stamp)
+        if value is None:
+            value = self._wait_pending(key)
+            # The file may have changed while the prefetch was running
+            if value is not None and file_stamp(label_path) != stamp:
+                value = None
+        if value is None:
+            value = self._load_labels(label_path)
+        return value
+
+    def prefetch(self, items, canvas_size):
+        """Schedule (image_path, label_path) pairs for decoding, nearest first.
+
+        Requests that are still queued but no longer wanted are cancelled.
+        """
+        wanted = set()
+        with self._lock:
+            for image_path, label_path in items:
+                jobs = (
+                    (('image', image_path, canvas_size), self._load_image, (image_path, canvas_size)),
+                    (('labels', label_path), self._load_labels, (label_path,)),
+                )
+                for key, loader, args in jobs:
+                    wanted.add(key)
+                    if key in self._pending or key in self.cache:
+                        continue
+                    self._pending[key] = self._executor.submit(self._run, key, loader, args)
+
+            for key, future in list(self._pending.items()):
+                if key not in wanted and future.cancel():
+                    del self._pending[key]
+
+    def shutdown(self):
+        with self._lock:
+            self._pending.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, key, loader, args):
+        try:
+            return loader(*args)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _wait_pending(self, key):
+        with self._lock:
+            future = self._pending.get(key)
+        if future is None or future.cancelled():
+            return None
+        return future.result()
+
+    def _load_image(self, image_path, canvas_size):
+        stamp = file_stamp(image_path)
+        original_size, resized = decode_image(image_path, canvas_size)
+        value = (original_size, resized)
+        nbytes = resized.width * resized.height * len(resized.getbands())
+        self.cache.put(('image', image_path, canvas_size), value, nbytes, stamp)
+        return value
+
+    def _load_labels(self, label_path):
+        stamp = file_stamp(label_path)
+        labels = read_labels(label_path)
+        # Rough size of the parsed labels, one small array per polygon
+        nbytes = 64 + sum(150 + points.nbytes for _, points in labels)
+        self.cache.put(('labels', label_path), labels, nbytes, stamp)
+        return labels
@@ -0,0 +1,142 @@
+import math
+
+from PIL import Image
+
+from image_cache import MAX_DECODE_PIXELS, ImageCache, decode_within_budget
+
+
+class ImagePyramid:
+    """Lazily built multi-resolution levels of one image, rendered tile by tile for the visible region.
+
+    Level ``k`` is the image downscaled by ``2 ** k``. The finest level that is
+    ever decoded is the first one within ``max_level_pixels``, so memory stays
+    bounded for very large sources. JPEGs are downscaled by the decoder itself
+    (``draft``), other formats are decoded in reduced bands, so neither is
+    materialized at full resolution. Zooming past that level upsamples it.
+    Levels and resized tiles live in a shared memory-bounded cache and are
+    rebuilt on demand after eviction.
+
+    An already decoded ``image`` (e.g. a video frame) can be passed instead of a
+    file, ``image_path`` is then only the cache key.
+    """
+
+    def __init__(self, image_path, cache=None, max_level_pixels=MAX_DECODE_PIXELS, tile_size=512, image=None):
+        self.image_path = image_path
+        self.cache = cache if cache is not None else ImageCache(max_bytes=384 * 1024 * 1024)
+        self.tile_size = tile_size
+        self.image = image
+
+        if image is not None:
+            self.size = image.size
+        else:
+            with Image.open(image_path) as img:
+                self.size = img.size
+
+        img_width, img_height = self.size
+        self.base_level = 0
+        while (math.ceil(img_width / 2 ** self.base_level) *
+               math.ceil(img_height / 2 ** self.base_level)) > max_level_pixels:
+            self.base_level += 1
+
+    def level_for_scale(self, scale):
+        """Coarsest level that still has at least `scale` pixels per image pixel"""
+        level = self.base_level
+        while scale <= 0.5 ** (level + 1) and min(self.level_size(level + 1)) > 1:
+            level += 1
+        return level
+
+    def level_size(self, level):
+        factor = 2 ** level
+        return math.ceil(self.size[0] / factor), math.ceil(self.size[1] / factor)
+
+    def level_image(self, level):
+        key = ('level', self.image_path, level)
+        img = self.cache.get(key)
+        if img is None:
+            if level == self.base_level:
+                img = self._decode_base()
+            else:
+                img = self.level_image(level - 1).reduce(2)
+            self.cache.put(key, img, img.width * img.height * len(img.getbands()))
+        return img
+
+    def render(self, scale, origin, canvas_size):
+        """Compose the visible part of the image at the given scale.
+
+        Returns (image, (x, y)) with the canvas position of the composed image,
+        or (None, None) if the image is not visible.
+        """
+        img_width, img_height = self.size
+        canvas_width, canvas_height = canvas_size
+        origin_x, origin_y = origin
+
+        # Visible canvas rectangle covered by the image
+        cx0 = max(0, int(math.floor(origin_x)))
+        cy0 = max(0, int(math.floor(origin_y)))
+        cx1 = min(canvas_width, int(math.ceil(origin_x + img_width * scale)))
+        cy1 = min(canvas_height, int(math.ceil(origin_y + img_height * scale)))
+        if cx1 <= cx0 or cy1 <= cy0:
+            return None, None
+
+        level = self.level_for_scale(scale)
+        level_width, level_height = self.level_size(level)
+        # Canvas pixels per level pixel
+        factor_x = scale * img_width / level_width
+        factor_y = scale * img_height / level_height
+
+        # Visible rectangle in level pixels
+        lx0 = max(0, int((cx0 - origin_x) / factor_x))
+        ly0 = max(0, int((cy0 - origin_y) / factor_y))
+        lx1 = min(level_width, int(math.ceil((cx1 - origin_x) / factor_x)))
+        ly1 = min(level_height, int(math.ceil((cy1 - origin_y) / factor_y)))
+
+        # Keep resized tiles at a few hundred canvas pixels whatever the zoom
+        tile = max(32, int(self.tile_size / max(factor_x, 1.0)))
+        # Panning only shifts the origin by whole pixels, so the sub-pixel phase keeps tiles reusable
+        phase = (round(origin_x % 1, 3), round(origin_y % 1, 3))
+
+        composed = None
+        for ty in range(ly0 // tile, (ly1 - 1) // tile + 1):
+            for tx in range(lx0 // tile, (lx1 - 1) // tile + 1):
+                box = (tx * tile, ty * tile,
+                       min((tx + 1) * tile, level_width), min((ty + 1) * tile, level_height))
+                # Edges are rounded the same way for neighbouring tiles so there are no gaps
+                left = int(round(origin_x + box[0] * factor_x))
+                top = int(round(origin_y + box[1] * factor_y))
+                right = int(round(origin_x + box[2] * factor_x))
+                bottom = int(round(origin_y + box[3] * factor_y))
+                if right <= left or bottom <= top:
+                    continue
+
+                key = ('tile', self.image_path, level, tile, tx, ty, round(scale, 9), phase)
+                tile_img = self.cache.get(key)
+                if tile_img is None:
+                    tile_img = self.level_image(level).crop(box).resize(
+                        (right - left, bottom - top), Image.Resampling.LANCZOS)
+                    self.cache.put(key, tile_img, tile_img.width * tile_img.height * len(tile_img.getbands()))
+
+                if composed is None:
+                    composed = Image.new(tile_img.mode, (cx1 - cx0, cy1 - cy0))
+                composed.paste(tile_img, (left - cx0, top - cy0))
+
+        if composed is None:
+            return None, None
+        return composed, (cx0, cy0)
+
+    def _decode_base(self):
+        target = self.level_size(self.base_level)
+        if self.image is not None:
+            factor = 2 ** self.base_level
+            return self.image.reduce(factor) if factor > 1 else self.image
+
+        with Image.open(self.image_path) as source:
+            # JPEG decodes directly at 1/2, 1/4 or 1/8 scale, other formats ignore the request
+            source.draft(source.mode, target)
+            img = decode_within_budget(source, target, self.image_path)
+            if img.mode not in ('RGB', 'RGBA', 'L'):
+                img = img.convert('RGB')
+
+            factor = max(1, round(img.width / target[0]))
+            if factor > 1:
+                return img.reduce(factor)
+            return img.copy() if img is source else img
@@ -0,0 +1,148 @@
+import argparse
+import os
+import shutil
+import time
+from collections import deque
+
+import numpy as np
+
+from inference_cache import file_hash
+
+BACKENDS = ('pytorch', 'onnx', 'openvino', 'openvino-int8')
+
+
+def exported_path(weights, backend):
+    """Where the model exported for a backend lives next to the weights"""
+    stem = os.path.splitext(weights)[0]
+    if backend == 'pytorch':
+        return weights
+    if backend == 'onnx':
+        return stem + ".onnx"
+    if backend == 'openvino':
+        return stem + "_openvino_model"
+    if backend == 'openvino-int8':
+        return stem + "_int8_openvino_model"
+    raise ValueError(f"Unknown backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+
+def export_model(weights, backend, imgsz=640, data="dataset.yaml"):
+    """Export the weights for a backend, int8 quantization is calibrated on the dataset in `data`"""
+    from ultralytics import YOLO
+
+    target = exported_path(weights, backend)
+    if backend == 'pytorch':
+        return target
+
+    model = YOLO(weights)
+    if backend == 'onnx':
+        exported = model.export(format='onnx', imgsz=imgsz, simplify=True)
+    elif backend == 'openvino':
+        exported = model.export(format='openvino', imgsz=imgsz)
+    else:
+        exported = model.export(format='openvino', imgsz=imgsz, int8=True, data=data)
+
+    exported = str(exported)
+    if os.path.abspath(exported) != os.path.abspath(target):
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        os.replace(exported, target)
+    return target
+
+
+class ModelBackend:
+    """A YOLO segmentation model served by PyTorch, ONNX Runtime or OpenVINO on CPU.
+
+    Exported models are loaded through ultralytics as well, so every backend
+    returns the same Results objects and auto_annotate works unchanged. The
+    ultralytics/torch import happens here and not when the app starts. Calls are
+    timed, latency() summarizes the recent ones.
+    """
+
+    def __init__(self, weights, backend='pytorch', device='cpu', history=200):
+        from ultralytics import YOLO
+
+        path = exported_path(weights, backend)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found, export it with: python inference_backends.py export "
+                                    f"{weights} --backend {backend}")
+        self.backend = backend
+        self.device = device
+        self.model = YOLO(path, task='segment')
+        self.names = self.model.names
+        # Identifies the weights in the inference result cache
+        self.weights_hash = file_hash(path)
+        self.latencies_ms = deque(maxlen=history)
+
+    def __call__(self, source, **kwargs):
+        return self.predict(source, **kwargs)
+
+    def predict(self, source, **kwargs):
+        kwargs.setdefault('device', self.device)
+        start = time.perf_counter()
+        results = self.model.predict(source, **kwargs)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        # Batched calls count as one sample per image
+        count = len(source) if isinstance(source, (list, tuple)) else 1
+        self.latencies_ms.extend([elapsed_ms / count] * count)
+        return results
+
+    def last_latency(self):
+        """Milliseconds per image of the last call, or None"""
+        return self.latencies_ms[-1] if self.latencies_ms else None
+
+    def latency(self):
+        """Return (mean, p50, p95) milliseconds per image over the recent calls"""
+        if not self.latencies_ms:
+            return None
+        values = np.array(self.latencies_ms)
+        return float(values.mean()), float(np.percentile(values, 50)), float(np.percentile(values, 95))
+
+
+def benchmark(weights, backends, images, runs=20, warmup=3, imgsz=640):
+    """Measure per-image latency of every available backend on the same images"""
+    for backend in backends:
+        try:
+            model = ModelBackend(weights, backend)
+        except (FileNotFoundError, ImportError) as e:
+            print(f"{backend:>14}: skipped ({e})")
+            continue
+
+        for i in range(warmup):
+            model(images[i % len(images)], imgsz=imgsz, verbose=False)
+        model.latencies_ms.clear()
+        for i in range(runs):
+            model(images[i % len(images)], imgsz=imgsz, verbose=False)
+
+        mean, p50, p95 = model.latency()
+        print(f"{backend:>14}: mean {mean:.1f} ms | p50 {p50:.1f} ms | p95 {p95:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the segmentation model for CPU backends and compare them")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export weights for a backend")
+    export_parser.add_argument("weights", nargs="?", default="best.pt", help="Model weights")
+    export_parser.add_argument("--backend", choices=BACKENDS[1:], action="append",
+                               help="Backend to export for, can be repeated (default: all)")
+    export_parser.add_argument("--imgsz", type=int, default=640, help="Input size")
+    export_parser.add_argument("--data", default="dataset.yaml", help="Dataset used to calibrate int8")
+
+    bench_parser = subparsers.add_parser("bench", help="Report latency per backend")
+    bench_parser.add_argument("weights", help="Model weights")
+    bench_parser.add_argument("images", nargs="+", help="Images to run on")
+    bench_parser.add_argument("--backend", choices=BACKENDS, action="append",
+                              help="Backend to measure, can be repeated (default: all)")
+    bench_parser.add_argument("--runs", type=int, default=20, help="Timed runs per backend")
+    bench_parser.add_argument("--imgsz", type=int, default=640, help="Input size")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        for backend in args.backend or BACKENDS[1:]:
+            print(f"{backend}: {export_model(args.weights, backend, args.imgsz, args.data)}")
+    else:
+        benchmark(args.weights, args.backend or BACKENDS, args.images, args.runs, imgsz=args.imgsz)
+
+
+if __name__ == "__main__":
+    main()
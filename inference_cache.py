@@ -0,0 +1,139 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+CACHE_DIRNAME = ".markup_inference"
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """Content hash of a file, or of every file below a directory (exported OpenVINO models)"""
+    digest = hashlib.blake2b(digest_size=16)
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                digest.update(os.path.relpath(os.path.join(root, name), path).encode())
+                digest.update(bytes.fromhex(file_hash(os.path.join(root, name))))
+        return digest.hexdigest()
+
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def array_hash(array):
+    """Content hash of decoded pixels, e.g. a video frame that has no file of its own"""
+    array = np.ascontiguousarray(array)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str((array.shape, array.dtype.str)).encode())
+    digest.update(memoryview(array).cast('B'))
+    return digest.hexdigest()
+
+
+class InferenceCache:
+    """Raw model predictions on disk, keyed by image content hash and weights hash.
+
+    Entries hold the unfiltered output of result_to_arrays (mask contours,
+    class ids, confidences, image shape), so any confidence threshold or class
+    count can be applied later without running the model again. Each entry is
+    one .npz in a folder next to the labels, written through a rename. Reading
+    an entry refreshes its mtime, and the least recently used entries are deleted
+    once the folder grows past max_bytes.
+    """
+
+    def __init__(self, folder, max_bytes=512 * 1024 * 1024):
+        self.path = os.path.join(folder, CACHE_DIRNAME)
+        self.max_bytes = max_bytes
+        self.current_bytes = None  # Summed on the first put()
+        self._lock = threading.Lock()
+
+    def entry_path(self, image_hash, model_hash):
+        return os.path.join(self.path, f"{model_hash[:16]}_{image_hash}.npz")
+
+    def get(self, image_hash, model_hash):
+        """Return (contours, class_ids, confidences, orig_shape), or None if not cached"""
+        path = self.entry_path(image_hash, model_hash)
+        try:
+            with np.load(path) as data:
+                vertices = data['vertices']
+                lengths = data['lengths']
+                arrays = (np.split(vertices, np.cumsum(lengths)[:-1]) if len(lengths) else [],
+                          data['class_ids'], data['confidences'], tuple(data['orig_shape'].tolist()))
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            return None
+        return arrays
+
+    def put(self, image_hash, model_hash, arrays):
+        contours, class_ids, confidences, orig_shape = arrays
+        path = self.entry_path(image_hash, model_hash)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            np.savez(tmp_path,
+                     vertices=(np.concatenate(contours).astype(np.float32, copy=False).reshape(-1, 2)
+                               if len(contours) else np.empty((0, 2), dtype=np.float32)),
+                     lengths=np.array([len(contour) for contour in contours], dtype=np.int64),
+                     class_ids=np.asarray(class_ids, dtype=np.int64),
+                     confidences=np.asarray(confidences, dtype=np.float32),
+                     orig_shape=np.array(orig_shape, dtype=np.int64))
+            # An entry written again replaces its old file, only the difference adds to the total
+            try:
+                old_size = os.path.getsize(path)
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path) - old_size
+        except OSError:
+            # Only a cache, the model runs again next time
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            if self.current_bytes is None:
+                self.current_bytes = self._total_bytes()
+            else:
+                self.current_bytes += size
+            if self.current_bytes > self.max_bytes:
+                self._evict()
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries():
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+            self.current_bytes = 0
+
+    def _entries(self):
+        try:
+            with os.scandir(self.path) as entries:
+                return [entry for entry in entries if entry.name.endswith('.npz') and '.tmp' not in entry.name]
+        except OSError:
+            return []
+
+    def _total_bytes(self):
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def _evict(self):
+        # Oldest first until a quarter below the limit, so eviction doesn't run on every put
+        entries = sorted(((entry.stat().st_mtime_ns, entry.stat().st_size, entry.path) for entry in self._entries()))
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 3 // 4
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self.current_bytes = total
@@ -0,0 +1,204 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from auto_annotate import result_to_arrays
+from profiling import span
+
+# Lowest threshold of the confidence slider, raw predictions are kept down to it
+MIN_CONF = 0.05
+
+
+def infer_arrays(model, model_input, conf=MIN_CONF):
+    """Run the model on one image and return the (contours, class_ids, confidences, orig_shape) above conf.
+
+    conf only has to be as low as any threshold applied later, ultralytics would
+    drop everything under its default of 0.25 otherwise.
+    """
+    result = model(model_input, conf=conf, verbose=False)[0]
+    arrays = result_to_arrays(result)
+    if arrays is None:
+        # No masks at all, nothing was detected
+        return [], np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), tuple(result.orig_shape)
+    return arrays
+
+
+def predictions_key(weights_hash, conf=MIN_CONF):
+    """Identifies the predictions of a model run with a confidence floor in the disk cache"""
+    return hashlib.blake2b(f"{weights_hash}:{conf}".encode(), digest_size=16).hexdigest()
+
+
+class InferenceJob:
+    """One queued model run.
+
+    make_input and make_hash are called on the worker thread to load the image
+    and hash its contents for the disk cache.
+    """
+
+    def __init__(self, key, make_input, make_hash=None, speculative=False):
+        self.key = key
+        self.make_input = make_input
+        self.make_hash = make_hash
+        self.speculative = speculative
+        self.cancelled = False
+        self.result = None
+        self.error = None
+        self.latency_ms = None  # Model time, None for results served from a cache
+        self._done = threading.Event()
+
+    def done(self):
+        return self._done.is_set()
+
+    def cancel(self):
+        """Skip the job if it hasn't started, a running forward pass still finishes but nobody waits for it"""
+        self.cancelled = True
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self._done.set()
+
+
+class InferenceWorker:
+    """Runs a model on a background thread so the UI never waits for a forward pass.
+
+    Jobs requested by the user go to the front of the queue, speculative jobs
+    for images the user is likely to open next go to the back and are dropped
+    once they are no longer wanted. Results are the raw predictions of an image,
+    filtering by confidence and class is left to the caller. They are kept in a
+    small LRU and, when a disk cache is given, stored there by image content
+    hash, weights hash and confidence floor, so the model only runs for images
+    it has never seen.
+    The caller polls job.done(), e.g. from root.after.
+    """
+
+    def __init__(self, model, disk_cache=None, max_results=32):
+        self.model = model
+        self.model_key = predictions_key(model.weights_hash)
+        self.disk_cache = disk_cache
+        self.max_results = max_results
+        self._results = OrderedDict()  # key -> arrays
+        self._queue = deque()
+        self._jobs = {}  # key -> queued or running job
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="inference", daemon=True)
+        self._thread.start()
+
+    def request(self, key, make_input, make_hash=None):
+        """Job for an image the user asked for, ahead of every speculative job"""
+        with self._lock:
+            job = self._finished_job(key, make_input, make_hash)
+            if job is not None:
+                return job
+
+            job = self._jobs.get(key)
+            if job is not None and not job.cancelled:
+                if job.speculative:
+                    job.speculative = False
+                    if job in self._queue:
+                        self._queue.remove(job)
+                        self._queue.appendleft(job)
+                return job
+
+            job = InferenceJob(key, make_input, make_hash)
+            self._jobs[key] = job
+            self._queue.appendleft(job)
+            self._wake.notify()
+            return job
+
+    def speculate(self, items):
+        """Queue (key, make_input, make_hash) items behind the user's jobs, cancelling speculative jobs not among them"""
+        wanted = {key for key, _, _ in items}
+        with self._lock:
+            for job in list(self._queue):
+                if job.speculative and job.key not in wanted:
+                    job.cancel()
+                    self._queue.remove(job)
+                    del self._jobs[job.key]
+
+            for key, make_input, make_hash in items:
+                if key in self._results or key in self._jobs:
+                    continue
+                job = InferenceJob(key, make_input, make_hash, speculative=True)
+                self._jobs[key] = job
+                self._queue.append(job)
+            self._wake.notify()
+
+    def cancel(self, job):
+        with self._lock:
+            job.cancel()
+            if job in self._queue:
+                self._queue.remove(job)
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+
+    def close(self):
+        """Stop the worker, every pending job is cancelled and queued ones finish with an error right away"""
+        with self._lock:
+            self._closed = True
+            for job in self._jobs.values():
+                job.cancel()
+            queued = list(self._queue)
+            self._queue.clear()
+            self._jobs.clear()
+            self._wake.notify()
+        for job in queued:
+            job.finish(error=RuntimeError("Inference worker was closed"))
+
+    def _finished_job(self, key, make_input, make_hash):
+        if key not in self._results:
+            return None
+        self._results.move_to_end(key)
+        job = InferenceJob(key, make_input, make_hash)
+        job.finish(result=self._results[key])
+        return job
+
+    def _infer(self, job):
+        image_hash = None
+        if self.disk_cache is not None and job.make_hash is not None:
+            image_hash = job.make_hash()
+            arrays = self.disk_cache.get(image_hash, self.model_key)
+            if arrays is not None:
+                return arrays
+
+        with span("inference.load_input"):
+            model_input = job.make_input()
+        start = time.perf_counter()
+        with span("inference.model"):
+            arrays = infer_arrays(self.model, model_input)
+        job.latency_ms = (time.perf_counter() - start) * 1000.0
+
+        if image_hash is not None:
+            self.disk_cache.put(image_hash, self.model_key, arrays)
+        return arrays
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._closed:
+                    self._wake.wait()
+                if self._closed:
+                    return
+                job = self._queue.popleft()
+
+            try:
+                result = self._infer(job)
+            except Exception as e:
+                with self._lock:
+                    if self._jobs.get(job.key) is job:
+                        del self._jobs[job.key]
+                job.finish(error=e)
+                continue
+
+            with self._lock:
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+                self._results[job.key] = result
+                while len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+            job.finish(result=result)
@@ -0,0 +1,323 @@
+import argparse
+import json
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from dataset_index import scan_folder
+from labels import LabelList, read_labels
+
+CACHE_FILENAME = ".markup_labels.bin"
+MAGIC = b"MKLABEL1"
+ALIGNMENT = 64
+CHUNK_SIZE = 512
+MISSING_STAMP = (-1, -1)  # Stamp of an image without a label file
+
+
+def parse_label_files(paths):
+    """Parse label files into (polygons per file, class ids, vertices per polygon, vertices,
+    unparseable lines per file) arrays"""
+    per_file = []
+    class_ids = []
+    counts = []
+    vertices = []
+    skipped = []
+    for path in paths:
+        try:
+            labels = read_labels(path)
+        except (OSError, UnicodeDecodeError):
+            labels = LabelList()
+        per_file.append(len(labels))
+        skipped.append(labels.skipped)
+        for class_id, points in labels:
+            class_ids.append(class_id)
+            counts.append(len(points))
+            vertices.append(points)
+
+    return (np.array(per_file, dtype=np.int64),
+            np.array(class_ids, dtype=np.int32),
+            np.array(counts, dtype=np.int64),
+            np.concatenate(vertices) if vertices else np.empty((0, 2), dtype=np.float32),
+            np.array(skipped, dtype=np.int64))
+
+
+def parse_in_parallel(paths, workers=None, progress=None):
+    """parse_label_files over many files, chunks are parsed in a process pool"""
+    chunks = [paths[start:start + CHUNK_SIZE] for start in range(0, len(paths), CHUNK_SIZE)]
+    workers = workers or os.cpu_count() or 1
+    if len(chunks) <= 1 or workers == 1:
+        parsed = map(parse_label_files, chunks)
+        results = []
+        for done, result in enumerate(parsed, 1):
+            results.append(result)
+            if progress is not None:
+                progress(min(done * CHUNK_SIZE, len(paths)), len(paths))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = []
+            for done, result in enumerate(pool.map(parse_label_files, chunks), 1):
+                results.append(result)
+                if progress is not None:
+                    progress(min(done * CHUNK_SIZE, len(paths)), len(paths))
+
+    if not results:
+        return parse_label_files([])
+    return tuple(np.concatenate(arrays) for arrays in zip(*results))
+
+
+def gather_slices(starts, counts):
+    """Indices of the concatenation of the ranges [start, start + count)"""
+    total = int(counts.sum())
+    return np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(total)
+
+
+class LabelCache:
+    """Consolidated binary copy of all label files of a folder.
+
+    One file next to the images holds a JSON header with the image names and
+    the raw arrays: per-image label stamps and polygon ranges, per-polygon class
+    ids and vertex ranges, and a single float32 vertex buffer. The arrays are
+    memory-mapped, so reading an image's polygons is a slice without parsing or
+    copying. sync() re-parses only the label files whose mtime or size changed
+    and writes a new cache file atomically.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, CACHE_FILENAME)
+        self._load()
+
+    def _reset(self):
+        self.names = []
+        self.positions = {}
+        self.stamps = np.empty((0, 2), dtype=np.int64)
+        self.image_first = np.empty(0, dtype=np.int64)
+        self.image_count = np.empty(0, dtype=np.int64)
+        self.polygon_class = np.empty(0, dtype=np.int32)
+        self.polygon_offset = np.empty(0, dtype=np.int64)
+        self.polygon_count = np.empty(0, dtype=np.int64)
+        self.vertices = np.empty((0, 2), dtype=np.float32)
+        self.image_skipped = np.empty(0, dtype=np.int64)
+
+    def _load(self):
+        self._reset()
+        try:
+            with open(self.path, 'rb') as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    return
+                header_size, = struct.unpack('<Q', f.read(8))
+                header = json.loads(f.read(header_size))
+        except (OSError, ValueError, struct.error):
+            # Missing or unreadable, the next sync() builds it from scratch
+            return
+
+        if 'image_skipped' not in header['arrays']:
+            # Written before unparseable lines were counted, the next sync() parses everything again
+            return
+
+        for name, spec in header['arrays'].items():
+            shape = tuple(spec['shape'])
+            if 0 in shape:
+                array = np.empty(shape, dtype=spec['dtype'])
+            else:
+                array = np.memmap(self.path, dtype=spec['dtype'], mode='r', offset=spec['offset'], shape=shape)
+            setattr(self, name, array)
+        self.names = header['names']
+        self.positions = {name: position for position, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def stamp(self, name):
+        """Label stamp (mtime_ns, size) the cached polygons of an image were read from"""
+        return tuple(self.stamps[self.positions[name]].tolist())
+
+    def polygons(self, name):
+        """Return (class ids, vertex offsets, vertex counts) of an image's polygons, offsets index self.vertices"""
+        position = self.positions[name]
+        first = self.image_first[position]
+        rows = slice(first, first + self.image_count[position])
+        return self.polygon_class[rows], self.polygon_offset[rows], self.polygon_count[rows]
+
+    def labels(self, name):
+        """An image's polygons as (class_id, points) tuples like read_labels, points are read-only views"""
+        class_ids, offsets, counts = self.polygons(name)
+        return LabelList([(class_id, self.vertices[offset:offset + count])
+                          for class_id, offset, count in zip(class_ids.tolist(), offsets.tolist(), counts.tolist())],
+                         int(self.image_skipped[self.positions[name]]))
+
+    def fresh_labels(self, name, stamp):
+        """labels(name) if they were cached from a label file with this stamp, otherwise None"""
+        position = self.positions.get(name)
+        if position is None:
+            return None
+        if tuple(self.stamps[position].tolist()) != (stamp or MISSING_STAMP):
+            return None
+        return self.labels(name)
+
+    def sync(self, workers=None, progress=None):
+        """Bring the cache up to date with the label files, returns the number of files parsed"""
+        images, labels = scan_folder(self.folder)
+        names = sorted(images)
+        stamps = np.array([labels.get(os.path.splitext(name)[0], MISSING_STAMP) for name in names],
+                          dtype=np.int64).reshape(-1, 2)
+
+        # Images whose label file is unchanged keep their cached polygons
+        old_positions = np.array([self.positions.get(name, -1) for name in names], dtype=np.int64)
+        known = old_positions >= 0
+        reused = known.copy()
+        reused[known] = (self.stamps[old_positions[known]] == stamps[known]).all(axis=1)
+        stale = np.flatnonzero(~reused & (stamps[:, 1] >= 0))
+
+        if reused.all() and len(names) == len(self.names):
+            return 0
+
+        paths = [os.path.join(self.folder, os.path.splitext(names[i])[0] + ".txt") for i in stale.tolist()]
+        per_file, new_class, new_count, new_vertices, new_skipped = parse_in_parallel(paths, workers, progress)
+
+        # Pool the old and the newly parsed polygons, then gather them in image order
+        pool_class = np.concatenate([self.polygon_class, new_class])
+        pool_offset = np.concatenate([self.polygon_offset, len(self.vertices) + np.cumsum(new_count) - new_count])
+        pool_count = np.concatenate([self.polygon_count, new_count])
+        pool_vertices = np.concatenate([self.vertices, new_vertices])
+
+        first = np.zeros(len(names), dtype=np.int64)
+        count = np.zeros(len(names), dtype=np.int64)
+        first[reused] = self.image_first[old_positions[reused]]
+        count[reused] = self.image_count[old_positions[reused]]
+        first[stale] = len(self.polygon_class) + np.cumsum(per_file) - per_file
+        count[stale] = per_file
+        skipped = np.zeros(len(names), dtype=np.int64)
+        skipped[reused] = self.image_skipped[old_positions[reused]]
+        skipped[stale] = new_skipped
+
+        polygon_rows = gather_slices(first, count)
+        polygon_count = pool_count[polygon_rows]
+        vertex_rows = gather_slices(pool_offset[polygon_rows], polygon_count)
+
+        self._write({
+            'stamps': stamps,
+            'image_first': np.cumsum(count) - count,
+            'image_count': count,
+            'polygon_class': pool_class[polygon_rows],
+            'polygon_offset': np.cumsum(polygon_count) - polygon_count,
+            'polygon_count': polygon_count,
+            'vertices': pool_vertices[vertex_rows],
+            'image_skipped': skipped,
+        }, names)
+        self._load()
+        return len(paths)
+
+    def rebuild(self, workers=None, progress=None):
+        """Throw the cache away and parse every label file again"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._load()
+        return self.sync(workers, progress)
+
+    def check(self, deep=False):
+        """Return a list of (name, problem) for images whose cache entry doesn't match the folder.
+
+        With deep=True every label file is also parsed and compared with the cached polygons.
+        """
+        problems = []
+        images, labels = scan_folder(self.folder)
+        for name in sorted(images.keys() - self.positions.keys()):
+            problems.append((name, "not in cache"))
+        for name in sorted(self.positions.keys() - images.keys()):
+            problems.append((name, "image no longer exists"))
+
+        for name in sorted(images.keys() & self.positions.keys()):
+            stamp = labels.get(os.path.splitext(name)[0], MISSING_STAMP)
+            if self.stamp(name) != stamp:
+                problems.append((name, "label file changed since the cache was built"))
+                continue
+            if not deep or stamp == MISSING_STAMP:
+                continue
+
+            on_disk = read_labels(os.path.join(self.folder, os.path.splitext(name)[0] + ".txt"))
+            cached = self.labels(name)
+            if len(on_disk) != len(cached) or any(
+                    class_id != cached_id or not np.array_equal(points, cached_points)
+                    for (class_id, points), (cached_id, cached_points) in zip(on_disk, cached)):
+                problems.append((name, "cached polygons differ from the label file"))
+        return problems
+
+    def close(self):
+        """Drop the memory maps, the file is unmapped once no returned view refers to it anymore"""
+        self._reset()
+
+    def _write(self, arrays, names):
+        relative = {}
+        end = 0
+        for name, array in arrays.items():
+            relative[name] = end
+            end += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+        # The header holds the absolute array offsets, so its own size decides where the data starts
+        data_start = 0
+        while True:
+            specs = {name: {'dtype': array.dtype.str, 'shape': list(array.shape),
+                            'offset': data_start + relative[name]}
+                     for name, array in arrays.items()}
+            header = json.dumps({'names': names, 'arrays': specs}).encode()
+            needed = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+            if needed <= data_start:
+                break
+            data_start = needed
+        header += b" " * (data_start - len(MAGIC) - 8 - len(header))
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(MAGIC)
+                f.write(struct.pack('<Q', len(header)))
+                f.write(header)
+                for name, array in arrays.items():
+                    f.seek(specs[name]['offset'])
+                    f.write(np.ascontiguousarray(array).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self.close()
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build, update or check the binary label cache of a folder")
+    parser.add_argument("folder", help="Folder with images and YOLO label files")
+    parser.add_argument("command", choices=["sync", "rebuild", "check"])
+    parser.add_argument("--deep", action="store_true", help="check: also compare the cached polygons with the files")
+    parser.add_argument("--workers", type=int, default=None, help="Parsing processes")
+    args = parser.parse_args()
+
+    cache = LabelCache(args.folder)
+    start_time = time.perf_counter()
+
+    if args.command == "check":
+        problems = cache.check(deep=args.deep)
+        for name, problem in problems:
+            print(f"{name}: {problem}")
+        print(f"{len(cache)} images in cache, {len(problems)} problem(s)")
+        raise SystemExit(1 if problems else 0)
+
+    if args.command == "rebuild":
+        parsed = cache.rebuild(args.workers)
+    else:
+        parsed = cache.sync(args.workers)
+    print(f"Parsed {parsed} label files in {time.perf_counter() - start_time:.1f}s, "
+          f"{len(cache)} images, {len(cache.polygon_class)} polygons, {len(cache.vertices)} vertices")
+
+
+if __name__ == "__main__":
+    main()
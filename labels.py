@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+
+
+class LabelList(list):
+    """(class_id, points) tuples of a label file, skipped counts the non-empty lines that couldn't be parsed"""
+
+    def __init__(self, labels=(), skipped=0):
+        super().__init__(labels)
+        self.skipped = skipped
+
+
+def label_path_for(image_folder, image_file):
+    """Return the YOLO label file path belonging to an image"""
+    annotation_file = os.path.splitext(image_file)[0] + ".txt"
+    return os.path.join(image_folder, annotation_file)
+
+
+def read_labels(annotation_path):
+    """Parse a YOLO segmentation label file into a list of (class_id, points) tuples"""
+    if not os.path.exists(annotation_path):
+        return LabelList()
+
+    with open(annotation_path, 'r') as f:
+        return parse_labels(f)
+
+
+def parse_labels(lines):
+    """Parse YOLO segmentation label lines into a LabelList of (class_id, (N, 2) float32 array) tuples"""
+    labels = LabelList()
+    for line in lines:
+        parts = line.strip().split()
+        if len(parts) < 6:  # At least class + 3 points (x,y)
+            if parts:
+                labels.skipped += 1
+            continue
+
+        try:
+            class_id = int(parts[0])
+            normalized_points = np.array(parts[1:], dtype=np.float32).reshape(-1, 2)
+        except ValueError:
+            # Not a number or an odd number of coordinates
+            labels.skipped += 1
+            continue
+
+        labels.append((class_id, normalized_points))
+    return labels
+
+
+def write_labels_atomic(annotation_path, contents):
+    """Write a label file through a temporary file and rename it, so readers never see a partial file"""
+    tmp_path = f"{annotation_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            f.write(contents)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, annotation_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -1,26 +1,61 @@
 import os
-from ultralytics import YOLO
 import json
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, simpledialog
 from PIL import Image, ImageTk, ImageDraw
-import numpy as np
-from scipy.interpolate import splprep, splev
+
+from annotation_writer import AnnotationWriter
+from auto_annotate import masks_to_polygons
+from canvas_scene import CanvasScene
+from class_remap import ClassRemapJob, removal_mapping, swap_mapping, name_mapping, is_identity
+from dataset_index import DatasetIndex
+from dataset_stats import folder_stats, write_report
+from frame_source import VIDEO_FORMATS, open_source
+from geometry import simplify_points
+from image_cache import MAX_IMAGE_PIXELS, ImagePrefetcher, ImageCache, file_stamp
+from inference_backends import BACKENDS, ModelBackend
+from inference_cache import InferenceCache
+from inference_worker import MIN_CONF, InferenceWorker
+from spatial_index import AnnotationIndex
+from viewport import Viewport
+from label_cache import LabelCache
+from labels import label_path_for, parse_labels
+from polygon_store import PolygonStore
+from profiling import profiled, profiler, span
+from propagate import propagate_polygons, MIN_CONFIDENCE
+
+# Large aerial images are only decoded through draft() or in reduced bands within MAX_DECODE_PIXELS
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
 
 class AnnotationApp:
+    # Edits are collected this long before the label file is queued for writing
+    COMMIT_DELAY_MS = 300
+    # Solid-line outlines are simplified to within this many screen pixels
+    SIMPLIFY_TOLERANCE = 1.5
+    SIMPLIFY_MAX_VERTICES = 200
+    # Images after the current one that are pre-annotated when speculative inference is enabled
+    SPECULATIVE_IMAGES = 2
+    # A quick preview is swapped for the LANCZOS render once the background decode is done
+    REFINE_POLL_MS = 40
+    REFINE_MAX_POLLS = 250
+    # Window resizes are collected this long before the image is rendered for the new size
+    RESIZE_DELAY_MS = 120
+
     def __init__(self, root):
         self.root = root
         self.root.title("YOLO Segmentation Annotation Tool")
         self.root.geometry("1200x800")
 
         # Configuration
-        self.image_folder = ""
+        self.image_folder = ""  # Folder of the label files
+        self.source_path = ""  # Opened image folder or video file
+        self.source = None
         self.classes = []
         self.class_colors = {}
         self.current_image_index = -1
         self.images = []
-        self.annotations = {}
-        self.current_annotation_id = 0
+        self.annotations = PolygonStore()
         self.current_class = None
         self.current_polygon = []
         self.dragging_vertex = None
@@ -32,18 +67,78 @@ class AnnotationApp:
         self.solid_line_id = None
         self.is_drawing_solid_line = False
         self.selected_polygon_id = None
+        self.image_size = None
+        self.current_image_path = None
+        self.dataset_index = None
+        self.label_cache = None
+
+        # Background decoding of neighbouring images
+        self.prefetcher = ImagePrefetcher()
+
+        # Write-behind saving of label files
+        self.writer = AnnotationWriter()
+        self.dirty_image_file = None
+        self.commit_job = None
+        # Span timings drawn over the image, see profiling.py
+        self.profile_overlay = False
+        # Images whose label file would lose lines if it was rewritten, image file -> reason
+        self.protected_labels = {}
+
+        # Zoom/pan state and the tiles of the zoomed image
+        self.viewport = Viewport()
+        self.pyramid = None
+        self.pyramid_cache = ImageCache(max_bytes=384 * 1024 * 1024)
+        self.pan_anchor = None
+        self.refine_job = None
+        self.refine_polls = 0
+        self.resize_job = None
+        self.canvas_size = None
+
+        # Dataset-wide class id rewrite running in the background
+        self.remap_thread = None
+        self.remap_progress = None
 
         # UI Setup
         self.setup_ui()
 
-        # AI module
+        # AI module, the forward pass runs on the inference worker thread
         self.model = None
+        self.model_loading = False
+        self.inference = None
+        self.inference_cache = None
+        self.auto_annotate_job = None
+        self.auto_annotate_result = None  # (image_file, raw predictions, label contents they produced)
+        self.conf_job = None
         self.load_model()
         self.conf = 0.6
 
         # Bind keyboard shortcuts
         self.bind_shortcuts()
 
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.update_save_status()
+
+    def on_close(self):
+        if self.remap_thread is not None:
+            # Waiting here would freeze the window for the whole remap
+            messagebox.showinfo("Info", "A class remap is in progress, close the window once it has finished")
+            return
+
+        # Write every pending label file before exiting
+        self.commit_annotations()
+        self.writer.close()
+        if self.inference is not None:
+            self.inference.close()
+        for path, error in self.writer.take_errors():
+            messagebox.showerror("Error", f"Failed to save annotations to {path}: {error}")
+        self.prefetcher.shutdown()
+        if self.source is not None:
+            self.source.close()
+        trace_path = os.environ.get("MARKUP_TRACE")
+        if trace_path and profiler.enabled:
+            profiler.export_chrome_trace(trace_path)
+        self.root.destroy()
+
 
     def setup_ui(self):
         # Main frames
@@ -61,7 +156,14 @@ class AnnotationApp:
         self.folder_entry.pack(fill=tk.X, padx=5)
 
         self.browse_btn = tk.Button(self.left_frame, text="Browse", command=self.browse_folder)
-        self.browse_btn.pack(pady=(0, 10), fill=tk.X)
+        self.browse_btn.pack(fill=tk.X)
+
+        self.open_video_btn = tk.Button(self.left_frame, text="Open Video", command=self.browse_video)
+        self.open_video_btn.pack(fill=tk.X)
+
+        self.export_frames_btn = tk.Button(self.left_frame, text="Export Annotated Frames",
+                                           command=self.export_frames)
+        self.export_frames_btn.pack(pady=(0, 10), fill=tk.X)
 
         # Image navigation controls
         tk.Label(self.left_frame, text="Images:", bg='#f0f0f0').pack(pady=(10, 0), anchor='w')
@@ -78,6 +180,9 @@ class AnnotationApp:
         self.next_btn = tk.Button(nav_frame, text=">>", command=self.next_image)
         self.next_btn.pack(side=tk.RIGHT, fill=tk.X, expand=True)
 
+        self.next_unlabeled_btn = tk.Button(self.left_frame, text="Next Unlabeled", command=self.next_unlabeled_image)
+        self.next_unlabeled_btn.pack(fill=tk.X, padx=5, pady=(5, 0))
+
         # Image rename button
         self.rename_image_btn = tk.Button(self.left_frame, text="Rename Image", command=self.rename_current_image)
         self.rename_image_btn.pack(fill=tk.X, padx=5, pady=(5, 0))
@@ -137,6 +242,30 @@ class AnnotationApp:
         self.auto_annotate_btn = tk.Button(tool_frame, text="Auto-Annotate", command=self.auto_annotate_image)
         self.auto_annotate_btn.pack(fill=tk.X, padx=2, pady=2)
 
+        # CPU inference backend, exported models are served by ONNX Runtime or OpenVINO
+        self.backend_var = tk.StringVar(value=BACKENDS[0])
+        self.backend_combo = ttk.Combobox(tool_frame, textvariable=self.backend_var, values=BACKENDS,
+                                          state='readonly')
+        self.backend_combo.pack(fill=tk.X, padx=2, pady=2)
+        self.backend_combo.bind('<<ComboboxSelected>>', lambda e: self.load_model())
+
+        # Predictions are cached unfiltered, moving the threshold re-filters them without running the model
+        self.conf_scale = tk.Scale(tool_frame, label="Confidence", from_=MIN_CONF, to=0.95, resolution=0.05,
+                                   orient=tk.HORIZONTAL, bg='#f0f0f0', command=self.on_conf_changed)
+        self.conf_scale.set(0.6)
+        self.conf_scale.pack(fill=tk.X, padx=2)
+
+        self.propagate_btn = tk.Button(tool_frame, text="Propagate from Previous",
+                                       command=self.propagate_from_previous)
+        self.propagate_btn.pack(fill=tk.X, padx=2, pady=2)
+
+        # Pre-run the model on the next images so Auto-Annotate on them returns immediately
+        self.speculative_var = tk.BooleanVar(value=False)
+        self.speculative_check = tk.Checkbutton(tool_frame, text="Pre-annotate next images",
+                                                variable=self.speculative_var, bg='#f0f0f0',
+                                                command=self.speculate_neighbors)
+        self.speculative_check.pack(anchor='w', padx=2)
+
         self.mode_btn = tk.Button(tool_frame, text="Switch to Solid Line", command=self.toggle_drawing_mode)
         self.mode_btn.pack(fill=tk.X, padx=2, pady=2)
 
@@ -149,14 +278,23 @@ class AnnotationApp:
         self.delete_image_btn = tk.Button(self.left_frame, text="Delete Image", command=self.delete_current_image)
         self.delete_image_btn.pack(fill=tk.X, padx=5, pady=(10, 0))
 
+        self.stats_btn = tk.Button(self.left_frame, text="Dataset Statistics", command=self.show_statistics)
+        self.stats_btn.pack(fill=tk.X, padx=5, pady=(5, 0))
+
         # Status bar
         self.status_bar = tk.Label(self.left_frame, text="No folder selected", bd=1, relief=tk.SUNKEN, anchor=tk.W,
                                  bg='#f0f0f0')
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
 
+        self.save_status_bar = tk.Label(self.left_frame, text="All changes saved", bd=1, relief=tk.SUNKEN,
+                                        anchor=tk.W, bg='#f0f0f0')
+        self.save_status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+
         # Image canvas
         self.canvas = tk.Canvas(self.right_frame, bg='gray', cursor="cross")
         self.canvas.pack(expand=True, fill=tk.BOTH)
+        self.scene = CanvasScene(self.canvas)
+        self.annotation_index = AnnotationIndex()
 
         # Bind canvas events
         self.canvas.bind("<Button-1>", self.canvas_left_click)
@@ -166,6 +304,16 @@ class AnnotationApp:
         self.canvas.bind("<Motion>", self.canvas_mouse_move)
         self.canvas.bind("<Button-3>", self.canvas_right_click)
 
+        # Zoom with the mouse wheel, pan with the middle button
+        self.canvas.bind("<MouseWheel>", self.canvas_zoom)
+        self.canvas.bind("<Button-4>", self.canvas_zoom)
+        self.canvas.bind("<Button-5>", self.canvas_zoom)
+        self.canvas.bind("<Button-2>", self.canvas_pan_start)
+        self.canvas.bind("<B2-Motion>", self.canvas_pan)
+
+        # Render the image again for the new canvas size once the window stops resizing
+        self.canvas.bind("<Configure>", self.on_canvas_configure)
+
     def toggle_drawing_mode(self):
         self.solid_line_mode = not self.solid_line_mode
         if self.solid_line_mode:
@@ -206,6 +354,22 @@ class AnnotationApp:
         # Bind 'm' key to toggle drawing mode
         self.root.bind("m", lambda e: self.toggle_drawing_mode())
 
+        # Bind 'u' to jump to the next image without annotations
+        self.root.bind("u", lambda e: self.next_unlabeled_image())
+
+        # Bind Escape to cancel a running auto-annotation
+        self.root.bind("<Escape>", lambda e: self.cancel_auto_annotate())
+
+        # Bind 'p' to carry the polygons of the previous image over
+        self.root.bind("p", lambda e: self.propagate_from_previous())
+
+        # Bind '0' to reset zoom
+        self.root.bind("0", lambda e: self.reset_zoom())
+
+        # F12 shows timings of the last frames on the canvas, Shift+F12 saves them as a Chrome trace
+        self.root.bind("<F12>", lambda e: self.toggle_profile_overlay())
+        self.root.bind("<Shift-F12>", lambda e: self.save_profile_trace())
+
     def set_ctrl_state(self, state):
         self.ctrl_pressed = state
         if state:
@@ -217,89 +381,241 @@ class AnnotationApp:
     def browse_folder(self):
         folder = filedialog.askdirectory()
         if folder:
-            self.image_folder = folder
-            self.folder_entry.delete(0, tk.END)
-            self.folder_entry.insert(0, folder)
-            self.load_images()
+            self.open_source(folder)
+
+    def browse_video(self):
+        video = filedialog.askopenfilename(
+            filetypes=[("Video files", " ".join(f"*{ext}" for ext in VIDEO_FORMATS))])
+        if video:
+            self.open_source(video)
+
+    def open_source(self, path):
+        self.source_path = path
+        self.folder_entry.delete(0, tk.END)
+        self.folder_entry.insert(0, path)
+        self.load_images()
+
+    def on_index_progress(self, done, total):
+        self.status_bar.config(text=f"Indexing video: {done}/{total} frames")
+        self.root.update_idletasks()
 
     def load_images(self):
-        if not self.image_folder:
+        if not self.source_path:
             return
 
-        self.images = []
-        supported_formats = ('.jpg', '.jpeg', '.png', '.bmp')
+        # Labels of the previous folder must be queued before the index is swapped
+        self.commit_annotations()
+        self.protected_labels.clear()
+        if self.dataset_index is not None:
+            self.dataset_index.close()
+            self.dataset_index = None
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+
+        # A folder of images, or a video whose frames are decoded on demand and labeled in a folder next to it
+        try:
+            self.source = open_source(self.source_path, self.prefetcher, progress=self.on_index_progress)
+        except OSError as e:
+            self.images = []
+            self.current_image_index = -1
+            messagebox.showerror("Error", f"Failed to open {self.source_path}: {e}")
+            return
+        self.image_folder = self.source.label_folder
+
+        # Raw predictions of this folder's images, shared by every model through the weights hash
+        self.inference_cache = InferenceCache(self.image_folder)
+        if self.inference is not None:
+            self.inference.disk_cache = self.inference_cache
+        self.auto_annotate_result = None
+
+        # A class remap that was interrupted has to be finished or undone before labels are shown
+        job = ClassRemapJob.from_journal(self.image_folder, progress=self.on_remap_progress)
+        if job is not None:
+            self.dataset_index = None
+            self.label_cache = None
+            self.images = []
+            self.current_image_index = -1
+            if job.phase == 'cleanup':
+                # Every label was already rewritten, only the backups are left to delete
+                self.start_class_remap(job.resume, job.classes, job.mapping, on_done=self.load_images)
+            elif messagebox.askyesno(
+                    "Interrupted Class Remap",
+                    "A class remap of this folder was interrupted. Resume it?\n"
+                    "Choosing No rolls back the label files that were already rewritten."):
+                self.start_class_remap(job.resume, job.classes, job.mapping, on_done=self.load_images)
+            else:
+                self.start_class_remap(job.rollback, None, {}, on_done=self.load_images)
+            return
 
-        for file in os.listdir(self.image_folder):
-            if file.lower().endswith(supported_formats):
-                self.images.append(file)
+        if self.source.is_video:
+            # Frames have no files to index, labels are read straight from the label folder
+            self.label_cache = None
+            self.images = self.source.names()
+            self.current_image_index = -1
+            if self.images:
+                self.next_image()
+                self.status_bar.config(text=f"Video loaded: {len(self.images)} frames")
+            else:
+                self.status_bar.config(text="No frames found in video")
+            return
+
+        # Persistent index next to the images, only changed files are looked at again
+        self.dataset_index = DatasetIndex(self.image_folder)
+        self.dataset_index.refresh()
 
-        self.images.sort()
+        # Binary copy of the labels if one was built, only entries matching the file on disk are used
+        self.label_cache = LabelCache(self.image_folder)
+        self.images = self.dataset_index.names()
         self.current_image_index = -1
 
         if self.images:
             self.next_image()
-            self.status_bar.config(text=f"Folder loaded: {len(self.images)} images")
+            total, labeled = self.dataset_index.counts()
+            self.status_bar.config(text=f"Folder loaded: {total} images ({labeled} labeled)")
         else:
             self.status_bar.config(text="No images found in folder")
 
+    def image_path_for(self, image_file):
+        """Key of an image for caches, the file path of images in a folder"""
+        return self.source.image_key(image_file)
+
+    def export_frames(self):
+        """Write the annotated frames of the open video as JPEGs with their labels"""
+        if self.source is None or not self.source.is_video:
+            messagebox.showinfo("Info", "Open a video to export its annotated frames")
+            return
+
+        dest_folder = filedialog.askdirectory(title="Export annotated frames to")
+        if not dest_folder:
+            return
+
+        if self.current_polygon:
+            self.save_current_polygon()
+        self.commit_annotations()
+        self.writer.flush()
+
+        def progress(done, total):
+            self.status_bar.config(text=f"Exporting frames: {done}/{total}")
+            self.root.update_idletasks()
+
+        try:
+            exported = self.source.export(dest_folder, progress=progress)
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to export frames: {e}")
+            return
+        self.status_bar.config(text=f"Exported {exported} annotated frames")
+
+    @profiled("load.annotations")
     def load_annotations(self, image_file):
-        annotation_file = os.path.splitext(image_file)[0] + ".txt"
-        annotation_path = os.path.join(self.image_folder, annotation_file)
-
-        self.annotations = {}
-        self.current_annotation_id = 0
-
-        if os.path.exists(annotation_path):
-            with open(annotation_path, 'r') as f:
-                for line in f:
-                    parts = line.strip().split()
-                    if len(parts) < 6:  # At least class + 3 points (x,y)
-                        continue
-
-                    try:
-                        class_id = int(parts[0])
-                        # Skip if class_id is invalid
-                        if class_id >= len(self.classes):
-                            continue
-
-                        points = list(map(float, parts[1:]))
-                        normalized_points = [(points[i], points[i + 1]) for i in range(0, len(points), 2)]
-
-                        self.annotations[self.current_annotation_id] = {
-                            'class_id': class_id,
-                            'points': normalized_points
-                        }
-                        self.current_annotation_id += 1
-                    except (ValueError, IndexError):
-                        continue
+        # Queue the edits of the previous image and write them out now
+        self.commit_annotations()
+        self.writer.flush_async()
+
+        labels = self.read_annotations(image_file)
+        invalid = sum(1 for class_id, _ in labels if not 0 <= class_id < len(self.classes))
+
+        # Lines that can't be shown would be dropped by the next save, so such files are never written
+        self.protected_labels.pop(image_file, None)
+        if labels.skipped or invalid:
+            problems = []
+            if labels.skipped:
+                problems.append(f"{labels.skipped} unparseable line(s)")
+            if invalid:
+                problems.append(f"{invalid} polygon(s) with unknown class ids")
+            self.protected_labels[image_file] = ", ".join(problems)
+
+        # Skip invalid class ids
+        self.annotations = PolygonStore.from_labels(
+            (class_id, points) for class_id, points in labels if 0 <= class_id < len(self.classes))
+
+    def read_annotations(self, image_file):
+        """Labels of an image as (class_id, points) tuples, including changes not written yet"""
+        annotation_path = label_path_for(self.image_folder, image_file)
+
+        # Contents that are still waiting to be written are newer than the file on disk
+        pending = self.writer.pending(annotation_path)
+        if pending is not None:
+            return parse_labels(pending.splitlines())
+
+        labels = None
+        if self.label_cache is not None:
+            labels = self.label_cache.fresh_labels(image_file, file_stamp(annotation_path))
+        if labels is None:
+            labels = self.prefetcher.get_labels(annotation_path)
+        return labels
 
     def save_annotations(self):
         if not self.image_folder or self.current_image_index == -1:
             return
 
         image_file = self.images[self.current_image_index]
-        annotation_file = os.path.splitext(image_file)[0] + ".txt"
-        annotation_path = os.path.join(self.image_folder, annotation_file)
+        self.dirty_image_file = image_file
+        if self.commit_job is None:
+            self.commit_job = self.root.after(self.COMMIT_DELAY_MS, self.commit_annotations)
+
+    def commit_annotations(self):
+        """Hand the annotations of the current image to the writer if they changed"""
+        if self.commit_job is not None:
+            self.root.after_cancel(self.commit_job)
+            self.commit_job = None
+
+        if self.dirty_image_file in self.protected_labels:
+            # Edits stay on screen but the label file keeps the lines the app couldn't read
+            self.dirty_image_file = None
+        if self.dirty_image_file is not None:
+            annotation_path = label_path_for(self.image_folder, self.dirty_image_file)
+            with span("save.format"):
+                contents = self.annotations.format()
+            self.writer.save(annotation_path, contents)
+            if self.dataset_index is not None:
+                self.dataset_index.set_polygon_count(self.dirty_image_file, len(self.annotations))
+            self.dirty_image_file = None
+
+    def forget_pending_annotations(self, image_file):
+        """Drop unsaved changes of a label file that is about to be deleted"""
+        if self.dirty_image_file == image_file:
+            self.dirty_image_file = None
+        self.writer.discard(label_path_for(self.image_folder, image_file))
+
+    def update_save_status(self):
+        pending = self.writer.pending_count()
+        if (self.dirty_image_file is not None and
+                self.writer.pending(label_path_for(self.image_folder, self.dirty_image_file)) is None):
+            pending += 1
+
+        current = self.images[self.current_image_index] if 0 <= self.current_image_index < len(self.images) else None
+        if current in self.protected_labels:
+            self.save_status_bar.config(text=f"Read-only: label file has {self.protected_labels[current]}, "
+                                             f"fix it with validate_labels.py")
+        elif pending:
+            self.save_status_bar.config(text=f"Saving: {pending} label file(s) pending")
+        else:
+            self.save_status_bar.config(text="All changes saved")
 
-        with open(annotation_path, 'w') as f:
-            for ann_id, ann in self.annotations.items():
-                class_id = ann['class_id']
-                points = ann['points']
+        # Background spans (writes, inference) finish between frames
+        if self.profile_overlay:
+            self.draw_profile_overlay()
+        self.root.after(250, self.update_save_status)
 
-                # Flatten points list
-                flat_points = [str(coord) for point in points for coord in point]
-                line = f"{class_id} {' '.join(flat_points)}\n"
-                f.write(line)
+        for path, error in self.writer.take_errors():
+            messagebox.showerror("Error", f"Failed to save annotations to {path}: {error}")
 
+    @profiled("display.frame")
     def display_image(self):
         if not self.images or self.current_image_index == -1:
             return
 
         image_file = self.images[self.current_image_index]
-        image_path = os.path.join(self.image_folder, image_file)
+        image_path = self.image_path_for(image_file)
+        if image_path != self.current_image_path:
+            self.current_image_path = image_path
+            self.viewport.reset()
+            self.pyramid = None
+
+        self.canvas.delete("preview")
 
         try:
-            self.current_image = Image.open(image_path)
             self.update_image_display()
 
             # Update image counter
@@ -307,14 +623,42 @@ class AnnotationApp:
             self.image_num_entry.insert(0, str(self.current_image_index + 1))
 
             # Update status
-            self.status_bar.config(text=f"Image {self.current_image_index + 1}/{len(self.images)}: {image_file}")
+            if self.source.is_video:
+                self.status_bar.config(text=f"Frame {self.current_image_index + 1}/{len(self.images)} "
+                                            f"at {self.source.timestamp(image_file):.2f}s")
+            else:
+                self.status_bar.config(
+                    text=f"Image {self.current_image_index + 1}/{len(self.images)}: {image_file}")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load image: {e}")
+            return
+
+        self.prefetch_neighbors()
+        self.speculate_neighbors()
+
+    def prefetch_neighbors(self):
+        """Queue the images around the current one for background decoding, next ones first"""
+        canvas_size = (self.canvas.winfo_width(), self.canvas.winfo_height())
+        if canvas_size[0] <= 1 or canvas_size[1] <= 1:
+            return
+
+        # The current image first, so a render it is still waiting for isn't cancelled
+        names = [self.images[self.current_image_index]]
+        for offset in range(1, self.prefetcher.radius + 1):
+            for index in (self.current_image_index + offset, self.current_image_index - offset):
+                if 0 <= index < len(self.images):
+                    names.append(self.images[index])
+
+        self.source.prefetch(names, canvas_size)
 
     def update_image_display(self):
-        """Update the image display to fit the canvas while maintaining aspect ratio"""
-        self.canvas.delete("all")
+        """Update the image display for the current zoom and pan and redraw all annotations.
 
+        The background is only rendered again when the image, canvas size or viewport changed.
+        Renders are cached per image and canvas size. An image that isn't rendered at this size
+        yet is shown as a quick preview first and refined with LANCZOS in the background. Without
+        a cheap preview the previous background stays until the render is ready.
+        """
         # Get canvas dimensions
         canvas_width = self.canvas.winfo_width()
         canvas_height = self.canvas.winfo_height()
@@ -322,99 +666,247 @@ class AnnotationApp:
         if canvas_width <= 1 or canvas_height <= 1:
             return
 
-        # Calculate aspect ratio
-        img_width, img_height = self.current_image.size
-        img_ratio = img_width / img_height
-        canvas_ratio = canvas_width / canvas_height
-
-        # Calculate new dimensions
-        if canvas_ratio > img_ratio:
-            # Canvas is wider than image
-            new_height = canvas_height
-            new_width = int(new_height * img_ratio)
-        else:
-            # Canvas is taller than image
-            new_width = canvas_width
-            new_height = int(new_width / img_ratio)
-
-        # Calculate position to center the image
-        x_pos = (canvas_width - new_width) // 2
-        y_pos = (canvas_height - new_height) // 2
+        canvas_size = (canvas_width, canvas_height)
+        self.canvas_size = canvas_size
+        shown_img = None
+        preview = False
+        if self.viewport.is_fit:
+            # Decoded and resized in the background when the image was prefetched
+            image_file = self.images[self.current_image_index]
+            value = self.source.peek_image(image_file, canvas_size)
+            if value is None:
+                with span("display.preview"):
+                    value = self.source.preview_image(image_file, canvas_size)
+                preview = True
+                self.source.request_image(image_file, canvas_size)
+                self.schedule_refine()
+            self.image_size, shown_img = value
+        self.viewport.update(self.image_size, canvas_size)
 
         # Store scaling factors and position for coordinate conversion
-        self.image_ratio = new_width / img_width
-        self.image_position = (x_pos, y_pos)
-
-        # Resize image
-        resized_img = self.current_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        self.photo = ImageTk.PhotoImage(resized_img)
+        self.image_ratio = self.viewport.scale
+        self.image_position = self.viewport.origin
 
-        # Display image
-        self.image_on_canvas = self.canvas.create_image(x_pos, y_pos, anchor=tk.NW, image=self.photo)
+        view_key = (self.current_image_path, canvas_size, self.viewport.scale, self.viewport.origin, preview)
+        if view_key != self.scene.background_key:
+            if self.viewport.is_fit:
+                shown_position = self.viewport.origin
+            else:
+                # Zoomed in: only the visible tiles of the pyramid are decoded and resized
+                if self.pyramid is None:
+                    self.pyramid = self.source.pyramid(self.images[self.current_image_index],
+                                                       self.pyramid_cache)
+                with span("display.pyramid_render"):
+                    shown_img, shown_position = self.pyramid.render(self.viewport.scale, self.viewport.origin,
+                                                                    canvas_size)
+
+            # Display image
+            if shown_img is not None:
+                with span("display.photo_image"):
+                    self.photo = ImageTk.PhotoImage(shown_img)
+                    self.scene.set_background(self.photo, shown_position, view_key)
+            elif preview:
+                # No cheap preview of this file, refine_display swaps in the render once it is decoded
+                self.scene.keep_background(view_key)
+            else:
+                self.scene.hide_background(view_key)
 
         # Draw annotations
         self.draw_annotations()
+        if self.profile_overlay:
+            self.draw_profile_overlay()
+
+    def schedule_refine(self):
+        if self.refine_job is None:
+            self.refine_polls = 0
+            self.refine_job = self.root.after(self.REFINE_POLL_MS, self.refine_display)
+
+    def refine_display(self):
+        """Swap the preview background for the LANCZOS render, without redrawing the annotations"""
+        self.refine_job = None
+        if not self.images or self.current_image_index == -1 or not self.viewport.is_fit:
+            return
+
+        image_file = self.images[self.current_image_index]
+        preview_key = (self.current_image_path, self.canvas_size, self.viewport.scale, self.viewport.origin, True)
+        if self.scene.background_key != preview_key:
+            # Another image or size is shown by now, its own render took over
+            return
+
+        value = self.source.peek_image(image_file, self.canvas_size)
+        if value is None:
+            self.refine_polls += 1
+            if self.refine_polls < self.REFINE_MAX_POLLS:
+                self.refine_job = self.root.after(self.REFINE_POLL_MS, self.refine_display)
+                return
+            # The background decode failed or was dropped, render on this thread
+            try:
+                value = self.source.get_image(image_file, self.canvas_size)
+            except (OSError, ValueError):
+                return
+
+        with span("display.photo_image"):
+            self.photo = ImageTk.PhotoImage(value[1])
+            self.scene.set_background(self.photo, self.viewport.origin, preview_key[:-1] + (False,))
+
+    def on_canvas_configure(self, event):
+        """Debounce window resizes, the image is rendered once for the final size"""
+        if (event.width, event.height) == self.canvas_size:
+            return
+        if self.resize_job is not None:
+            self.root.after_cancel(self.resize_job)
+        self.resize_job = self.root.after(self.RESIZE_DELAY_MS, self.on_canvas_resized)
 
+    def on_canvas_resized(self):
+        self.resize_job = None
+        if not self.images or self.current_image_index == -1:
+            return
+        self.redraw_view()
+        self.prefetch_neighbors()
+
+    def to_canvas(self, points):
+        """Convert normalized points to canvas coordinates"""
+        img_width, img_height = self.image_size
+        scale_x = img_width * self.image_ratio
+        scale_y = img_height * self.image_ratio
+        offset_x, offset_y = self.image_position
+        return [(x * scale_x + offset_x, y * scale_y + offset_y) for x, y in points]
+
+    def to_normalized(self, x, y):
+        """Convert a canvas position to normalized image coordinates"""
+        scale_x, scale_y = self.canvas_scale()
+        offset_x, offset_y = self.image_position
+        return (x - offset_x) / scale_x, (y - offset_y) / scale_y
+
+    def canvas_scale(self):
+        """Canvas pixels per normalized unit on each axis"""
+        img_width, img_height = self.image_size
+        return img_width * self.image_ratio, img_height * self.image_ratio
+
+    def class_label(self, class_id):
+        if self.classes and class_id < len(self.classes):
+            return self.classes[class_id]
+        return None
+
+    @profiled("display.draw_annotations")
     def draw_annotations(self):
-        for ann_id, ann in self.annotations.items():
-            class_id = ann['class_id']
-            points = ann['points']
+        """Recreate the canvas items of all annotations in the visible part of the image"""
+        self.scene.clear()
+        self.scene.selected_id = self.selected_polygon_id
+        self.annotation_index.rebuild(self.annotations)
 
+        # Polygons whose bounding box is outside the visible part of the image are not drawn
+        view_x0, view_y0, view_x1, view_y1 = self.viewport.visible_normalized_box()
+
+        visible = self.annotations.ids_in_box(view_x0, view_y0, view_x1, view_y1)
+        for ann_id, class_id, points in self.annotations.transformed(self.canvas_scale(), self.image_position,
+                                                                     visible):
             if len(points) < 2:
                 continue
 
-            # Scale points to image coordinates
-            img_width, img_height = self.current_image.size
-            scaled_points = [
-                (point[0] * img_width * self.image_ratio + self.image_position[0],
-                 point[1] * img_height * self.image_ratio + self.image_position[1])
-                for point in points
-            ]
+            self.scene.add(ann_id, points, self.get_class_color(class_id), self.class_label(class_id))
 
-            # Check if this polygon is selected
-            is_selected = (ann_id == self.selected_polygon_id)
+    def refresh_annotation(self, ann_id, vertex_idx=None):
+        """Update the canvas items of one annotation after its points changed"""
+        if ann_id not in self.annotations or self.annotations.point_count(ann_id) < 2:
+            self.scene.remove(ann_id)
+            self.annotation_index.remove(ann_id)
+            return
 
-            # Create polygon with white border if selected
-            outline_color = "#ffffff" if is_selected else self.get_class_color(class_id)
-            outline_width = 3 if is_selected else 2
+        self.annotation_index.update(ann_id, self.annotations.points(ann_id))
 
-            polygon_id = self.canvas.create_polygon(
-                scaled_points,
-                outline=outline_color,
-                fill="",
-                width=outline_width,
-                tags=("polygon", f"polygon_{ann_id}")
-            )
+        _, class_id, points = next(self.annotations.transformed(self.canvas_scale(), self.image_position, [ann_id]))
+        if ann_id in self.scene.items:
+            self.scene.update_points(ann_id, points, vertex_idx)
+        else:
+            self.scene.add(ann_id, points, self.get_class_color(class_id), self.class_label(class_id))
 
-            # Add transparent fill
-            fill_id = self.canvas.create_polygon(
-                scaled_points,
-                outline="",
-                fill=self.get_class_color(class_id),
-                stipple="gray25",
-                tags=("fill", f"fill_{ann_id}")
-            )
+    def select_polygon(self, ann_id):
+        self.selected_polygon_id = ann_id
+        self.scene.set_selected(ann_id)
 
-            # Add class label
-            if self.classes and class_id < len(self.classes):
-                label_text = self.classes[class_id]
-                label_x, label_y = scaled_points[0]
-                label_id = self.canvas.create_text(
-                    label_x, label_y - 10,
-                    text=label_text,
-                    fill=self.get_class_color(class_id),
-                    font=("Arial", 10, "bold"),
-                    tags=("label", f"label_{ann_id}")
-                )
-
-            # Draw vertices (no color change for selection)
-            for i, (x, y) in enumerate(scaled_points):
-                vertex_id = self.canvas.create_oval(
-                    x - 3, y - 3, x + 3, y + 3,
-                    fill=self.get_class_color(class_id),
-                    outline="white",  # Always white outline for vertices
-                    tags=("vertex", f"vertex_{ann_id}_{i}")
-                )
+    def canvas_zoom(self, event):
+        if not self.current_image_path or self.image_size is None:
+            return
+
+        # Windows/macOS report the wheel through delta, X11 through buttons 4 and 5
+        if event.num == 5 or event.delta < 0:
+            factor = 1 / 1.25
+        else:
+            factor = 1.25
+
+        self.viewport.zoom_at(factor, event.x, event.y)
+        self.redraw_view()
+
+    def canvas_pan_start(self, event):
+        self.pan_anchor = (event.x, event.y)
+
+    def canvas_pan(self, event):
+        if self.pan_anchor is None or self.viewport.is_fit:
+            return
+
+        self.viewport.pan(event.x - self.pan_anchor[0], event.y - self.pan_anchor[1])
+        self.pan_anchor = (event.x, event.y)
+        self.redraw_view()
+
+    def reset_zoom(self):
+        if self.viewport.is_fit:
+            return
+
+        self.viewport.reset()
+        self.redraw_view()
+
+    def redraw_view(self):
+        """Redraw after a zoom or pan, keeping the polygon being drawn"""
+        self.update_image_display()
+        if self.current_polygon:
+            self.draw_current_polygon()
+        elif self.solid_line_points:
+            self.draw_solid_line_preview()
+
+    def toggle_profile_overlay(self):
+        """Show or hide span timings on the canvas, profiling is switched on with the overlay"""
+        self.profile_overlay = not self.profile_overlay
+        if self.profile_overlay:
+            profiler.enabled = True
+            self.draw_profile_overlay()
+            self.status_bar.config(text="Profiling on (F12 hides the overlay, Shift+F12 saves a trace)")
+        else:
+            self.canvas.delete("profile_overlay")
+
+    def draw_profile_overlay(self):
+        """Latest, median and p95 milliseconds of every span in the top-left corner of the canvas"""
+        self.canvas.delete("profile_overlay")
+        summary = profiler.summary()
+        lines = [f"{'span':<28}{'last':>8}{'p50':>8}{'p95':>8}"]
+        for name, (count, last, p50, p95) in sorted(summary.items()):
+            lines.append(f"{name:<28}{last:8.1f}{p50:8.1f}{p95:8.1f}")
+        if len(lines) == 1:
+            lines.append("no spans recorded yet")
+
+        text = self.canvas.create_text(8, 8, text="\n".join(lines), anchor=tk.NW, fill='#ffff66',
+                                       font=('Courier', 9), tags=("profile_overlay",))
+        x0, y0, x1, y1 = self.canvas.bbox(text)
+        background = self.canvas.create_rectangle(x0 - 4, y0 - 4, x1 + 4, y1 + 4, fill='black', outline='',
+                                                  stipple='gray75', tags=("profile_overlay",))
+        self.canvas.tag_lower(background, text)
+        self.canvas.tag_raise("profile_overlay")
+
+    def save_profile_trace(self):
+        if not profiler.enabled:
+            messagebox.showinfo("Info", "Profiling is off, press F12 to start recording")
+            return
+
+        path = filedialog.asksaveasfilename(title="Save Chrome trace", defaultextension=".json",
+                                            filetypes=[("Trace JSON", "*.json")])
+        if not path:
+            return
+        try:
+            count = profiler.export_chrome_trace(path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to save the trace: {e}")
+            return
+        self.status_bar.config(text=f"Saved {count} spans, open the file in chrome://tracing or Perfetto")
 
     def get_class_color(self, class_id):
         if class_id not in self.class_colors:
@@ -485,34 +977,9 @@ class AnnotationApp:
         if not confirm:
             return
 
-        # First remove all annotations with this class
-        annotations_to_delete = [
-            ann_id for ann_id, ann in self.annotations.items()
-            if ann['class_id'] == index
-        ]
-        for ann_id in annotations_to_delete:
-            del self.annotations[ann_id]
-
-        # Then update class_ids for annotations with higher indices
-        for ann_id, ann in self.annotations.items():
-            if ann['class_id'] > index:
-                ann['class_id'] -= 1
-
-        # Remove the class from the list
-        self.classes.pop(index)
-
-        # Update UI and colors
-        self.class_colors = {}  # Reset colors to regenerate
-        self.update_classes_listbox()
-
-        # Reset current class selection if it was affected
-        if self.current_class == index:
-            self.current_class = None
-        elif self.current_class > index:
-            self.current_class -= 1
-
-        self.save_annotations()
-        self.display_image()
+        # Every label file of the folder is rewritten, not only the open image
+        self.remap_classes(removal_mapping(len(self.classes), index),
+                           self.classes[:index] + self.classes[index + 1:])
 
     def move_class(self, up=True):
         selection = self.classes_listbox.curselection()
@@ -532,35 +999,24 @@ class AnnotationApp:
         if new_idx < 0 or new_idx >= len(self.classes):
             return
 
-        self.classes[current_idx], self.classes[new_idx] = self.classes[new_idx], self.classes[current_idx]
-
-        for ann_id, ann in self.annotations.items():
-            if ann['class_id'] == current_idx:
-                ann['class_id'] = new_idx
-            elif ann['class_id'] == new_idx:
-                ann['class_id'] = current_idx
-
-        if self.current_class == current_idx:
-            self.current_class = new_idx
-        elif self.current_class == new_idx:
-            self.current_class = current_idx
+        new_classes = list(self.classes)
+        new_classes[current_idx], new_classes[new_idx] = new_classes[new_idx], new_classes[current_idx]
 
-        self.class_colors = {}
-        self.update_classes_listbox()
-        self.save_annotations()
-        self.display_image()
+        def select_moved():
+            self.classes_listbox.selection_clear(0, tk.END)
+            self.classes_listbox.selection_set(new_idx)
+            self.classes_listbox.see(new_idx)
 
-        self.classes_listbox.selection_set(new_idx)
-        self.classes_listbox.see(new_idx)
+        self.remap_classes(swap_mapping(len(self.classes), current_idx, new_idx), new_classes,
+                           on_done=select_moved)
 
     def remove_annotations_for_class(self, class_id):
         """Remove all annotations for a given class_id"""
         annotations_to_delete = [
-            ann_id for ann_id, ann in self.annotations.items()
-            if ann['class_id'] == class_id
+            ann_id for ann_id, ann_class, _ in self.annotations.items()
+            if ann_class == class_id
         ]
-        for ann_id in annotations_to_delete:
-            del self.annotations[ann_id]
+        self.annotations.remove_many(annotations_to_delete)
         self.save_annotations()
 
     def import_classes(self):
@@ -573,10 +1029,17 @@ class AnnotationApp:
                 imported_classes = json.load(f)
 
             if isinstance(imported_classes, list):
-                self.classes = imported_classes
-                self.update_classes_listbox()
-                self.refresh_annotations()
-                messagebox.showinfo("Success", "Classes imported successfully")
+                # Labels keep their class by name, whatever its position in the imported list
+                mapping = name_mapping(self.classes, imported_classes)
+                missing = [self.classes[class_id] for class_id, new_id in mapping.items() if new_id is None]
+                if missing and not messagebox.askyesno(
+                        "Import Classes",
+                        f"Classes {', '.join(missing)} are not in the imported list. "
+                        f"Their annotations will be removed from all label files. Continue?"):
+                    return
+
+                self.remap_classes(mapping, imported_classes,
+                                   on_done=lambda: messagebox.showinfo("Success", "Classes imported successfully"))
             else:
                 messagebox.showerror("Error", "Invalid format: expected list of classes")
         except Exception as e:
@@ -602,6 +1065,184 @@ class AnnotationApp:
         except Exception as e:
             messagebox.showerror("Error", f"Failed to export classes: {e}")
 
+    def show_statistics(self):
+        """Compute class balance and polygon statistics of the folder in the background and show them"""
+        if self.source is None or self.source.is_video:
+            messagebox.showinfo("Info", "Open an image folder to see its statistics")
+            return
+
+        # Statistics are computed from the files, write pending labels first
+        if self.current_polygon:
+            self.save_current_polygon()
+        self.commit_annotations()
+        self.writer.flush()
+
+        folder = self.image_folder
+        classes = list(self.classes)
+        outcome = {}
+
+        # The sync replaces the label cache file, which can't happen while it is mapped on Windows
+        if self.label_cache is not None:
+            self.label_cache.close()
+
+        def run():
+            try:
+                outcome['stats'] = folder_stats(folder, classes)
+            except Exception as e:
+                outcome['error'] = e
+
+        def poll():
+            if thread.is_alive():
+                self.root.after(100, poll)
+                return
+            if self.label_cache is not None and self.image_folder == folder:
+                self.label_cache = LabelCache(folder)
+            if 'error' in outcome:
+                messagebox.showerror("Error", f"Failed to compute statistics: {outcome['error']}")
+                return
+            self.status_bar.config(text=f"Statistics ready ({outcome['stats']['parsed_files']} label files read)")
+            self.open_statistics_window(outcome['stats'])
+
+        self.status_bar.config(text="Computing statistics...")
+        thread = threading.Thread(target=run, name="dataset-stats", daemon=True)
+        thread.start()
+        self.root.after(100, poll)
+
+    def open_statistics_window(self, stats):
+        window = tk.Toplevel(self.root)
+        window.title("Dataset Statistics")
+        window.transient(self.root)
+
+        ppi = stats['polygons_per_image']
+        vpp = stats['vertices_per_polygon']
+        area = stats['area']
+        summary = [f"Images: {stats['images']} ({stats['labeled_images']} labeled)",
+                   f"Polygons: {stats['polygons']}, vertices: {stats['vertices']}"]
+        if ppi['count']:
+            summary.append(f"Polygons per image: mean {ppi['mean']:.1f}, median {ppi['p50']:.0f}, "
+                           f"p95 {ppi['p95']:.0f}")
+        if vpp['count']:
+            summary.append(f"Vertices per polygon: mean {vpp['mean']:.1f}, median {vpp['p50']:.0f}, "
+                           f"p95 {vpp['p95']:.0f}")
+            summary.append(f"Object area (share of image): median {area['p50']:.4f}, "
+                           f"p5 {area['p5']:.4f}, p95 {area['p95']:.4f}")
+        tk.Label(window, text="\n".join(summary), justify=tk.LEFT, anchor='w').pack(fill=tk.X, padx=10, pady=10)
+
+        columns = ('class', 'polygons', 'images', 'share', 'area', 'vertices')
+        headings = ('Class', 'Polygons', 'Images', 'Share', 'Mean area', 'Mean vertices')
+        tree = ttk.Treeview(window, columns=columns, show='headings', height=min(20, len(stats['classes']) + 1))
+        for column, heading in zip(columns, headings):
+            tree.heading(column, text=heading)
+            tree.column(column, width=160 if column == 'class' else 90, anchor=tk.W if column == 'class' else tk.E)
+        for entry in stats['classes']:
+            tree.insert('', tk.END, values=(entry['name'], entry['polygons'], entry['images'],
+                                            f"{entry['share']:.1%}", f"{entry['mean_area']:.4f}",
+                                            f"{entry['mean_vertices']:.1f}"))
+        tree.pack(fill=tk.BOTH, expand=True, padx=10)
+
+        def save_report():
+            file_path = filedialog.asksaveasfilename(
+                parent=window, defaultextension=".json", initialfile="dataset_stats.json",
+                filetypes=[("JSON files", "*.json")])
+            if not file_path:
+                return
+            try:
+                write_report(stats, file_path, os.path.splitext(file_path)[0] + ".csv")
+            except OSError as e:
+                messagebox.showerror("Error", f"Failed to save report: {e}", parent=window)
+
+        tk.Button(window, text="Save Report (JSON + CSV)", command=save_report).pack(pady=10)
+
+    def remap_classes(self, mapping, new_classes, on_done=None):
+        """Switch to new_classes, rewriting the class ids of every label file of the folder by mapping"""
+        if self.remap_thread is not None:
+            messagebox.showinfo("Info", "A class remap is already running")
+            return
+
+        if not self.images or is_identity(mapping):
+            self.finish_class_remap(new_classes, mapping)
+            if on_done is not None:
+                on_done()
+            return
+
+        # Labels of the open image have to be on disk before the files are rewritten
+        if self.current_polygon:
+            self.save_current_polygon()
+        self.commit_annotations()
+        self.writer.flush()
+
+        job = ClassRemapJob(self.image_folder, mapping, new_classes, progress=self.on_remap_progress)
+        self.start_class_remap(job.run, new_classes, mapping, on_done)
+
+    def start_class_remap(self, action, new_classes, mapping, on_done=None):
+        """Run a remap job action in a background thread behind a modal progress window"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Remapping Classes")
+        dialog.transient(self.root)
+        dialog.resizable(False, False)
+        dialog.protocol("WM_DELETE_WINDOW", lambda: None)
+        progress_label = tk.Label(dialog, text="Preparing...", width=40, anchor=tk.W)
+        progress_label.pack(padx=10, pady=(10, 5))
+        progress_bar = ttk.Progressbar(dialog, length=300, mode='determinate')
+        progress_bar.pack(padx=10, pady=(0, 10))
+        dialog.grab_set()
+
+        outcome = {}
+
+        def run():
+            try:
+                outcome['result'] = action()
+            except Exception as e:
+                outcome['error'] = e
+
+        def poll():
+            if self.remap_progress is not None:
+                phase, done, total = self.remap_progress
+                progress_label.config(text=f"{phase.capitalize()}: {done}/{total} label files")
+                progress_bar.config(maximum=max(total, 1), value=done)
+
+            if self.remap_thread.is_alive():
+                self.root.after(100, poll)
+                return
+
+            self.remap_thread = None
+            self.remap_progress = None
+            dialog.grab_release()
+            dialog.destroy()
+
+            if 'error' in outcome:
+                messagebox.showerror("Error", f"Class remap failed: {outcome['error']}\n"
+                                              f"Reopen the folder to resume or roll it back.")
+                return
+
+            if new_classes is not None:
+                self.finish_class_remap(new_classes, mapping)
+            if on_done is not None:
+                on_done()
+
+        self.remap_progress = None
+        self.remap_thread = threading.Thread(target=run, name="class-remap", daemon=True)
+        self.remap_thread.start()
+        self.root.after(100, poll)
+
+    def on_remap_progress(self, phase, done, total):
+        # Called on the remap thread, the progress window picks it up
+        self.remap_progress = (phase, done, total)
+
+    def finish_class_remap(self, new_classes, mapping):
+        self.classes = list(new_classes)
+        self.class_colors = {}  # Reset colors to regenerate
+        if self.current_class is not None:
+            self.current_class = mapping.get(self.current_class, self.current_class)
+            if self.current_class is not None and self.current_class >= len(self.classes):
+                self.current_class = None
+        self.update_classes_listbox()
+
+        # Polygon counts change when a class is removed
+        if self.dataset_index is not None:
+            self.dataset_index.refresh()
+        self.refresh_annotations()
+
     def refresh_annotations(self):
         """Refresh annotations after class changes"""
         if self.current_image_index != -1:
@@ -613,6 +1254,10 @@ class AnnotationApp:
         if not self.images or self.current_image_index == -1:
             return
 
+        if self.source.is_video:
+            messagebox.showinfo("Info", "Video frames cannot be renamed")
+            return
+
         old_name = self.images[self.current_image_index]
         new_name = simpledialog.askstring("Rename Image", "Enter new image name:",
                                           initialvalue=old_name)
@@ -625,6 +1270,10 @@ class AnnotationApp:
             messagebox.showerror("Error", "Image with this name already exists")
             return
 
+        # The label file is renamed along with the image, write pending changes first
+        self.commit_annotations()
+        self.writer.flush(label_path_for(self.image_folder, old_name))
+
         try:
             # Rename image file
             old_path = os.path.join(self.image_folder, old_name)
@@ -643,6 +1292,8 @@ class AnnotationApp:
 
             # Update images list
             self.images[self.current_image_index] = new_name
+            if self.dataset_index is not None:
+                self.dataset_index.rename(old_name, new_name)
             self.display_image()
 
         except Exception as e:
@@ -710,21 +1361,60 @@ class AnnotationApp:
             self.load_annotations(self.images[self.current_image_index])
             self.display_image()
 
+    def next_unlabeled_image(self):
+        if not self.images or (self.dataset_index is None and not self.source.is_video):
+            return
+
+        # Count the annotations of the current image before searching
+        if self.current_polygon:
+            self.save_current_polygon()
+        self.commit_annotations()
+
+        if self.dataset_index is not None:
+            index = self.dataset_index.next_unlabeled(self.current_image_index)
+        else:
+            index = self.next_unlabeled_frame()
+        if index is None:
+            self.status_bar.config(text="All images are labeled")
+            return
+
+        self.save_annotations()
+        self.current_image_index = index
+        self.load_annotations(self.images[self.current_image_index])
+        self.display_image()
+
+    def next_unlabeled_frame(self):
+        """Index of the next video frame without polygons after the current one, wrapping around, or None"""
+        count = len(self.images)
+        for offset in range(1, count + 1):
+            index = (self.current_image_index + offset) % count
+            annotation_path = label_path_for(self.image_folder, self.images[index])
+            pending = self.writer.pending(annotation_path)
+            if pending is not None:
+                if not pending.strip():
+                    return index
+            else:
+                stamp = file_stamp(annotation_path)
+                if stamp is None or stamp[1] == 0:
+                    return index
+        return None
+
     def save_current_polygon(self):
         """Save the current polygon if it has enough points"""
         if len(self.current_polygon) >= 3:
-            self.annotations[self.current_annotation_id] = {
-                'class_id': self.current_class,
-                'points': self.current_polygon
-            }
-            self.current_annotation_id += 1
+            ann_id = self.annotations.add(self.current_class, self.current_polygon)
             self.current_polygon = []
             self.save_annotations()
+            self.refresh_annotation(ann_id)
 
     def delete_current_image(self):
         if not self.images or self.current_image_index == -1:
             return
 
+        if self.source.is_video:
+            messagebox.showinfo("Info", "Video frames cannot be deleted, use Clear All to drop their labels")
+            return
+
         image_file = self.images[self.current_image_index]
         confirm = messagebox.askyesno("Delete Image", f"Delete {image_file}?")
 
@@ -740,6 +1430,7 @@ class AnnotationApp:
             # Delete annotation file if exists
             annotation_file = os.path.splitext(image_file)[0] + ".txt"
             annotation_path = os.path.join(self.image_folder, annotation_file)
+            self.forget_pending_annotations(image_file)
             if os.path.exists(annotation_path):
                 try:
                     os.remove(annotation_path)
@@ -748,6 +1439,8 @@ class AnnotationApp:
 
             # Update UI
             self.images.pop(self.current_image_index)
+            if self.dataset_index is not None:
+                self.dataset_index.remove(image_file)
             if self.current_image_index >= len(self.images):
                 self.current_image_index = len(self.images) - 1
 
@@ -756,17 +1449,20 @@ class AnnotationApp:
                 self.display_image()
             else:
                 self.current_image_index = -1
-                self.canvas.delete("all")
+                self.current_image_path = None
+                self.scene.reset()
+                self.annotation_index.clear()
                 self.status_bar.config(text="No images in folder")
 
     def delete_selected_polygon(self):
         if hasattr(self, 'selected_polygon_id') and self.selected_polygon_id is not None:
             if self.selected_polygon_id in self.annotations:
                 # Delete the polygon that's actually selected
-                del self.annotations[self.selected_polygon_id]
+                self.annotations.remove(self.selected_polygon_id)
                 self.save_annotations()
-                self.selected_polygon_id = None  # Clear selection after deletion
-                self.display_image()
+                self.scene.remove(self.selected_polygon_id)
+                self.annotation_index.remove(self.selected_polygon_id)
+                self.select_polygon(None)  # Clear selection after deletion
         else:
             messagebox.showinfo("Info", "No polygon selected")
 
@@ -780,9 +1476,13 @@ class AnnotationApp:
             return
 
         if self.selected_polygon_id in self.annotations:
-            self.annotations[self.selected_polygon_id]['class_id'] = self.current_class
+            self.annotations.set_class(self.selected_polygon_id, self.current_class)
             self.save_annotations()
-            self.display_image()
+            if self.selected_polygon_id in self.scene.items:
+                self.scene.update_style(self.selected_polygon_id,
+                                        self.to_canvas(self.annotations.points(self.selected_polygon_id)),
+                                        self.get_class_color(self.current_class),
+                                        self.class_label(self.current_class))
         else:
             messagebox.showinfo("Info", "Selected polygon no longer exists")
 
@@ -792,38 +1492,42 @@ class AnnotationApp:
 
         confirm = messagebox.askyesno("Clear All", "Delete all annotations for this image?")
         if confirm:
-            self.annotations = {}
+            self.annotations.clear()
             self.save_annotations()
-            self.display_image()
+            self.scene.clear()
+            self.annotation_index.clear()
 
     def canvas_left_click(self, event):
         if not self.classes or self.current_class is None:
             messagebox.showwarning("Warning", "Please select a class first")
             return
 
+        if self.image_size is None:
+            return
+
         # Check if we're dragging a vertex (with Ctrl pressed)
         if self.ctrl_pressed:
-            clicked_items = self.canvas.find_overlapping(event.x - 5, event.y - 5, event.x + 5, event.y + 5)
-            for item in clicked_items:
-                tags = self.canvas.gettags(item)
-                if "vertex" in tags:
-                    parts = tags[1].split("_")
-                    ann_id = int(parts[1])
-                    vertex_idx = int(parts[2])
-                    self.dragging_vertex = (ann_id, vertex_idx)
-                    self.dragging_offset = (event.x, event.y)
-                    # Select the polygon when dragging its vertex
-                    self.selected_polygon_id = ann_id
-                    # Redraw to update selection
-                    self.display_image()
-                    return
+            x, y = self.to_normalized(event.x, event.y)
+            vertex = self.annotation_index.nearest_vertex(x, y, 5, self.canvas_scale())
+            if vertex is not None:
+                ann_id, vertex_idx, _ = vertex
+                self.dragging_vertex = (ann_id, vertex_idx)
+                self.dragging_offset = (event.x, event.y)
+                # Select the polygon when dragging its vertex
+                self.select_polygon(ann_id)
+                return
+
+            # Ctrl+click inside a polygon selects the topmost one
+            containing = self.annotation_index.polygons_at(x, y)
+            if containing:
+                self.select_polygon(containing[-1])
             return
 
         # If in solid line mode and not dragging vertex
         if self.solid_line_mode and self.dragging_vertex is None:
             img_x = (event.x - self.image_position[0]) / self.image_ratio
             img_y = (event.y - self.image_position[1]) / self.image_ratio
-            img_width, img_height = self.current_image.size
+            img_width, img_height = self.image_size
 
             if 0 <= img_x <= img_width and 0 <= img_y <= img_height:
                 normalized_x = img_x / img_width
@@ -832,40 +1536,26 @@ class AnnotationApp:
                 self.solid_line_id = "solid_" + str(id(self))
                 self.is_drawing_solid_line = True
                 # Clear selection when starting new annotation
-                self.selected_polygon_id = None
-                self.display_image()
+                self.select_polygon(None)
             return
 
         # Check if clicked on vertex
-        clicked_items = self.canvas.find_overlapping(event.x - 5, event.y - 5, event.x + 5, event.y + 5)
-        vertex_clicked = False
-
-        for item in clicked_items:
-            tags = self.canvas.gettags(item)
-            if "vertex" in tags:
-                vertex_clicked = True
-                break
-
-        if vertex_clicked:
-            return
-
-        # Check if clicked on polygon (to select it)
-        for item in clicked_items:
-            tags = self.canvas.gettags(item)
-            if "polygon" in tags:
-                # Get the actual annotation ID from the tags
-                clicked_polygon_id = int(tags[1].split("_")[1])
-                # Update the selected polygon ID
-                self.selected_polygon_id = clicked_polygon_id
-                # Redraw to update selection
-                self.display_image()
-                return
+        x, y = self.to_normalized(event.x, event.y)
+        scale = self.canvas_scale()
+        if self.annotation_index.nearest_vertex(x, y, 5, scale) is not None:
+            return
+
+        # Check if clicked on a polygon outline (to select it)
+        edge = self.annotation_index.nearest_edge(x, y, 5, scale)
+        if edge is not None:
+            self.select_polygon(edge[0])
+            return
 
         # Normal point-by-point mode
         if not self.solid_line_mode and not self.ctrl_pressed:
             img_x = (event.x - self.image_position[0]) / self.image_ratio
             img_y = (event.y - self.image_position[1]) / self.image_ratio
-            img_width, img_height = self.current_image.size
+            img_width, img_height = self.image_size
 
             if 0 <= img_x <= img_width and 0 <= img_y <= img_height:
                 normalized_x = img_x / img_width
@@ -873,19 +1563,17 @@ class AnnotationApp:
                 self.current_polygon.append((normalized_x, normalized_y))
                 self.draw_current_polygon(event.x, event.y)
                 # Clear selection when starting new annotation
-                self.selected_polygon_id = None
+                self.select_polygon(None)
 
     def handle_vertex_grab(self, event):
-        clicked_items = self.canvas.find_overlapping(event.x - 5, event.y - 5, event.x + 5, event.y + 5)
-        for item in clicked_items:
-            tags = self.canvas.gettags(item)
-            if "vertex" in tags:
-                parts = tags[1].split("_")
-                ann_id = int(parts[1])
-                vertex_idx = int(parts[2])
-                self.dragging_vertex = (ann_id, vertex_idx)
-                self.dragging_offset = (event.x, event.y)
-                return
+        if self.image_size is None:
+            return
+        x, y = self.to_normalized(event.x, event.y)
+        vertex = self.annotation_index.nearest_vertex(x, y, 5, self.canvas_scale())
+        if vertex is not None:
+            ann_id, vertex_idx, _ = vertex
+            self.dragging_vertex = (ann_id, vertex_idx)
+            self.dragging_offset = (event.x, event.y)
 
     def canvas_left_release(self, event):
         if self.solid_line_mode and self.is_drawing_solid_line:
@@ -902,14 +1590,14 @@ class AnnotationApp:
         elif len(self.current_polygon) >= 3:
             # Save the polygon
             self.save_current_polygon()
-            self.display_image()
+            self.canvas.delete("preview")
 
     def canvas_mouse_move(self, event):
         if self.solid_line_mode and self.is_drawing_solid_line:
             # Update solid line preview only when drawing (LMB pressed)
             img_x = (event.x - self.image_position[0]) / self.image_ratio
             img_y = (event.y - self.image_position[1]) / self.image_ratio
-            img_width, img_height = self.current_image.size
+            img_width, img_height = self.image_size
 
             if 0 <= img_x <= img_width and 0 <= img_y <= img_height:
                 normalized_x = img_x / img_width
@@ -933,7 +1621,7 @@ class AnnotationApp:
         self.canvas.delete("preview")
 
         # Convert normalized coordinates to canvas coordinates
-        img_width, img_height = self.current_image.size
+        img_width, img_height = self.image_size
         scaled_points = [
             (point[0] * img_width * self.image_ratio + self.image_position[0],
              point[1] * img_height * self.image_ratio + self.image_position[1])
@@ -953,8 +1641,9 @@ class AnnotationApp:
         if len(self.solid_line_points) < 2:
             return
 
-        # Simplify the points to reduce the number of vertices
-        simplified_points = self.simplify_points(self.solid_line_points)
+        # Simplify the points to reduce the number of vertices, the tolerance is given in screen pixels
+        simplified_points = simplify_points(self.solid_line_points, self.SIMPLIFY_TOLERANCE / self.image_ratio,
+                                            self.image_size, self.SIMPLIFY_MAX_VERTICES)
 
         # Ensure the area is closed by connecting first and last points
         if simplified_points[0] != simplified_points[-1]:
@@ -968,38 +1657,6 @@ class AnnotationApp:
         self.solid_line_points = []
         self.solid_line_id = None
         self.canvas.delete("preview")
-        self.display_image()
-
-    def simplify_points(self, points, tolerance=0.005):
-        """Reduce the number of points using a combination of interpolation and Douglas-Peucker algorithm"""
-        if len(points) <= 3:
-            return points.copy()
-
-        # Convert points to numpy array for processing
-        points_array = np.array(points)
-        x = points_array[:, 0]
-        y = points_array[:, 1]
-
-        # Fit a spline to the points
-        try:
-            tck, u = splprep([x, y], s=0, per=False)
-        except:
-            # If spline fitting fails, just return every 3rd point
-            return points[::3] + [points[-1]]
-
-        # Evaluate the spline at fewer points
-        new_u = np.linspace(0, 1, max(20, len(points) // 3))
-        new_x, new_y = splev(new_u, tck)
-
-        # Combine the new points
-        simplified = list(zip(new_x, new_y))
-
-        # Ensure we keep the first and last points
-        if len(simplified) > 0:
-            simplified[0] = points[0]
-            simplified[-1] = points[-1]
-
-        return simplified
 
     def canvas_drag(self, event):
         if self.dragging_vertex is not None and self.ctrl_pressed:
@@ -1007,17 +1664,17 @@ class AnnotationApp:
             if ann_id in self.annotations:
                 img_x = (event.x - self.image_position[0]) / self.image_ratio
                 img_y = (event.y - self.image_position[1]) / self.image_ratio
-                img_width, img_height = self.current_image.size
+                img_width, img_height = self.image_size
 
                 img_x = max(0, min(img_x, img_width))
                 img_y = max(0, min(img_y, img_height))
 
                 normalized_x = img_x / img_width
                 normalized_y = img_y / img_height
-                self.annotations[ann_id]['points'][vertex_idx] = (normalized_x, normalized_y)
+                self.annotations.set_point(ann_id, vertex_idx, (normalized_x, normalized_y))
 
                 self.save_annotations()
-                self.display_image()
+                self.refresh_annotation(ann_id, vertex_idx)
         elif self.is_drawing_solid_line:
             self.canvas_mouse_move(event)
 
@@ -1028,60 +1685,34 @@ class AnnotationApp:
 
         img_x = (event.x - self.image_position[0]) / self.image_ratio
         img_y = (event.y - self.image_position[1]) / self.image_ratio
-        img_width, img_height = self.current_image.size
+        img_width, img_height = self.image_size
 
         img_x = max(0, min(img_x, img_width))
         img_y = max(0, min(img_y, img_height))
 
         normalized_x = img_x / img_width
         normalized_y = img_y / img_height
-        self.annotations[ann_id]['points'][vertex_idx] = (normalized_x, normalized_y)
+        self.annotations.set_point(ann_id, vertex_idx, (normalized_x, normalized_y))
 
-        self.display_image()
+        self.refresh_annotation(ann_id, vertex_idx)
 
     def canvas_release(self, event):
         self.dragging_vertex = None
 
     def canvas_double_click(self, event):
-        if not self.solid_line_mode and hasattr(self, 'selected_polygon_id'):
-            clicked_items = self.canvas.find_overlapping(event.x - 5, event.y - 5, event.x + 5, event.y + 5)
-
-            for item in clicked_items:
-                tags = self.canvas.gettags(item)
-                if "polygon" in tags and f"polygon_{self.selected_polygon_id}" in tags:
-                    img_width, img_height = self.current_image.size
-                    points = [
-                        ((p[0] * img_width * self.image_ratio + self.image_position[0],
-                          p[1] * img_height * self.image_ratio + self.image_position[1]))
-                        for p in self.annotations[self.selected_polygon_id]['points']
-                    ]
-
-                    closest_edge = None
-                    min_dist = float('inf')
-                    new_point = None
-
-                    for i in range(len(points)):
-                        p1 = points[i]
-                        p2 = points[(i + 1) % len(points)]
-                        dist, closest = self.point_to_line_distance((event.x, event.y), p1, p2)
-
-                        if dist < min_dist:
-                            min_dist = dist
-                            closest_edge = i
-                            new_point = closest
-
-                    if closest_edge is not None and min_dist < 10:
-                        img_x = (new_point[0] - self.image_position[0]) / self.image_ratio
-                        img_y = (new_point[1] - self.image_position[1]) / self.image_ratio
-                        normalized_x = img_x / img_width
-                        normalized_y = img_y / img_height
-
-                        self.annotations[self.selected_polygon_id]['points'].insert(
-                            closest_edge + 1, (normalized_x, normalized_y))
-
-                        self.save_annotations()
-                        self.display_image()
-                        return
+        if self.solid_line_mode or self.image_size is None or self.selected_polygon_id not in self.annotations:
+            return
+
+        # Insert a vertex on the closest edge of the selected polygon
+        x, y = self.to_normalized(event.x, event.y)
+        edge = self.annotation_index.nearest_edge(x, y, 10, self.canvas_scale(),
+                                                  ann_ids={self.selected_polygon_id})
+        if edge is not None:
+            ann_id, closest_edge, _, new_point = edge
+            self.annotations.insert_point(ann_id, closest_edge + 1, new_point)
+
+            self.save_annotations()
+            self.refresh_annotation(ann_id)
 
     def draw_current_polygon(self, mouse_x=None, mouse_y=None):
         if not self.current_polygon:
@@ -1091,7 +1722,7 @@ class AnnotationApp:
         self.canvas.delete("preview")
 
         # Convert normalized coordinates to canvas coordinates
-        img_width, img_height = self.current_image.size
+        img_width, img_height = self.image_size
         scaled_points = [
             (point[0] * img_width * self.image_ratio + self.image_position[0],
              point[1] * img_height * self.image_ratio + self.image_position[1])
@@ -1127,37 +1758,16 @@ class AnnotationApp:
                 tags="preview"
             )
 
-    def point_to_line_distance(self, point, line_start, line_end):
-        # Calculate distance from point to line segment and the closest point on the line
-        line_vec = np.array([line_end[0] - line_start[0], line_end[1] - line_start[1]])
-        point_vec = np.array([point[0] - line_start[0], point[1] - line_start[1]])
-
-        line_len = np.linalg.norm(line_vec)
-        if line_len == 0:
-            return np.linalg.norm(point_vec), line_start
-
-        line_unit = line_vec / line_len
-        projection = np.dot(point_vec, line_unit)
-
-        if projection < 0:
-            closest = line_start
-        elif projection > line_len:
-            closest = line_end
-        else:
-            closest = line_start + line_unit * projection
-
-        dist = np.linalg.norm(np.array(point) - closest)
-        return dist, closest
-
     def undo_last_action(self, event=None):
         if self.current_polygon:
             self.current_polygon.pop()
             self.draw_current_polygon()
         elif self.annotations:
-            last_id = max(self.annotations.keys())
-            del self.annotations[last_id]
+            last_id = self.annotations.last_id()
+            self.annotations.remove(last_id)
             self.save_annotations()
-            self.display_image()
+            self.scene.remove(last_id)
+            self.annotation_index.remove(last_id)
 
     def on_class_selected(self, event):
         if not self.classes:
@@ -1197,109 +1807,225 @@ class AnnotationApp:
         self.select_class_by_index(new_index)
 
     def load_model(self):
+        """Load the model in the background, ultralytics and torch are only imported there"""
         model_path = "best.pt"
-        if os.path.exists(model_path):
+        if not os.path.exists(model_path) or self.model_loading:
+            return
+
+        backend = self.backend_var.get()
+        outcome = {}
+
+        def run():
             try:
-                self.model = YOLO(model_path)
-                self.model.eval()
-                self.status_bar.config(text="Model loaded successfully")
+                outcome['model'] = ModelBackend(model_path, backend)
             except Exception as e:
-                messagebox.showerror("Error", f"Failed to load model: {e}")
-                self.model = None
-        else:
-            self.model = None
-        # self.model = None
+                outcome['error'] = e
 
-    def auto_annotate_image(self):
-        if not self.model:
-            messagebox.showerror("Error", "Model 'best.pt' not found or failed to load")
-            return
+        def poll():
+            if thread.is_alive():
+                self.root.after(100, poll)
+                return
 
-        if not self.images or self.current_image_index == -1:
-            messagebox.showerror("Error", "No image loaded")
-            return
+            self.model_loading = False
+            if 'error' in outcome:
+                messagebox.showerror("Error", f"Failed to load model: {outcome['error']}")
+                return
 
-        if not self.classes:
-            messagebox.showerror("Error", "No classes defined")
+            # Results of the previous backend may differ, start over with a fresh worker
+            if self.inference is not None:
+                self.inference.close()
+            self.model = outcome['model']
+            self.inference = InferenceWorker(self.model, self.inference_cache)
+            self.status_bar.config(text=f"Model loaded successfully ({backend})")
+            self.speculate_neighbors()
+
+        self.model_loading = True
+        self.status_bar.config(text=f"Loading model ({backend})...")
+        thread = threading.Thread(target=run, name="model-load", daemon=True)
+        thread.start()
+        self.root.after(100, poll)
+
+    def propagate_from_previous(self):
+        """Track the polygons of the previous image onto the current one, the model takes over if tracking fails"""
+        if not self.images or self.current_image_index <= 0:
+            messagebox.showerror("Error", "No previous image")
             return
 
-        # Clear existing annotations
-        self.annotations = {}
-        self.current_annotation_id = 0
+        if self.current_polygon:
+            self.save_current_polygon()
+        self.commit_annotations()
 
-        # Get current image
+        prev_file = self.images[self.current_image_index - 1]
         image_file = self.images[self.current_image_index]
-        image_path = os.path.join(self.image_folder, image_file)
+        prev_labels = [(class_id, points) for class_id, points in self.read_annotations(prev_file)
+                       if class_id < len(self.classes)]
+        if not prev_labels:
+            self.status_bar.config(text="Previous image has no annotations")
+            return
 
         try:
-            # Run model prediction
-            results = self.model(image_path)
+            prev_gray = self.source.gray(prev_file)
+            gray = self.source.gray(image_file)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load images for tracking: {e}")
+            return
 
-            # Process results (assuming segmentation model)
-            for result in results:
-                if not result.masks:
-                    messagebox.showwarning("Warning", "Model doesn't output segmentation masks")
-                    return
+        labels, confidence = [], 0.0
+        if prev_gray.shape == gray.shape:
+            labels, confidence = propagate_polygons(prev_gray, gray, prev_labels)
+
+        if confidence < MIN_CONFIDENCE:
+            if self.model:
+                # Tracking lost, the model annotates the image instead
+                self.auto_annotate_image()
+            else:
+                # Nothing trustworthy to write, the image keeps its annotations
+                waiting = " while the model is loading" if self.model_loading else ""
+                self.status_bar.config(text=f"Tracking lost (tracked {confidence:.0%} of vertices), "
+                                            f"image left unchanged{waiting}")
+            return
 
-                img_width = result.orig_shape[1]
-                img_height = result.orig_shape[0]
+        self.annotations = PolygonStore.from_labels(labels)
+        self.save_annotations()
+        self.display_image()
+        self.status_bar.config(text=f"Propagated {len(labels)} of {len(prev_labels)} objects "
+                                    f"(tracked {confidence:.0%} of vertices)")
+
+    def inference_key(self, image_file):
+        """Key of the raw predictions of an image in the worker's memory cache"""
+        image_key = self.source.image_key(image_file)
+        return image_key, file_stamp(image_key)
+
+    def inference_job_args(self, image_file):
+        """(key, make_input, make_hash) of an image, the callables run on the inference worker"""
+        source = self.source
+        return (self.inference_key(image_file),
+                lambda: source.model_input(image_file),
+                lambda: source.content_hash(image_file))
+
+    def speculate_neighbors(self):
+        """Queue the next images for speculative inference while the option is enabled"""
+        if self.inference is None or not self.images or not self.classes:
+            return
 
-                for i, mask in enumerate(result.masks):
-                    class_id = int(result.boxes.cls[i].item())
-                    conf = result.boxes.conf[i].item()
+        items = []
+        if self.speculative_var.get():
+            for index in range(self.current_image_index + 1,
+                               min(self.current_image_index + 1 + self.SPECULATIVE_IMAGES, len(self.images))):
+                items.append(self.inference_job_args(self.images[index]))
+        self.inference.speculate(items)
 
-                    if conf < self.conf or class_id >= len(self.classes):
-                        continue
+    def auto_annotate_image(self):
+        if self.model_loading and not self.model:
+            messagebox.showinfo("Info", "The model is still loading, try again in a moment")
+            return
 
-                    # Get and process mask points
-                    mask_points = mask.xy[0]
-                    processed_points = []
+        if not self.model:
+            messagebox.showerror("Error", "Model 'best.pt' not found or failed to load")
+            return
 
-                    for point in mask_points:
-                        # Clamp coordinates to image boundaries
-                        x = max(0, min(point[0], img_width - 1))
-                        y = max(0, min(point[1], img_height - 1))
+        if not self.images or self.current_image_index == -1:
+            messagebox.showerror("Error", "No image loaded")
+            return
 
-                        # Convert to normalized coordinates
-                        x_norm = x / img_width
-                        y_norm = y / img_height
+        if not self.classes:
+            messagebox.showerror("Error", "No classes defined")
+            return
 
-                        # Ensure normalized coordinates are within [0, 1]
-                        x_norm = max(0.0, min(x_norm, 1.0))
-                        y_norm = max(0.0, min(y_norm, 1.0))
+        # Get current image
+        image_file = self.images[self.current_image_index]
 
-                        processed_points.append((x_norm, y_norm))
+        # Video frames are passed as decoded arrays, the worker loads them off the Tk thread
+        job = self.inference.request(*self.inference_job_args(image_file))
+        self.auto_annotate_job = (job, image_file)
+        if job.done():
+            self.finish_auto_annotate()
+        else:
+            self.status_bar.config(text=f"Auto-annotating {image_file}... (Esc to cancel)")
+            self.root.after(50, self.finish_auto_annotate)
+
+    def cancel_auto_annotate(self):
+        if self.auto_annotate_job is not None:
+            self.inference.cancel(self.auto_annotate_job[0])
+            self.auto_annotate_job = None
+            self.status_bar.config(text="Auto-annotation cancelled")
+
+    def finish_auto_annotate(self):
+        """Apply the result of the running auto-annotation once the worker has it"""
+        if self.auto_annotate_job is None:
+            return
 
-                    # Simplify points
-                    simplified_points = self.simplify_points(processed_points)
+        job, image_file = self.auto_annotate_job
+        if job.cancelled:
+            # The worker was replaced or closed, nothing will be applied
+            self.auto_annotate_job = None
+            self.status_bar.config(text="Auto-annotation cancelled")
+            return
+        if not job.done():
+            self.root.after(50, self.finish_auto_annotate)
+            return
+        self.auto_annotate_job = None
 
-                    # Ensure polygon is closed and valid
-                    if len(simplified_points) >= 3:
-                        if simplified_points[0] != simplified_points[-1]:
-                            simplified_points.append(simplified_points[0])
+        if job.error is not None:
+            messagebox.showerror("Error", f"Failed to auto-annotate: {job.error}")
+            return
 
-                        # Final validation of all points
-                        valid_points = []
-                        for x, y in simplified_points:
-                            if 0 <= x <= 1 and 0 <= y <= 1:
-                                valid_points.append((x, y))
+        # The user moved on, the result stays cached for when they come back
+        if not self.images or self.images[self.current_image_index] != image_file:
+            return
 
-                        if len(valid_points) >= 3:
-                            self.annotations[self.current_annotation_id] = {
-                                'class_id': class_id,
-                                'points': valid_points
-                            }
-                            self.current_annotation_id += 1
+        if self.current_polygon:
+            self.current_polygon = []
+            self.canvas.delete("preview")
+        self.apply_predictions(image_file, job.result, self.latency_note(job))
+
+    def apply_predictions(self, image_file, arrays, note="", refilter=False):
+        """Replace the annotations of the open image with the predictions above the confidence threshold.
+
+        Without any prediction the image keeps its annotations, only re-filtering
+        the untouched model output may leave it empty.
+        """
+        with span("inference.postprocess"):
+            polygons = masks_to_polygons(*arrays, self.conf, len(self.classes))
+        if not polygons and not refilter:
+            self.auto_annotate_result = None
+            self.status_bar.config(text=f"No valid objects found for auto-annotation{note}")
+            return
 
-            if self.annotations:
-                self.save_annotations()
-                self.display_image()
-                self.status_bar.config(text=f"Auto-annotated {len(self.annotations)} objects (simplified)")
-            else:
-                self.status_bar.config(text="No valid objects found for auto-annotation")
+        self.annotations = PolygonStore.from_labels(polygons)
+        self.save_annotations()
+        self.display_image()
+        self.auto_annotate_result = (image_file, arrays, self.annotations.format())
+        if polygons:
+            self.status_bar.config(text=f"Auto-annotated {len(polygons)} objects at confidence "
+                                        f"{self.conf:.2f} (simplified){note}")
+        else:
+            self.status_bar.config(text=f"No valid objects found for auto-annotation{note}")
+
+    def on_conf_changed(self, value):
+        self.conf = float(value)
+        # Dragging the slider fires many events, re-filter once it rests
+        if self.conf_job is not None:
+            self.root.after_cancel(self.conf_job)
+        self.conf_job = self.root.after(150, self.refilter_predictions)
+
+    def refilter_predictions(self):
+        """Apply the new threshold to the open image while it still shows untouched model output"""
+        self.conf_job = None
+        if self.auto_annotate_result is None or not self.images or self.current_image_index == -1:
+            return
 
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to auto-annotate: {e}")
+        image_file, arrays, contents = self.auto_annotate_result
+        if image_file != self.images[self.current_image_index] or self.annotations.format() != contents:
+            self.auto_annotate_result = None
+            return
+        self.apply_predictions(image_file, arrays, refilter=True)
+
+    def latency_note(self, job):
+        """Inference time of a job for the status bar, empty for results that were cached"""
+        if job.latency_ms is None:
+            return ""
+        return f" | {self.model.backend} {job.latency_ms:.0f} ms"
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,253 @@
+import numpy as np
+
+
+class PolygonStore:
+    """Polygons of one image with all vertices in one contiguous float32 array.
+
+    Every polygon is a row of the id/class/offset/count arrays and owns the
+    slice vertices[offset:offset + count]. Removing a polygon or giving it more
+    vertices leaves its old row or slice behind as garbage, which is compacted
+    away once it outweighs the live data, so single edits don't move the rest of
+    the image. Lookups by annotation id go through a dict of row numbers.
+    Iterating yields the annotation ids in the order the polygons were added.
+    """
+
+    __slots__ = ('vertices', 'ids', 'classes', 'offsets', 'counts', 'next_id',
+                 '_rows', '_num_rows', '_num_vertices', '_garbage')
+
+    def __init__(self, capacity=64, vertex_capacity=1024):
+        self.vertices = np.empty((vertex_capacity, 2), dtype=np.float32)
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.classes = np.empty(capacity, dtype=np.int32)
+        self.offsets = np.empty(capacity, dtype=np.int64)
+        self.counts = np.empty(capacity, dtype=np.int64)
+        self.next_id = 0
+        self._rows = {}  # ann_id -> row
+        self._num_rows = 0
+        self._num_vertices = 0
+        self._garbage = 0  # vertex slots no polygon uses anymore
+
+    @classmethod
+    def from_labels(cls, labels):
+        """Store holding a list of (class_id, points) tuples as read from a label file"""
+        labels = list(labels)
+        store = cls(max(len(labels), 64), max(sum(len(points) for _, points in labels), 1024))
+        store.extend([class_id for class_id, _ in labels], [points for _, points in labels])
+        return store
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, ann_id):
+        return ann_id in self._rows
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        ids = self.ids[:self._num_rows]
+        return ids[ids >= 0].tolist()
+
+    def items(self):
+        """(ann_id, class_id, points) of every polygon, points are views into the vertex buffer"""
+        for ann_id in self.keys():
+            row = self._rows[ann_id]
+            yield ann_id, int(self.classes[row]), self._slice(row)
+
+    def last_id(self):
+        """Largest annotation id in the store, or None"""
+        return max(self._rows) if self._rows else None
+
+    def clear(self):
+        self._rows = {}
+        self._num_rows = 0
+        self._num_vertices = 0
+        self._garbage = 0
+
+    def add(self, class_id, points, ann_id=None):
+        """Add a polygon and return its annotation id, an existing polygon with the same id is replaced"""
+        return self.extend([class_id], [points], None if ann_id is None else [ann_id])[0]
+
+    def extend(self, class_ids, polygons, ann_ids=None):
+        """Add many polygons with one copy into the vertex buffer, returns their annotation ids"""
+        if not polygons:
+            return []
+
+        arrays = [np.asarray(points, dtype=np.float32).reshape(-1, 2) for points in polygons]
+        if ann_ids is None:
+            ann_ids = list(range(self.next_id, self.next_id + len(arrays)))
+        for ann_id in ann_ids:
+            if ann_id in self._rows:
+                self.remove(ann_id)
+
+        counts = np.array([len(points) for points in arrays], dtype=np.int64)
+        first_row, first_vertex = self._reserve(len(arrays), int(counts.sum()))
+        rows = slice(first_row, first_row + len(arrays))
+
+        self.vertices[first_vertex:first_vertex + counts.sum()] = np.concatenate(arrays)
+        self.ids[rows] = ann_ids
+        self.classes[rows] = class_ids
+        self.counts[rows] = counts
+        self.offsets[rows] = first_vertex + np.cumsum(counts) - counts
+
+        for row, ann_id in enumerate(ann_ids, first_row):
+            self._rows[ann_id] = row
+        self.next_id = max(self.next_id, max(ann_ids) + 1)
+        return list(ann_ids)
+
+    def remove(self, ann_id):
+        row = self._rows.pop(ann_id)
+        self.ids[row] = -1
+        self._garbage += int(self.counts[row])
+        self._maybe_compact()
+
+    def remove_many(self, ann_ids):
+        for ann_id in ann_ids:
+            row = self._rows.pop(ann_id)
+            self.ids[row] = -1
+            self._garbage += int(self.counts[row])
+        self._maybe_compact()
+
+    def points(self, ann_id):
+        """(N, 2) view of a polygon's vertices, only valid until the store changes"""
+        return self._slice(self._rows[ann_id])
+
+    def point_count(self, ann_id):
+        return int(self.counts[self._rows[ann_id]])
+
+    def class_id(self, ann_id):
+        return int(self.classes[self._rows[ann_id]])
+
+    def set_class(self, ann_id, class_id):
+        self.classes[self._rows[ann_id]] = class_id
+
+    def set_point(self, ann_id, index, point):
+        row = self._rows[ann_id]
+        self.vertices[self.offsets[row] + index] = point
+
+    def insert_point(self, ann_id, index, point):
+        points = self.points(ann_id)
+        self.set_points(ann_id, np.insert(points, index, point, axis=0))
+
+    def set_points(self, ann_id, points):
+        """Replace a polygon's vertices, in place unless it has to grow"""
+        row = self._rows[ann_id]
+        points = np.array(points, dtype=np.float32).reshape(-1, 2)
+        count = len(points)
+        offset = int(self.offsets[row])
+        old_count = int(self.counts[row])
+
+        if count <= old_count:
+            self._garbage += old_count - count
+        else:
+            if offset + old_count == self._num_vertices:
+                # Last polygon of the buffer, it grows in place unless the buffer is full
+                self._num_vertices = offset
+            else:
+                self._garbage += old_count
+            self.counts[row] = 0
+            _, offset = self._reserve(0, count)
+            row = self._rows[ann_id]  # Reserving may have compacted the rows
+
+        self.vertices[offset:offset + count] = points
+        self.offsets[row] = offset
+        self.counts[row] = count
+
+    def bounds(self):
+        """Return (ann_ids, (P, 4) array of x0, y0, x1, y1) of all non-empty polygons"""
+        rows = np.flatnonzero((self.ids[:self._num_rows] >= 0) & (self.counts[:self._num_rows] > 0))
+        if not len(rows):
+            return np.empty(0, dtype=np.int64), np.empty((0, 4), dtype=np.float32)
+
+        # Gather every polygon's own slice, a grown polygon lives after the others in the buffer
+        counts = self.counts[rows]
+        starts = np.cumsum(counts) - counts
+        vertices = self.vertices[np.repeat(self.offsets[rows] - starts, counts) + np.arange(int(counts.sum()))]
+        mins = np.minimum.reduceat(vertices, starts)
+        maxs = np.maximum.reduceat(vertices, starts)
+        return self.ids[rows], np.hstack([mins, maxs])
+
+    def ids_in_box(self, x0, y0, x1, y1):
+        """Ids of the polygons whose bounding box intersects the rectangle"""
+        ann_ids, boxes = self.bounds()
+        inside = (boxes[:, 0] <= x1) & (boxes[:, 2] >= x0) & (boxes[:, 1] <= y1) & (boxes[:, 3] >= y0)
+        return ann_ids[inside].tolist()
+
+    def transformed(self, scale, offset, ann_ids=None):
+        """(ann_id, class_id, points list) of polygons with every vertex mapped to vertex * scale + offset.
+
+        All vertices are transformed in one array operation, only the slicing is per polygon.
+        """
+        scale = np.asarray(scale, dtype=np.float64)
+        offset = np.asarray(offset, dtype=np.float64)
+        transformed = self.vertices[:self._num_vertices] * scale + offset
+        for ann_id in (self.keys() if ann_ids is None else ann_ids):
+            row = self._rows[ann_id]
+            start = self.offsets[row]
+            yield ann_id, int(self.classes[row]), transformed[start:start + self.counts[row]].tolist()
+
+    def format(self, precision=6):
+        """Contents of a YOLO label file, coordinates with a fixed number of decimals"""
+        coordinate = f" %.{precision}f"
+        templates = {}
+        lines = []
+        for ann_id, class_id, points in self.items():
+            count = points.size
+            if count not in templates:
+                templates[count] = "%d" + coordinate * count + "\n"
+            lines.append(templates[count] % (class_id, *points.ravel().tolist()))
+        return "".join(lines)
+
+    def compact(self):
+        """Drop removed rows and unused vertex slots, keeping the order of the polygons"""
+        if self._garbage == 0 and len(self._rows) == self._num_rows:
+            return
+
+        rows = np.flatnonzero(self.ids[:self._num_rows] >= 0)
+        counts = self.counts[rows]
+        new_offsets = np.cumsum(counts) - counts
+        total = int(counts.sum())
+        gather = np.repeat(self.offsets[rows] - new_offsets, counts) + np.arange(total)
+
+        self.vertices[:total] = self.vertices[gather]
+        for array in (self.ids, self.classes, self.counts):
+            array[:len(rows)] = array[rows]
+        self.offsets[:len(rows)] = new_offsets
+
+        self._num_rows = len(rows)
+        self._num_vertices = total
+        self._garbage = 0
+        self._rows = {ann_id: row for row, ann_id in enumerate(self.ids[:self._num_rows].tolist())}
+
+    def _slice(self, row):
+        start = self.offsets[row]
+        return self.vertices[start:start + self.counts[row]]
+
+    def _maybe_compact(self):
+        if self._garbage > max(1024, self._num_vertices - self._garbage):
+            self.compact()
+
+    def _reserve(self, num_rows, num_vertices):
+        """Make room for rows and vertices at the end of the arrays, returns the first of each"""
+        if (self._num_rows + num_rows > len(self.ids) or
+                self._num_vertices + num_vertices > len(self.vertices)):
+            self.compact()
+
+        if self._num_rows + num_rows > len(self.ids):
+            capacity = max(2 * len(self.ids), self._num_rows + num_rows)
+            for name in ('ids', 'classes', 'offsets', 'counts'):
+                array = getattr(self, name)
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[:self._num_rows] = array[:self._num_rows]
+                setattr(self, name, grown)
+
+        if self._num_vertices + num_vertices > len(self.vertices):
+            capacity = max(2 * len(self.vertices), self._num_vertices + num_vertices)
+            grown = np.empty((capacity, 2), dtype=np.float32)
+            grown[:self._num_vertices] = self.vertices[:self._num_vertices]
+            self.vertices = grown
+
+        first_row, first_vertex = self._num_rows, self._num_vertices
+        self._num_rows += num_rows
+        self._num_vertices += num_vertices
+        return first_row, first_vertex
@@ -0,0 +1,131 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+
+class _NullSpan:
+    """Shared do-nothing context manager returned by span() while profiling is off"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns())
+        return False
+
+
+class Profiler:
+    """Span timer for the app's hot paths.
+
+    While disabled, span() is one attribute check returning a shared no-op
+    context manager, so instrumented code costs next to nothing. While enabled,
+    every span is kept as a complete event in a bounded ring buffer, from any
+    thread, and can be summarized or written as a Chrome trace (chrome://tracing
+    or Perfetto).
+    """
+
+    def __init__(self, enabled=False, max_events=100000, history=200):
+        self.enabled = enabled
+        self.history = history
+        self._events = deque(maxlen=max_events)  # (name, start_ns, end_ns, thread id)
+        self._recent = defaultdict(lambda: deque(maxlen=self.history))  # name -> durations in ms
+        self._thread_names = {}
+        self._origin_ns = time.perf_counter_ns()
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name, start_ns, end_ns):
+        """Add a finished span, deque appends are atomic so no lock is needed"""
+        thread_id = threading.get_ident()
+        if thread_id not in self._thread_names:
+            self._thread_names[thread_id] = threading.current_thread().name
+        self._events.append((name, start_ns, end_ns, thread_id))
+        self._recent[name].append((end_ns - start_ns) / 1e6)
+
+    def clear(self):
+        self._events.clear()
+        self._recent.clear()
+
+    def last(self, name):
+        """Milliseconds of the latest span with this name, or None"""
+        durations = self._recent.get(name)
+        return durations[-1] if durations else None
+
+    def summary(self):
+        """{name: (count, last, p50, p95)} in milliseconds over the recent spans of every name"""
+        result = {}
+        for name, durations in list(self._recent.items()):
+            values = np.array(durations)
+            if len(values):
+                result[name] = (len(values), float(values[-1]),
+                                float(np.percentile(values, 50)), float(np.percentile(values, 95)))
+        return result
+
+    def chrome_trace(self):
+        """Trace Event Format dict of the recorded spans"""
+        pid = os.getpid()
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread_id, 'args': {'name': name}}
+                  for thread_id, name in list(self._thread_names.items())]
+        for name, start_ns, end_ns, thread_id in list(self._events):
+            events.append({'name': name, 'cat': name.split('.', 1)[0], 'ph': 'X', 'pid': pid, 'tid': thread_id,
+                           'ts': (start_ns - self._origin_ns) / 1000.0, 'dur': (end_ns - start_ns) / 1000.0})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, path):
+        """Write the recorded spans as a Chrome trace JSON file, returns the number of spans"""
+        trace = self.chrome_trace()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(trace, f)
+        os.replace(tmp_path, path)
+        return sum(1 for event in trace['traceEvents'] if event['ph'] == 'X')
+
+
+# Process-wide profiler, MARKUP_PROFILE=1 turns it on from the start
+profiler = Profiler(enabled=os.environ.get("MARKUP_PROFILE", "") not in ("", "0"))
+
+
+def span(name):
+    """Time a block with the process-wide profiler: `with span("display.decode"): ...`"""
+    return profiler.span(name)
+
+
+def profiled(name):
+    """Decorator timing every call of a function as a span"""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            with _Span(profiler, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from auto_annotate import result_to_arrays, masks_to_polygons
+from dataset_index import DatasetIndex
+from frame_source import FolderSource, VideoSource, is_video
+from image_cache import file_stamp
+from inference_backends import BACKENDS, ModelBackend
+from labels import label_path_for, read_labels, write_labels_atomic
+from polygon_store import PolygonStore
+
+LK_PARAMS = dict(winSize=(21, 21), maxLevel=3,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01))
+# A vertex counts as tracked when tracking it back lands within this many pixels of where it started
+MAX_FORWARD_BACKWARD_ERROR = 1.0
+# Polygons with a smaller share of tracked vertices are dropped
+MIN_TRACKED_FRACTION = 0.5
+# Below this share of tracked vertices over the whole image the model is asked instead
+MIN_CONFIDENCE = 0.8
+
+
+def propagate_polygons(prev_gray, next_gray, labels):
+    """Carry (class_id, points) polygons from one grayscale frame to the next with pyramidal Lucas-Kanade.
+
+    Every vertex is tracked forward and back again, vertices whose round trip
+    misses are moved by the median motion of their polygon's tracked vertices.
+    Returns (labels, confidence), confidence is the share of tracked vertices.
+    """
+    labels = [(class_id, np.asarray(points, dtype=np.float32).reshape(-1, 2)) for class_id, points in labels]
+    if not labels:
+        return [], 1.0
+
+    height, width = prev_gray.shape[:2]
+    size = np.array([width, height], dtype=np.float32)
+    lengths = np.array([len(points) for _, points in labels])
+    starts = np.cumsum(lengths) - lengths
+
+    # All vertices of the image in one call, in tracking-image pixels
+    p0 = (np.concatenate([points for _, points in labels]) * size).reshape(-1, 1, 2)
+    p1, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, next_gray, p0, None, **LK_PARAMS)
+    p0r, status_back, _ = cv2.calcOpticalFlowPyrLK(next_gray, prev_gray, p1, None, **LK_PARAMS)
+
+    error = np.linalg.norm((p0 - p0r).reshape(-1, 2), axis=1)
+    tracked = (status.ravel() == 1) & (status_back.ravel() == 1) & (error < MAX_FORWARD_BACKWARD_ERROR)
+    motion = (p1 - p0).reshape(-1, 2)
+    moved = p1.reshape(-1, 2)
+
+    fractions = np.add.reduceat(tracked.astype(np.float64), starts) / lengths
+    result = []
+    for (class_id, _), start, length, fraction in zip(labels, starts.tolist(), lengths.tolist(), fractions):
+        if fraction < MIN_TRACKED_FRACTION:
+            continue
+        rows = slice(start, start + length)
+        points = moved[rows].copy()
+        lost = ~tracked[rows]
+        if lost.any():
+            points[lost] = p0.reshape(-1, 2)[rows][lost] + np.median(motion[rows][~lost], axis=0)
+        result.append((class_id, np.clip(points / size, 0.0, 1.0)))
+
+    return result, float(tracked.mean())
+
+
+def has_labels(label_path):
+    stamp = file_stamp(label_path)
+    return stamp is not None and stamp[1] > 0
+
+
+def propagate_sequence(path, model_path="best.pt", conf=0.6, num_classes=None, min_confidence=MIN_CONFIDENCE,
+                       overwrite=False, report_every=5.0, backend='pytorch'):
+    """Pre-annotate an image folder or video in order, tracking polygons from each frame to the next.
+
+    Frames that already have labels are kept and tracked from. The model is only
+    run where tracking confidence drops below min_confidence or there is nothing
+    to track from, and is loaded on first use.
+    """
+    if is_video(path):
+        source = VideoSource(path)
+        names = source.names()
+    else:
+        source = FolderSource(path, None)
+        index = DatasetIndex(path)
+        index.refresh()
+        names = index.names()
+        index.close()
+
+    model = None
+    start_time = time.perf_counter()
+    last_report = start_time
+    tracked = inferred = lost = 0
+    prev_gray = None
+    prev_labels = []
+
+    try:
+        for done, name in enumerate(names, 1):
+            label_path = label_path_for(source.label_folder, name)
+            gray = source.gray(name)
+
+            if has_labels(label_path) and not overwrite:
+                labels = read_labels(label_path)
+            else:
+                labels, confidence = [], 0.0
+                if prev_labels and prev_gray is not None and prev_gray.shape == gray.shape:
+                    labels, confidence = propagate_polygons(prev_gray, gray, prev_labels)
+
+                if confidence >= min_confidence:
+                    tracked += 1
+                elif model_path and os.path.exists(model_path):
+                    if model is None:
+                        model = ModelBackend(model_path, backend)
+                        if num_classes is None:
+                            num_classes = len(model.names)
+                    result = model(source.model_input(name), conf=conf, verbose=False)[0]
+                    arrays = result_to_arrays(result, conf, num_classes)
+                    labels = masks_to_polygons(*arrays, conf, num_classes) if arrays is not None else []
+                    inferred += 1
+                else:
+                    # Tracking lost and no model: write nothing and don't track from this frame
+                    labels = []
+                    lost += bool(prev_labels)
+
+                if labels:
+                    write_labels_atomic(label_path, PolygonStore.from_labels(labels).format())
+
+            prev_gray, prev_labels = gray, labels
+
+            now = time.perf_counter()
+            if now - last_report >= report_every:
+                last_report = now
+                print(f"{done}/{len(names)} frames, {tracked} tracked, {inferred} inferred, {lost} lost, "
+                      f"{done / (now - start_time):.1f} frames/s")
+    finally:
+        source.close()
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Processed {len(names)} frames in {elapsed:.1f}s: {tracked} tracked, {inferred} inferred, "
+          f"{lost} lost")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pre-annotate a frame sequence by tracking polygons, falling back to the model")
+    parser.add_argument("path", help="Folder with frames in order, or a video file")
+    parser.add_argument("--model", default="best.pt", help="Model weights for frames that cannot be tracked")
+    parser.add_argument("--conf", type=float, default=0.6, help="Confidence threshold of the model")
+    parser.add_argument("--classes", help="Classes JSON exported from the app, limits the accepted class ids")
+    parser.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE,
+                        help="Share of tracked vertices below which the model is run instead")
+    parser.add_argument("--overwrite", action="store_true", help="Also replace labels that already exist")
+    parser.add_argument("--backend", choices=BACKENDS, default='pytorch', help="Inference backend of the model")
+    args = parser.parse_args()
+
+    num_classes = None
+    if args.classes:
+        with open(args.classes, 'r') as f:
+            num_classes = len(json.load(f))
+
+    propagate_sequence(args.path, args.model, args.conf, num_classes, args.min_confidence, args.overwrite,
+                       backend=args.backend)
+
+
+if __name__ == "__main__":
+    main()
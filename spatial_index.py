@@ -0,0 +1,153 @@
+from collections import defaultdict
+
+import numpy as np
+
+
+class AnnotationIndex:
+    """Uniform grid over the polygons of one image, in normalized image coordinates.
+
+    Queries gather the polygons whose bounding box is near the query point from
+    the grid and then test all of their vertices or edges in one array
+    operation. Distances are measured after multiplying by `scale` (canvas
+    pixels per normalized unit on each axis), so radii can be given in screen
+    pixels. Nothing here depends on the Tk canvas.
+    """
+
+    def __init__(self, cells=32):
+        self.cells = cells
+        self.points = {}  # ann_id -> (N, 2) array
+        self.bboxes = {}  # ann_id -> (x0, y0, x1, y1)
+        self._grid = defaultdict(set)  # (cx, cy) -> ann_ids
+        self._cells_of = {}  # ann_id -> cells the bbox covers
+
+    def rebuild(self, annotations):
+        """Index every polygon of a PolygonStore"""
+        self.clear()
+        for ann_id, _, points in annotations.items():
+            self.update(ann_id, points)
+
+    def clear(self):
+        self.points = {}
+        self.bboxes = {}
+        self._grid = defaultdict(set)
+        self._cells_of = {}
+
+    def update(self, ann_id, points):
+        self.remove(ann_id)
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(points) == 0:
+            return
+
+        x0, y0 = points.min(axis=0)
+        x1, y1 = points.max(axis=0)
+        cells = [(cx, cy)
+                 for cx in range(self._cell(x0), self._cell(x1) + 1)
+                 for cy in range(self._cell(y0), self._cell(y1) + 1)]
+        for cell in cells:
+            self._grid[cell].add(ann_id)
+
+        self.points[ann_id] = points
+        self.bboxes[ann_id] = (x0, y0, x1, y1)
+        self._cells_of[ann_id] = cells
+
+    def remove(self, ann_id):
+        for cell in self._cells_of.pop(ann_id, ()):
+            self._grid[cell].discard(ann_id)
+        self.points.pop(ann_id, None)
+        self.bboxes.pop(ann_id, None)
+
+    def candidates(self, x0, y0, x1, y1):
+        """Ids of the polygons whose bounding box intersects the rectangle, in ascending order"""
+        found = set()
+        for cx in range(self._cell(x0), self._cell(x1) + 1):
+            for cy in range(self._cell(y0), self._cell(y1) + 1):
+                found.update(self._grid.get((cx, cy), ()))
+
+        return sorted(
+            ann_id for ann_id in found
+            if self.bboxes[ann_id][0] <= x1 and self.bboxes[ann_id][2] >= x0
+            and self.bboxes[ann_id][1] <= y1 and self.bboxes[ann_id][3] >= y0
+        )
+
+    def nearest_vertex(self, x, y, radius, scale):
+        """Closest vertex within radius as (ann_id, vertex_idx, distance), or None"""
+        ann_ids = self.candidates(*self._query_box(x, y, radius, scale))
+        if not ann_ids:
+            return None
+
+        points, owners, local = self._gather(ann_ids)
+        offsets = (points - (x, y)) * scale
+        distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        best = int(np.argmin(distances))
+        if distances[best] > radius:
+            return None
+        return ann_ids[owners[best]], int(local[best]), float(distances[best])
+
+    def nearest_edge(self, x, y, radius, scale, ann_ids=None):
+        """Closest polygon edge within radius.
+
+        Edge i runs from vertex i to vertex i + 1 (wrapping around). Returns
+        (ann_id, edge_idx, distance, (closest_x, closest_y)) or None.
+        """
+        query_ids = self.candidates(*self._query_box(x, y, radius, scale))
+        if ann_ids is not None:
+            query_ids = [ann_id for ann_id in query_ids if ann_id in ann_ids]
+        if not query_ids:
+            return None
+
+        starts, owners, local = self._gather(query_ids)
+        ends = np.concatenate([np.roll(self.points[ann_id], -1, axis=0) for ann_id in query_ids])
+
+        # Project in canvas space, the axes are scaled differently
+        scale = np.asarray(scale, dtype=np.float64)
+        a = starts * scale
+        b = ends * scale
+        p = np.array([x, y]) * scale
+        segment = b - a
+        length_sq = (segment ** 2).sum(axis=1)
+        t = np.divide(((p - a) * segment).sum(axis=1), length_sq, out=np.zeros_like(length_sq),
+                      where=length_sq > 0)
+        np.clip(t, 0.0, 1.0, out=t)
+        closest = a + t[:, None] * segment
+        distances = np.hypot(*(closest - p).T)
+
+        best = int(np.argmin(distances))
+        if distances[best] > radius:
+            return None
+        closest_x, closest_y = (closest[best] / scale).tolist()
+        return query_ids[owners[best]], int(local[best]), float(distances[best]), (closest_x, closest_y)
+
+    def polygons_at(self, x, y):
+        """Ids of the polygons containing the point, in ascending order (the last one is drawn on top)"""
+        ann_ids = self.candidates(x, y, x, y)
+        if not ann_ids:
+            return []
+
+        starts, owners, _ = self._gather(ann_ids)
+        ends = np.concatenate([np.roll(self.points[ann_id], -1, axis=0) for ann_id in ann_ids])
+
+        # Even-odd rule: count the edges a horizontal ray to the right of the point crosses
+        y1, y2 = starts[:, 1], ends[:, 1]
+        straddles = (y1 > y) != (y2 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cross_x = starts[:, 0] + (y - y1) * (ends[:, 0] - starts[:, 0]) / (y2 - y1)
+        crossings = straddles & (x < cross_x)
+        counts = np.bincount(owners[crossings], minlength=len(ann_ids))
+        return [ann_id for ann_id, count in zip(ann_ids, counts) if count % 2 == 1]
+
+    def _cell(self, value):
+        return min(self.cells - 1, max(0, int(value * self.cells)))
+
+    @staticmethod
+    def _query_box(x, y, radius, scale):
+        rx = radius / scale[0]
+        ry = radius / scale[1]
+        return x - rx, y - ry, x + rx, y + ry
+
+    def _gather(self, ann_ids):
+        """Concatenated vertices of the polygons with the owner position and vertex index of each"""
+        arrays = [self.points[ann_id] for ann_id in ann_ids]
+        lengths = np.array([len(points) for points in arrays])
+        owners = np.repeat(np.arange(len(ann_ids)), lengths)
+        local = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return np.concatenate(arrays), owners, local
@@ -0,0 +1,145 @@
+import argparse
+import os
+
+import numpy as np
+from PIL import Image
+
+from labels import write_labels_atomic
+
+
+def random_polygon(rng, vertices, radius=(0.02, 0.15)):
+    """Star-shaped polygon in normalized coordinates, sorted angles keep it free of self-intersections"""
+    center = rng.uniform(0.15, 0.85, size=2)
+    angles = np.sort(rng.uniform(0.0, 2 * np.pi, size=vertices))
+    radii = rng.uniform(*radius) * rng.uniform(0.5, 1.0, size=vertices)
+    points = center + np.column_stack([np.cos(angles), np.sin(angles)]) * radii[:, None]
+    return np.clip(points, 0.0, 1.0).astype(np.float32)
+
+
+def random_labels(rng, polygons, vertices, num_classes):
+    """(class_id, points) tuples like read_labels returns them, the vertex count varies around `vertices`"""
+    return [(int(rng.integers(num_classes)),
+             random_polygon(rng, max(3, int(rng.integers(vertices // 2, vertices * 3 // 2 + 1)))))
+            for _ in range(polygons)]
+
+
+def format_labels(labels):
+    """Contents of a YOLO label file in the format the app writes"""
+    return "".join(f"{class_id} " + " ".join(f"{value:.6f}" for value in points.ravel().tolist()) + "\n"
+                   for class_id, points in labels)
+
+
+def random_image(rng, size):
+    """RGB image with a gradient, noise and a few filled rectangles, compresses like a photo more than flat color"""
+    width, height = size
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None] * rng.uniform(0.2, 1.0, size=3)
+    pixels = np.broadcast_to(gradient, (height, width, 3)).copy()
+    pixels += rng.normal(0, 12, size=pixels.shape)
+    for _ in range(4):
+        x0, y0 = rng.integers(0, width), rng.integers(0, height)
+        x1, y1 = x0 + rng.integers(width // 8, width // 2), y0 + rng.integers(height // 8, height // 2)
+        pixels[y0:y1, x0:x1] = rng.uniform(0, 255, size=3)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def generate_folder(folder, images=100, image_size=(640, 480), polygons=10, vertices=40, num_classes=5,
+                    labeled=0.8, seed=0):
+    """Write a folder of JPEG images with YOLO segmentation labels, the same seed gives the same files.
+
+    Returns the list of image names.
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    names = []
+    for i in range(images):
+        name = f"synthetic_{i:06d}.jpg"
+        random_image(rng, image_size).save(os.path.join(folder, name), quality=85)
+        if rng.random() < labeled:
+            count = int(rng.integers(1, 2 * polygons))
+            contents = format_labels(random_labels(rng, count, vertices, num_classes))
+            write_labels_atomic(os.path.join(folder, f"synthetic_{i:06d}.txt"), contents)
+        names.append(name)
+    return names
+
+
+def random_stroke(rng, points=1000, image_size=(1920, 1080)):
+    """Freehand stroke as drawn with the solid line tool: a jittery loop of normalized (x, y) tuples"""
+    angles = np.linspace(0, 2 * np.pi, points)
+    radius = 0.3 + 0.05 * np.sin(angles * rng.integers(3, 9)) + rng.normal(0, 0.002, size=points)
+    stroke = 0.5 + np.column_stack([np.cos(angles), np.sin(angles)]) * radius[:, None]
+    # Mouse positions are whole screen pixels
+    scale = np.array(image_size, dtype=np.float64)
+    stroke = np.round(np.clip(stroke, 0.0, 1.0) * scale) / scale
+    return [tuple(point) for point in stroke.tolist()]
+
+
+def random_predictions(rng, masks=20, contour_points=400, orig_shape=(1080, 1920), num_classes=5):
+    """Raw model output as infer_arrays returns it: (contours in pixels, class ids, confidences, orig_shape)"""
+    height, width = orig_shape
+    contours = []
+    for _ in range(masks):
+        polygon = random_polygon(rng, contour_points, radius=(0.05, 0.2)).astype(np.float64)
+        # Mask contours run along the pixel grid
+        contours.append(np.round(polygon * (width, height)).astype(np.float32))
+    class_ids = rng.integers(0, num_classes + 1, size=masks).astype(np.int64)
+    confidences = rng.uniform(0.05, 1.0, size=masks).astype(np.float32)
+    return contours, class_ids, confidences, (height, width)
+
+
+def generate_video(path, frames=300, size=(640, 360), fps=30.0, scene_length=60, seed=0):
+    """Write a video of a moving rectangle over a background that changes every scene_length frames"""
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    width, height = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    if not writer.isOpened():
+        raise OSError(f"Can't write video {path}")
+    try:
+        background = None
+        for i in range(frames):
+            if i % scene_length == 0:
+                background = np.asarray(random_image(rng, size))[:, :, ::-1].copy()
+            frame = background.copy()
+            x = int((i % scene_length) / scene_length * (width - width // 4))
+            y = height // 3
+            frame[y:y + height // 4, x:x + width // 4] = (40, 200, 40)
+            writer.write(frame)
+    finally:
+        writer.release()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic dataset or video")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    folder_parser = subparsers.add_parser("folder", help="Images with YOLO segmentation labels")
+    folder_parser.add_argument("output", help="Folder to write to")
+    folder_parser.add_argument("--images", type=int, default=100, help="Number of images")
+    folder_parser.add_argument("--size", type=int, nargs=2, default=(640, 480), help="Image width and height")
+    folder_parser.add_argument("--polygons", type=int, default=10, help="Mean polygons per labeled image")
+    folder_parser.add_argument("--vertices", type=int, default=40, help="Mean vertices per polygon")
+    folder_parser.add_argument("--classes", type=int, default=5, help="Number of classes")
+    folder_parser.add_argument("--labeled", type=float, default=0.8, help="Share of images with a label file")
+    folder_parser.add_argument("--seed", type=int, default=0)
+
+    video_parser = subparsers.add_parser("video", help="Short mp4 video with scene changes")
+    video_parser.add_argument("output", help="Video file to write")
+    video_parser.add_argument("--frames", type=int, default=300, help="Number of frames")
+    video_parser.add_argument("--size", type=int, nargs=2, default=(640, 360), help="Frame width and height")
+    video_parser.add_argument("--fps", type=float, default=30.0)
+    video_parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "folder":
+        names = generate_folder(args.output, args.images, tuple(args.size), args.polygons, args.vertices,
+                                args.classes, args.labeled, args.seed)
+        print(f"Wrote {len(names)} images to {args.output}")
+    else:
+        generate_video(args.output, args.frames, tuple(args.size), args.fps, seed=args.seed)
+        print(f"Wrote {args.frames} frames to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
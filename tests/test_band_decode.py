@@ -0,0 +1,70 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from band_decode import decode_reduced, reduce_factor  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def pixels():
+    rng = np.random.default_rng(0)
+    # Smooth rows so PNG picks Sub, Up, Average and Paeth filters, not only None
+    return np.clip(np.cumsum(rng.normal(0, 8, size=(301, 203, 3)), axis=0) + 128, 0, 255).astype(np.uint8)
+
+
+def variants(folder, pixels):
+    img = Image.fromarray(pixels)
+    paths = {}
+    for name, save in {
+        'rgb.png': lambda path: img.save(path),
+        'rgba.png': lambda path: img.convert('RGBA').save(path),
+        'gray.png': lambda path: img.convert('L').save(path),
+        'bilevel.png': lambda path: img.convert('1').save(path),
+        'palette4.png': lambda path: img.convert('P', palette=Image.Palette.ADAPTIVE, colors=16).save(path, bits=4),
+        'gray16.png': lambda path: Image.fromarray(pixels[:, :, 0].astype(np.uint16) * 257).save(path),
+        'rgb.bmp': lambda path: img.save(path),
+        'rgb.ppm': lambda path: img.save(path),
+        'strips.tif': lambda path: img.save(path),
+        'tiles.tif': lambda path: img.save(path, tile=(64, 64)),
+    }.items():
+        paths[name] = os.path.join(folder, name)
+        save(paths[name])
+    return paths
+
+
+def full_reduce(path, factor):
+    with Image.open(path) as img:
+        img.load()
+        if img.mode not in ('RGB', 'RGBA', 'L'):
+            img = img.convert('RGBA' if 'transparency' in img.info or 'A' in img.mode else 'RGB')
+        return img.reduce(factor) if factor > 1 else img.copy()
+
+
+def test_bands_match_a_full_decode(tmp_path, pixels):
+    for name, path in variants(str(tmp_path), pixels).items():
+        for factor in (1, 3, 4):
+            with Image.open(path) as img:
+                reduced = decode_reduced(img, factor, band_pixels=203 * 17)
+            assert reduced is not None, name
+            expected = full_reduce(path, factor)
+            assert reduced.mode == expected.mode, name
+            assert np.array_equal(np.asarray(reduced), np.asarray(expected)), (name, factor)
+
+
+def test_whole_image_formats_are_not_banded(tmp_path, pixels):
+    path = str(tmp_path / "lzw.tif")
+    Image.fromarray(pixels).save(path, compression='tiff_lzw')
+    with Image.open(path) as img:
+        assert decode_reduced(img, 2) is None
+
+
+def test_reduce_factor_keeps_at_least_the_target():
+    for size, target in [((1001, 700), (501, 350)), ((1000, 1000), (500, 500)), ((11000, 7000), (1571, 1000))]:
+        factor = reduce_factor(size, target)
+        assert all(-(-side // factor) >= wanted for side, wanted in zip(size, target))
+        assert any(-(-side // (factor + 1)) < wanted for side, wanted in zip(size, target))
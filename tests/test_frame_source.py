@@ -0,0 +1,56 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+cv2 = pytest.importorskip("cv2")
+
+from frame_source import SEEK_THRESHOLD, VideoSource  # noqa: E402
+from synthetic_data import generate_video  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("video") / "clip.mp4")
+    return generate_video(path, frames=240, size=(160, 96), scene_length=40)
+
+
+def sequential_frames(path):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def test_random_access_matches_sequential_decode(video):
+    expected = sequential_frames(video)
+    source = VideoSource(video)
+    try:
+        assert len(source.index) == len(expected)
+        rng = np.random.default_rng(0)
+        numbers = [len(expected) - 1, 0, SEEK_THRESHOLD + 5, 3, *rng.integers(0, len(expected), size=40).tolist()]
+        for number in numbers:
+            with source._lock:
+                frame = source._read(number)
+            assert np.array_equal(frame, expected[number]), number
+    finally:
+        source.close()
+
+
+def test_frame_at_picks_the_nearest_timestamp(video):
+    source = VideoSource(video)
+    try:
+        timestamps = source.index.timestamps_ms
+        assert source.index.frame_at(timestamps[10]) == 10
+        assert source.index.frame_at(timestamps[10] + 0.4 * (timestamps[11] - timestamps[10])) == 10
+        assert source.index.frame_at(timestamps[-1] + 1000.0) == len(timestamps) - 1
+    finally:
+        source.close()
@@ -0,0 +1,98 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from polygon_store import PolygonStore  # noqa: E402
+
+
+def ring(center, radius, count):
+    angles = np.linspace(0, 2 * np.pi, count, endpoint=False)
+    return np.column_stack([center[0] + radius * np.cos(angles),
+                            center[1] + radius * np.sin(angles)]).astype(np.float32)
+
+
+def check(store, model):
+    """The store must agree with a plain dict of ann_id -> (class_id, points)"""
+    assert store.keys() == list(model)
+    for ann_id, class_id, points in store.items():
+        assert class_id == model[ann_id][0]
+        np.testing.assert_array_equal(points, model[ann_id][1])
+
+    ann_ids, boxes = store.bounds()
+    expected = {ann_id: np.concatenate([points.min(axis=0), points.max(axis=0)])
+                for ann_id, (_, points) in model.items() if len(points)}
+    assert sorted(ann_ids.tolist()) == sorted(expected)
+    for ann_id, box in zip(ann_ids.tolist(), boxes):
+        np.testing.assert_array_equal(box, expected[ann_id])
+
+    for box in ((0.1, 0.1, 0.3, 0.3), (0.4, 0.4, 0.6, 0.6), (0.0, 0.0, 1.0, 1.0)):
+        x0, y0, x1, y1 = box
+        inside = [ann_id for ann_id, bounds in expected.items()
+                  if bounds[0] <= x1 and bounds[2] >= x0 and bounds[1] <= y1 and bounds[3] >= y0]
+        assert sorted(store.ids_in_box(*box)) == sorted(inside)
+
+
+def test_bounds_after_growing_a_polygon_in_a_full_buffer():
+    store = PolygonStore.from_labels([(0, ring((0.2, 0.2), 0.05, 400)),
+                                      (1, ring((0.5, 0.5), 0.05, 400)),
+                                      (2, ring((0.8, 0.8), 0.05, 400))])
+    store.insert_point(0, 5, (0.21, 0.21))
+    assert store.ids_in_box(0.1, 0.1, 0.3, 0.3) == [0]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_edits_match_a_list_model(seed):
+    rng = np.random.default_rng(seed)
+    labels = [(int(rng.integers(5)), ring(rng.uniform(0.1, 0.9, 2), rng.uniform(0.01, 0.1), int(rng.integers(3, 50))))
+              for _ in range(int(rng.integers(1, 10)))]
+    store = PolygonStore.from_labels(labels)
+    model = {ann_id: (class_id, points.copy()) for ann_id, (class_id, points) in enumerate(labels)}
+    check(store, model)
+
+    for _ in range(200):
+        op = rng.integers(7)
+        ann_ids = list(model)
+        if op == 0 or not ann_ids:
+            class_id = int(rng.integers(5))
+            points = ring(rng.uniform(0.1, 0.9, 2), rng.uniform(0.01, 0.1), int(rng.integers(3, 80)))
+            model[store.add(class_id, points)] = (class_id, points)
+            continue
+
+        ann_id = ann_ids[int(rng.integers(len(ann_ids)))]
+        class_id, points = model[ann_id]
+        if op == 1:
+            index = int(rng.integers(len(points) + 1))
+            point = rng.uniform(0, 1, 2).astype(np.float32)
+            store.insert_point(ann_id, index, point)
+            model[ann_id] = (class_id, np.insert(points, index, point, axis=0))
+        elif op == 2:
+            new_points = ring(rng.uniform(0.1, 0.9, 2), rng.uniform(0.01, 0.1), int(rng.integers(3, 120)))
+            store.set_points(ann_id, new_points)
+            model[ann_id] = (class_id, new_points)
+        elif op == 3:
+            index = int(rng.integers(len(points)))
+            point = rng.uniform(0, 1, 2).astype(np.float32)
+            store.set_point(ann_id, index, point)
+            points = points.copy()
+            points[index] = point
+            model[ann_id] = (class_id, points)
+        elif op == 4:
+            store.remove(ann_id)
+            del model[ann_id]
+        elif op == 5:
+            removed = ann_ids[:int(rng.integers(1, len(ann_ids) + 1))]
+            store.remove_many(removed)
+            for removed_id in removed:
+                del model[removed_id]
+        else:
+            new_class = int(rng.integers(5))
+            store.set_class(ann_id, new_class)
+            model[ann_id] = (new_class, points)
+        check(store, model)
+
+    store.compact()
+    check(store, model)
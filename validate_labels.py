@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from dataset_index import scan_folder
+from frame_source import is_video_label_folder
+from geometry import polygon_areas, self_intersects
+from image_cache import file_stamp
+from labels import write_labels_atomic
+
+CACHE_FILENAME = ".markup_validate.json"
+CHUNK_SIZE = 256
+# Polygons smaller than this share of the image are treated as having no area
+MIN_AREA = 1e-9
+
+# Problems the fix mode repairs, the others are only reported
+FIXABLE = {'parse_error', 'odd_coordinates', 'too_few_points', 'out_of_bounds', 'zero_area', 'duplicate'}
+
+
+def check_lines(lines, num_classes=None, fix=False):
+    """Validate the lines of one label file.
+
+    Returns (issues, fixed lines or None). Each issue is a (line number, kind)
+    pair. With fix, lines that can't be read, have fewer than 3 points, no area
+    or repeat an earlier polygon are dropped, a trailing odd coordinate is
+    removed and coordinates are clipped to [0, 1]. Unknown class ids and
+    self-intersections are left alone, they need a person to decide.
+    """
+    issues = []
+    fixed = []
+    seen = set()
+    for number, line in enumerate(lines, 1):
+        parts = line.split()
+        if not parts:
+            continue
+        modified = False
+
+        try:
+            class_id = int(parts[0])
+            coordinates = np.array(parts[1:], dtype=np.float64)
+        except ValueError:
+            issues.append((number, 'parse_error'))
+            continue
+
+        if len(coordinates) % 2:
+            issues.append((number, 'odd_coordinates'))
+            coordinates = coordinates[:-1]
+            modified = True
+        points = coordinates.reshape(-1, 2)
+        if len(points) < 3:
+            issues.append((number, 'too_few_points'))
+            continue
+
+        if class_id < 0 or (num_classes is not None and class_id >= num_classes):
+            issues.append((number, 'class_out_of_range'))
+
+        if not np.isfinite(points).all() or (points < 0.0).any() or (points > 1.0).any():
+            issues.append((number, 'out_of_bounds'))
+            points = np.clip(np.nan_to_num(points), 0.0, 1.0)
+            modified = True
+
+        if polygon_areas(points, [0], [len(points)])[0] < MIN_AREA:
+            issues.append((number, 'zero_area'))
+            continue
+
+        if self_intersects(points):
+            issues.append((number, 'self_intersection'))
+
+        key = (class_id, points.tobytes())
+        if key in seen:
+            issues.append((number, 'duplicate'))
+            continue
+        seen.add(key)
+
+        if modified:
+            fixed.append(f"{class_id} " + " ".join(f"{value:.6f}" for value in points.ravel().tolist()))
+        else:
+            fixed.append(line.strip())
+
+    if not fix or not any(kind in FIXABLE for _, kind in issues):
+        return issues, None
+    return issues, fixed
+
+
+def check_files(paths, num_classes=None, fix=False):
+    """check_lines over label files, returns [(path, issues, whether the file was rewritten)]"""
+    results = []
+    for path in paths:
+        try:
+            with open(path, 'r') as f:
+                lines = f.readlines()
+        except (OSError, UnicodeDecodeError):
+            results.append((path, [(0, 'unreadable')], False))
+            continue
+
+        issues, fixed = check_lines(lines, num_classes, fix)
+        if fixed is not None:
+            write_labels_atomic(path, "".join(line + "\n" for line in fixed))
+        results.append((path, issues, fixed is not None))
+    return results
+
+
+def validate_folder(folder, num_classes=None, fix=False, workers=None, progress=None):
+    """Validate every label file of a folder in a process pool.
+
+    Results are cached next to the labels by file stamp and class count, so
+    a rerun only reads label files that changed. Returns
+    ({label name: [(line, kind), ...]} of files with problems, number of files read,
+    number of files rewritten).
+    """
+    cache_path = os.path.join(folder, CACHE_FILENAME)
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+        if cache.get('num_classes') != num_classes:
+            cache = {}
+    except (OSError, ValueError):
+        cache = {}
+    known = cache.get('files', {})
+
+    images, labels = scan_folder(folder)
+    if not is_video_label_folder(folder):
+        stems = {os.path.splitext(name)[0] for name in images}
+        labels = {stem: stamp for stem, stamp in labels.items() if stem in stems}
+
+    results = {}
+    to_check = []
+    for stem, stamp in labels.items():
+        entry = known.get(stem)
+        # A fix run has to look at files that were only reported before
+        if entry is not None and entry['stamp'] == list(stamp) and not (fix and entry['issues']):
+            results[stem] = [tuple(issue) for issue in entry['issues']]
+        else:
+            to_check.append(stem)
+
+    paths = [os.path.join(folder, stem + ".txt") for stem in to_check]
+    chunks = [paths[start:start + CHUNK_SIZE] for start in range(0, len(paths), CHUNK_SIZE)]
+    workers = workers or os.cpu_count() or 1
+    rewritten = 0
+    checked = []
+    if len(chunks) <= 1 or workers == 1:
+        for chunk in chunks:
+            checked.extend(check_files(chunk, num_classes, fix))
+            if progress is not None:
+                progress(len(checked), len(paths))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(check_files, chunk, num_classes, fix) for chunk in chunks]
+            for future in futures:
+                checked.extend(future.result())
+                if progress is not None:
+                    progress(len(checked), len(paths))
+
+    for path, issues, was_fixed in checked:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if was_fixed:
+            rewritten += 1
+            # What is left after the fix is what the file holds now
+            issues = [issue for issue in issues if issue[1] not in FIXABLE]
+            labels[stem] = file_stamp(path)
+        results[stem] = issues
+
+    cache = {
+        'num_classes': num_classes,
+        'files': {stem: {'stamp': list(labels[stem]), 'issues': results[stem]} for stem in labels},
+    }
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # A read-only folder is validated all over again next time
+        pass
+
+    problems = {stem + ".txt": issues for stem, issues in sorted(results.items()) if issues}
+    return problems, len(paths), rewritten
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find label lines the app would drop or misread, optionally fix them")
+    parser.add_argument("folder", help="Folder with images and YOLO label files")
+    parser.add_argument("--classes", help="Classes JSON exported from the app, to check class ids")
+    parser.add_argument("--num-classes", type=int, default=None, help="Number of classes, instead of --classes")
+    parser.add_argument("--fix", action="store_true",
+                        help="Drop unreadable, degenerate and duplicate lines and clip coordinates to [0, 1]")
+    parser.add_argument("--workers", type=int, default=None, help="Validation processes")
+    parser.add_argument("--verbose", action="store_true", help="List every problem line")
+    args = parser.parse_args()
+
+    num_classes = args.num_classes
+    if args.classes:
+        with open(args.classes, 'r') as f:
+            num_classes = len(json.load(f))
+
+    start_time = time.perf_counter()
+    problems, checked, rewritten = validate_folder(args.folder, num_classes, args.fix, args.workers)
+
+    totals = Counter(kind for issues in problems.values() for _, kind in issues)
+    print(f"{len(problems)} label files with problems | read {checked} label files | "
+          f"rewrote {rewritten} | {time.perf_counter() - start_time:.1f}s")
+    for kind, count in totals.most_common():
+        print(f"  {kind}: {count}")
+    if args.verbose:
+        for name, issues in problems.items():
+            for line, kind in issues:
+                print(f"{name}:{line}: {kind}")
+    if num_classes is None:
+        print("Class ids were not checked, pass --classes or --num-classes")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,19 @@
+import argparse
 import cv2
+import numpy as np
 import os
+import queue
 import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Targets further apart than this many frames are reached by seeking instead of grabbing every frame
+SEEK_THRESHOLD = 90
+# Seeks aim this many frames before the target, tried in order until one doesn't land past it
+SEEK_BACKOFFS = (0, 30, 300)
+# Side of the grayscale thumbnail used for scene-change hashing, gives HASH_SIZE * HASH_SIZE bits
+HASH_SIZE = 16
 
 
 def transliterate(text):
@@ -33,42 +46,192 @@ def sanitize_filename(filename):
     return filename
 
 
-def process_video(video_path, output_folder, frame_interval=1):
+class FrameWriter:
+    """Очередь записи кадров: JPEG кодируется в фоновых потоках, пока основной поток декодирует видео.
+
+    Очередь ограничена, чтобы декодер не обгонял запись и не занимал всю память.
+    """
+
+    def __init__(self, threads=2, max_queued=32, quality=95):
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.failed = []
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(threads)]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, path, frame):
+        self.queue.put((path, frame))
+
+    def close(self):
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        return self.failed
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            path, frame = item
+            # imwrite releases the GIL while encoding
+            if not cv2.imwrite(path, frame, self.params):
+                self.failed.append(path)
+
+
+class SceneFilter:
+    """Отбор кадров по смене сцены: кадр сохраняется, только если он заметно отличается от последнего сохраненного.
+
+    Различие считается как доля несовпадающих бит разностного перцептивного хеша (dHash) маленькой
+    полутоновой миниатюры, поэтому проверка кадра почти ничего не стоит по сравнению с декодированием.
+    """
+
+    def __init__(self, threshold=0.1, hash_size=HASH_SIZE):
+        self.threshold = threshold
+        self.hash_size = hash_size
+        self.last_hash = None
+
+    def frame_hash(self, frame):
+        # Cheap strided subsample first so INTER_AREA only averages a few thousand pixels
+        step = max(1, min(frame.shape[:2]) // (self.hash_size * 4))
+        small = frame[::step, ::step]
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        thumb = cv2.resize(small, (self.hash_size + 1, self.hash_size), interpolation=cv2.INTER_AREA)
+        return np.packbits(thumb[:, 1:] > thumb[:, :-1])
+
+    def distance(self, hash_a, hash_b):
+        """Доля различающихся бит двух хешей, от 0 до 1"""
+        bits = np.unpackbits(np.bitwise_xor(hash_a, hash_b)).sum()
+        return bits / float(self.hash_size * self.hash_size)
+
+    def accept(self, frame):
+        """True, если кадр нужно сохранить; сохраненный кадр становится новым эталоном"""
+        frame_hash = self.frame_hash(frame)
+        if self.last_hash is not None and self.distance(frame_hash, self.last_hash) < self.threshold:
+            return False
+        self.last_hash = frame_hash
+        return True
+
+
+def sample_targets(native_fps, frame_interval=1, interval_ms=None, fps=None, total_frames=0, max_frames=None):
+    """Бесконечная последовательность номеров кадров для сохранения.
+
+    Если задан интервал в миллисекундах или частота кадров в секунду, кадры выбираются по времени,
+    иначе каждый frame_interval-й кадр. Если при известном числе кадров total_frames интервал дает
+    больше max_frames кадров, шаг увеличивается до total_frames / max_frames, чтобы кадры
+    распределились по всему видео, а не только по его началу.
+    """
+    if fps:
+        interval_ms = 1000.0 / fps
+    if interval_ms and native_fps > 0:
+        step = native_fps * interval_ms / 1000.0
+    else:
+        step = max(1, frame_interval)
+    if max_frames and total_frames > 0:
+        step = max(step, total_frames / max_frames)
+
+    k = 0
+    last = -1
+    while True:
+        target = int(round(k * step))
+        if target > last:
+            yield target
+            last = target
+        k += 1
+
+
+def seek_to(cap, target):
+    """Перематывает видео не дальше кадра target и возвращает номер кадра, который вернет следующий grab().
+
+    Перемотка через CAP_PROP_POS_FRAMES точна не во всех контейнерах, поэтому позиция читается обратно,
+    а если перемотка проскочила цель, она повторяется дальше назад, вплоть до начала видео.
+    """
+    for backoff in SEEK_BACKOFFS + (target,):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, max(0, target - backoff))
+        position = int(round(cap.get(cv2.CAP_PROP_POS_FRAMES)))
+        if 0 <= position <= target:
+            return position
+    return 0
+
+
+def process_video(video_path, output_folder, frame_interval=1, interval_ms=None, fps=None, writer_threads=2,
+                  scene_threshold=None, max_frames=None):
+    """Извлекает кадры из видео.
+
+    Если задан scene_threshold, из выбранных по интервалу кадров сохраняются только те, что отличаются
+    от последнего сохраненного (см. SceneFilter). max_frames ограничивает число сохраненных кадров на видео,
+    кадры при этом выбираются равномерно по всей длине видео.
+    """
     original_name = os.path.splitext(os.path.basename(video_path))[0]
     safe_name = sanitize_filename(original_name)
 
     video_output_folder = os.path.join(output_folder, safe_name)
     if not os.path.exists(video_output_folder):
-        os.makedirs(video_output_folder)
+        os.makedirs(video_output_folder, exist_ok=True)
 
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         print(f"Ошибка: Не удалось открыть видео {video_path}")
-        return
+        return None
 
-    frame_count = 0
+    start_time = time.perf_counter()
+    native_fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    # Only an estimate for some containers, max_frames still caps the count if it is too low
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    writer = FrameWriter(threads=writer_threads)
+    scene_filter = SceneFilter(scene_threshold) if scene_threshold else None
+
+    frame_count = 0  # Number of the frame the next grab() returns
     saved_count = 0
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    try:
+        for target in sample_targets(native_fps, frame_interval, interval_ms, fps, total_frames, max_frames):
+            if max_frames and saved_count >= max_frames:
+                break
+            if target - frame_count > SEEK_THRESHOLD:
+                # Sparse sampling: let the demuxer jump to the nearest keyframe instead of decoding everything
+                frame_count = seek_to(cap, target)
+
+            # Skipped frames are only grabbed, never converted to BGR images
+            while frame_count < target:
+                if not cap.grab():
+                    break
+                frame_count += 1
+            if frame_count < target:
+                break
+
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame_count += 1
+
+            if scene_filter is not None and not scene_filter.accept(frame):
+                continue
 
-        if frame_count % frame_interval == 0:
             frame_filename = os.path.join(
                 video_output_folder,
                 f"{safe_name}_{saved_count:04d}.jpg"
             )
-            cv2.imwrite(frame_filename, frame)
+            writer.put(frame_filename, frame)
             saved_count += 1
+    finally:
+        cap.release()
+        failed = writer.close()
 
-        frame_count += 1
-
-    cap.release()
-    print(f"Обработано: {video_path} | Кадров: {frame_count} | Сохранено: {saved_count}")
+    elapsed = time.perf_counter() - start_time
+    speed = frame_count / elapsed if elapsed > 0 else 0.0
+    if failed:
+        print(f"Ошибка: не удалось записать {len(failed)} кадров из {video_path}")
+    print(f"Обработано: {video_path} | Кадров: {frame_count} | Сохранено: {saved_count - len(failed)} | "
+          f"Скорость: {speed:.1f} кадр/с")
+    return frame_count, saved_count - len(failed), elapsed
 
 
-def process_videos_in_folder(input_folder, output_folder, frame_interval=1):
+def process_videos_in_folder(input_folder, output_folder, frame_interval=1, interval_ms=None, fps=None,
+                             workers=None, scene_threshold=None, max_frames=None):
     if not os.path.exists(input_folder):
         print(f"Ошибка: папка {input_folder} не существует!")
         return
@@ -78,17 +241,47 @@ def process_videos_in_folder(input_folder, output_folder, frame_interval=1):
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    for filename in os.listdir(input_folder):
-        if filename.lower().endswith(video_extensions):
-            video_path = os.path.join(input_folder, filename)
-            process_video(video_path, output_folder, frame_interval)
+    video_paths = [
+        os.path.join(input_folder, filename)
+        for filename in sorted(os.listdir(input_folder))
+        if filename.lower().endswith(video_extensions)
+    ]
+
+    options = dict(frame_interval=frame_interval, interval_ms=interval_ms, fps=fps,
+                   scene_threshold=scene_threshold, max_frames=max_frames)
+
+    start_time = time.perf_counter()
+    workers = min(workers or os.cpu_count() or 1, max(1, len(video_paths)))
+    if workers == 1:
+        results = [process_video(path, output_folder, **options) for path in video_paths]
+    else:
+        # Whole videos go to separate processes, each decodes and writes its own frames
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(process_video, path, output_folder, **options)
+                       for path in video_paths]
+            results = [future.result() for future in futures]
 
-    print("\nВсе видео обработаны.")
+    results = [result for result in results if result is not None]
+    total_frames = sum(frames for frames, _, _ in results)
+    total_saved = sum(saved for _, saved, _ in results)
+    elapsed = time.perf_counter() - start_time
+    speed = total_frames / elapsed if elapsed > 0 else 0.0
+    print(f"\nВсе видео обработаны. Кадров: {total_frames} | Сохранено: {total_saved} | "
+          f"Скорость: {speed:.1f} кадр/с")
 
 
 if __name__ == "__main__":
-    input_folder = "videos"
-    output_folder = "images"
-    frame_interval = 5
+    parser = argparse.ArgumentParser(description="Извлечение кадров из видео")
+    parser.add_argument("input_folder", nargs="?", default="videos", help="Папка с видео")
+    parser.add_argument("output_folder", nargs="?", default="images", help="Папка для кадров")
+    parser.add_argument("--frame-interval", type=int, default=5, help="Сохранять каждый N-й кадр")
+    parser.add_argument("--interval-ms", type=float, default=None, help="Сохранять кадр каждые N миллисекунд")
+    parser.add_argument("--fps", type=float, default=None, help="Сохранять N кадров в секунду")
+    parser.add_argument("--workers", type=int, default=None, help="Количество процессов")
+    parser.add_argument("--scene-threshold", type=float, default=None,
+                        help="Сохранять кадр, только если доля отличающихся бит хеша не меньше порога (например 0.1)")
+    parser.add_argument("--max-frames", type=int, default=None, help="Максимум сохраненных кадров на видео")
+    args = parser.parse_args()
 
-    process_videos_in_folder(input_folder, output_folder, frame_interval)
\ No newline at end of file
+    process_videos_in_folder(args.input_folder, args.output_folder, args.frame_interval, args.interval_ms,
+                             args.fps, args.workers, args.scene_threshold, args.max_frames)
@@ -0,0 +1,112 @@
+from image_cache import fit_size
+
+
+class Viewport:
+    """Zoom and pan state of the canvas, mapping image pixels to canvas pixels.
+
+    A canvas point is ``origin + image_point * scale``. ``zoom`` is relative to
+    the scale at which the whole image fits the canvas, so ``zoom == 1`` is the
+    plain fit-to-canvas view.
+    """
+
+    def __init__(self, max_scale=8.0):
+        self.max_scale = max_scale
+        self.image_size = None
+        self.canvas_size = None
+        self.zoom = 1.0
+        self.scale = 1.0
+        self.origin = (0, 0)
+
+    @property
+    def is_fit(self):
+        return self.zoom == 1.0
+
+    def reset(self):
+        """Go back to the fit-to-canvas view"""
+        self.zoom = 1.0
+        if self.image_size and self.canvas_size:
+            self._fit()
+
+    def update(self, image_size, canvas_size):
+        """Recompute the mapping for a new image or canvas size, keeping the view center in place"""
+        if self.is_fit or image_size != self.image_size or self.canvas_size is None:
+            self.image_size = image_size
+            self.canvas_size = canvas_size
+            self._fit()
+            return
+
+        # Image point currently shown in the middle of the canvas
+        center_x = (self.canvas_size[0] / 2 - self.origin[0]) / self.scale
+        center_y = (self.canvas_size[1] / 2 - self.origin[1]) / self.scale
+
+        self.canvas_size = canvas_size
+        self.scale = self._fit_scale() * self.zoom
+        self.origin = (canvas_size[0] / 2 - center_x * self.scale,
+                       canvas_size[1] / 2 - center_y * self.scale)
+        self._clamp()
+
+    def zoom_at(self, factor, x, y):
+        """Zoom by factor keeping the canvas point (x, y) over the same image point"""
+        if not self.image_size or not self.canvas_size:
+            return
+
+        fit_scale = self._fit_scale()
+        max_zoom = max(1.0, self.max_scale / fit_scale)
+        new_zoom = min(max(self.zoom * factor, 1.0), max_zoom)
+        if new_zoom == self.zoom:
+            return
+
+        self.zoom = new_zoom
+        if self.is_fit:
+            self._fit()
+            return
+
+        new_scale = fit_scale * new_zoom
+        ratio = new_scale / self.scale
+        self.origin = (x - (x - self.origin[0]) * ratio,
+                       y - (y - self.origin[1]) * ratio)
+        self.scale = new_scale
+        self._clamp()
+
+    def pan(self, dx, dy):
+        if self.is_fit:
+            return
+        self.origin = (self.origin[0] + dx, self.origin[1] + dy)
+        self._clamp()
+
+    def visible_image_box(self):
+        """Part of the image visible on the canvas as (x0, y0, x1, y1) in image pixels"""
+        img_width, img_height = self.image_size
+        canvas_width, canvas_height = self.canvas_size
+        x0 = max(0.0, -self.origin[0] / self.scale)
+        y0 = max(0.0, -self.origin[1] / self.scale)
+        x1 = min(float(img_width), (canvas_width - self.origin[0]) / self.scale)
+        y1 = min(float(img_height), (canvas_height - self.origin[1]) / self.scale)
+        return x0, y0, x1, y1
+
+    def visible_normalized_box(self):
+        """Part of the image visible on the canvas in normalized [0, 1] coordinates"""
+        img_width, img_height = self.image_size
+        x0, y0, x1, y1 = self.visible_image_box()
+        return x0 / img_width, y0 / img_height, x1 / img_width, y1 / img_height
+
+    def _fit_scale(self):
+        new_width, _ = fit_size(self.image_size, self.canvas_size)
+        return new_width / self.image_size[0]
+
+    def _fit(self):
+        new_width, new_height = fit_size(self.image_size, self.canvas_size)
+        self.scale = new_width / self.image_size[0]
+        self.origin = ((self.canvas_size[0] - new_width) // 2, (self.canvas_size[1] - new_height) // 2)
+
+    def _clamp(self):
+        # Center an axis that is smaller than the canvas, otherwise don't let the image leave the canvas edge
+        origin = list(self.origin)
+        for axis in (0, 1):
+            shown = self.image_size[axis] * self.scale
+            canvas = self.canvas_size[axis]
+            if shown <= canvas:
+                origin[axis] = (canvas - shown) / 2
+            else:
+                origin[axis] = min(0.0, max(origin[axis], canvas - shown))
+        self.origin = tuple(origin)